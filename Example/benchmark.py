@@ -0,0 +1,506 @@
+import MySearch
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+CHINESE_WORDS = ['北京', '天气', '下雪', '春节', '过年', '文档', '检索', '模型', '语料', '中文', '分词', '杭州',
+                 '雪景', '漂亮', '今年', '冬天', '大学', '学生', '图书馆', '搜索引擎', '相关性', '排序', '结果']
+
+
+def make_corpus(n_docs, doc_len=50, vocab_size=5000, seed=0):
+    '''
+    生成英文合成语料，词频近似Zipf分布，用于性能测试
+    '''
+    rnd = random.Random(seed)
+    vocab = ['w%d' % i for i in range(vocab_size)]
+    weights = [1.0 / (i + 1) for i in range(vocab_size)]
+    return [' '.join(rnd.choices(vocab, weights, k=doc_len)) for _ in range(n_docs)]
+
+
+def make_chinese_corpus(n_docs, doc_len=20, seed=0):
+    '''
+    生成中文合成语料，用于测试切词（Train()的主要耗时）
+    '''
+    rnd = random.Random(seed)
+    return ['，'.join(rnd.choice(CHINESE_WORDS) + rnd.choice(CHINESE_WORDS) for _ in range(doc_len)) + '。'
+            for _ in range(n_docs)]
+
+
+def make_queries(n_queries, vocab_size=5000, query_len=3, seed=1):
+    rnd = random.Random(seed)
+    return [' '.join('w%d' % rnd.randrange(vocab_size) for _ in range(query_len)) for _ in range(n_queries)]
+
+
+def make_chinese_queries(n_queries, query_len=2, seed=1):
+    rnd = random.Random(seed)
+    return ['，'.join(rnd.choice(CHINESE_WORDS) for _ in range(query_len)) for _ in range(n_queries)]
+
+
+def bench_query_batch(n_docs=20000, n_queries=5000, top_k=10):
+    '''
+    对比循环调用Query()与一次调用QueryBatch()的吞吐量
+    '''
+    t = MySearch.MySearch('e')
+    t.Train(make_corpus(n_docs), 'e')
+    queries = make_queries(n_queries)
+
+    t_begin = time.time()
+    for query_str in queries:
+        t.Query(query_str, top_k=top_k)
+    loop_time = time.time() - t_begin
+
+    t_begin = time.time()
+    t.QueryBatch(queries, top_k=top_k)
+    batch_time = time.time() - t_begin
+
+    print('Query() loop: %.3fs, %.0f queries/s' % (loop_time, n_queries / loop_time))
+    print('QueryBatch(): %.3fs, %.0f queries/s' % (batch_time, n_queries / batch_time))
+
+
+
+def bench_train_workers(n_docs=20000, workers_list=(1, 2, 4, 8)):
+    '''
+    比较Train(workers=N)不同进程数的耗时，N=1时为原来的单进程切词
+    '''
+    corpus = make_chinese_corpus(n_docs)
+    base_time = None
+    for workers in workers_list:
+        t = MySearch.MySearch()
+        t_begin = time.time()
+        t.Train(corpus, workers=workers)
+        train_time = time.time() - t_begin
+        if base_time == None:
+            base_time = train_time
+        print('Train(workers=%d): %.3fs, speedup %.2fx' % (workers, train_time, base_time / train_time))
+
+
+
+def bench_query_pool(n_docs=20000, n_queries=5000, workers_list=(1, 2, 4, 8), top_k=10):
+    '''
+    QueryPool的查询吞吐量随进程数的变化，各进程共享本进程加载的同一份模型
+    '''
+    t = MySearch.MySearch()
+    t.Train(make_corpus(n_docs), 'e')
+    t.SaveModel('benchmark_pool', select='Y')
+    queries = make_queries(n_queries)
+    for workers in workers_list:
+        pool = MySearch.QueryPool(['benchmark_pool'], workers=workers)
+        t_begin = time.time()
+        pool.query_many(queries, top_k=top_k, content=False)
+        pool_time = time.time() - t_begin
+        pool.close()
+        print('QueryPool(workers=%d): %.3fs, %.0f queries/s' % (workers, pool_time, n_queries / pool_time))
+    t.RemoveCorpus('benchmark_pool')
+
+
+
+def bench_postings(n_docs=50000, n_queries=2000, top_k=10):
+    '''
+    压缩倒排表（Postings）与未压缩csc矩阵的大小、全部解码的速度，以及两种格式下Query()的耗时
+    '''
+    t = MySearch.MySearch()
+    t.Train(make_corpus(n_docs), 'e')
+    counts = t.segments[0].counts
+    postings = MySearch.Postings.encode(counts)
+    raw_bytes = counts.data.nbytes + counts.indices.nbytes + counts.indptr.nbytes
+    print('csc: %.1fMB, postings: %.1fMB (%.1f%%)' % (raw_bytes / 2 ** 20, postings.nbytes / 2 ** 20,
+                                                      100.0 * postings.nbytes / raw_bytes))
+
+    t_begin = time.time()
+    postings.decode_all()
+    decode_time = time.time() - t_begin
+    print('decode_all(): %.3fs, %.1fM postings/s' % (decode_time, counts.nnz / decode_time / 1e6))
+
+    queries = make_queries(n_queries)
+    t_begin = time.time()
+    for query_str in queries:
+        t.QueryTokens(query_str.split(' '), top_k)
+    csc_time = time.time() - t_begin
+    t.SaveModel('benchmark_postings', select='Y')
+    loaded = MySearch.MySearch()
+    loaded.use_model('benchmark_postings')
+    t_begin = time.time()
+    for query_str in queries:
+        loaded.QueryTokens(query_str.split(' '), top_k)
+    postings_time = time.time() - t_begin
+    print('query csc: %.3fms, postings: %.3fms' % (1000 * csc_time / n_queries, 1000 * postings_time / n_queries))
+    t.RemoveCorpus('benchmark_postings')
+
+
+
+def bench_scorers(n_docs=20000, n_queries=2000, top_k=10, scorers=('tfidf', 'bm25', 'bm25+')):
+    '''
+    同一个保存好的模型切换不同打分函数（self.scorer）时Query()的耗时，统计量都已随模型保存
+    '''
+    t = MySearch.MySearch()
+    t.Train(make_corpus(n_docs), 'e')
+    t.SaveModel('benchmark_scorers', select='Y')
+    loaded = MySearch.MySearch()
+    loaded.use_model('benchmark_scorers')
+    queries = make_queries(n_queries)
+    for scorer in scorers:
+        loaded.scorer = scorer
+        t_begin = time.time()
+        for query_str in queries:
+            loaded.QueryTokens(query_str.split(' '), top_k)
+        scorer_time = time.time() - t_begin
+        print('%s: %.3fms per query' % (loaded.scorer, 1000 * scorer_time / n_queries))
+    t.RemoveCorpus('benchmark_scorers')
+
+
+
+def bench_pruning(n_docs=100000, n_queries=500, top_k=10, scorers=('tfidf', 'bm25')):
+    '''
+    MaxScore剪枝（self.pruning）对多词查询的影响：每个查询含两个高频词和一个低频词，比较剪枝前后Query()的耗时
+    '''
+    t = MySearch.MySearch()
+    t.Train(make_corpus(n_docs), 'e')
+    t.SaveModel('benchmark_pruning', select='Y')
+    loaded = MySearch.MySearch()
+    loaded.use_model('benchmark_pruning')
+    rnd = random.Random(2)
+    queries = [['w%d' % rnd.randrange(10), 'w%d' % rnd.randrange(10, 100), 'w%d' % rnd.randrange(100, 5000)]
+               for _ in range(n_queries)]
+    for scorer in scorers:
+        loaded.scorer = scorer
+        for pruning in (False, True):
+            loaded.pruning = pruning
+            loaded.result_cache.clear()
+            t_begin = time.time()
+            for query_list in queries:
+                loaded.QueryTokens(query_list, top_k)
+            query_time = time.time() - t_begin
+            print('%s pruning=%s: %.3fms per query' % (loaded.scorer, pruning, 1000 * query_time / n_queries))
+    t.RemoveCorpus('benchmark_pruning')
+
+
+def bench_phrases(n_docs=50000, n_queries=500, top_k=10):
+    '''
+    位置索引（Train(positions=True)）的训练耗时和大小，以及短语查询与同样的词不带引号查询的耗时
+    '''
+    corpus = make_corpus(n_docs)
+    for positions in (False, True):
+        t = MySearch.MySearch()
+        t_begin = time.time()
+        t.Train(corpus, 'e', positions=positions)
+        print('Train(positions=%s): %.3fs' % (positions, time.time() - t_begin))
+    t.SaveModel('benchmark_phrases', select='Y')
+    loaded = MySearch.MySearch('e')
+    loaded.use_model('benchmark_phrases')
+    segment = loaded.segments[0]
+    print('postings: %.1fMB, positions: %.1fMB' % (segment.postings.nbytes / 2 ** 20,
+                                                    segment.positions.nbytes / 2 ** 20))
+    rnd = random.Random(3)
+    phrases = [' '.join('w%d' % rnd.randrange(20) for _ in range(2)) for _ in range(n_queries)]
+    for name, queries in (('terms', phrases), ('phrase', ['"%s"' % query_str for query_str in phrases]),
+                          ('phrase~3', ['"%s"~3' % query_str for query_str in phrases])):
+        loaded.result_cache.clear()
+        t_begin = time.time()
+        for query_str in queries:
+            loaded.Query(query_str, top_k=top_k, content=False)
+        query_time = time.time() - t_begin
+        print('%s: %.3fms per query' % (name, 1000 * query_time / n_queries))
+    t.RemoveCorpus('benchmark_phrases')
+
+
+def bench_boolean(n_docs=100000, n_queries=500, top_k=10):
+    '''
+    布尔查询：一个高频词AND一个低频词，与同样两个词的普通查询（为全部包含任一词的文档打分）比较耗时和结果数
+    '''
+    t = MySearch.MySearch()
+    t.Train(make_corpus(n_docs), 'e')
+    t.SaveModel('benchmark_boolean', select='Y')
+    loaded = MySearch.MySearch('e')
+    loaded.use_model('benchmark_boolean')
+    rnd = random.Random(4)
+    pairs = [('w%d' % rnd.randrange(10), 'w%d' % rnd.randrange(1000, 5000)) for _ in range(n_queries)]
+    for name, queries in (('w1 w2', ['%s %s' % pair for pair in pairs]),
+                          ('w1 AND w2', ['%s AND %s' % pair for pair in pairs]),
+                          ('w1 NOT w2', ['%s NOT %s' % pair for pair in pairs])):
+        for limit in (None, top_k):
+            loaded.result_cache.clear()
+            n_results = 0
+            t_begin = time.time()
+            for query_str in queries:
+                query_list, query_tree = loaded.ParseQuery(query_str, boolean=True)
+                n_results += len(loaded.QueryTokens(query_list, limit, query_tree)[0])
+            query_time = time.time() - t_begin
+            print('%s top_k=%s: %.3fms per query, %.0f results' % (name, limit, 1000 * query_time / n_queries,
+                                                                  n_results / n_queries))
+    t.RemoveCorpus('benchmark_boolean')
+
+
+def bench_segment_cache(n_docs=20000, cache_path='benchmark_segcache'):
+    '''
+    切词缓存（self.segment_cache）：第一次Train()切词并写入缓存，之后（包括修改停用词后）直接读取缓存
+    '''
+    corpus = make_chinese_corpus(n_docs)
+    t = MySearch.MySearch()
+    t_begin = time.time()
+    t.Train(corpus)
+    print('Train() without cache: %.3fs' % (time.time() - t_begin))
+    for name in ('cold', 'warm', 'warm+stopwords'):
+        t = MySearch.MySearch()
+        t.segment_cache = cache_path
+        if name == 'warm+stopwords':
+            t.add_stopwords(['北京'])
+        t_begin = time.time()
+        t.Train(corpus)
+        hits, misses, size = t.segment_cache.info()
+        print('Train() %s cache: %.3fs, %d hits, %d misses' % (name, time.time() - t_begin, hits, misses))
+        t.segment_cache.close()
+    shutil.rmtree(cache_path)
+
+
+def bench_doc_store(n_docs=50000, n_reads=20000):
+    '''
+    保存的语料库（DocStore）：SaveModel()的耗时、文档库的大小和随机读取一篇文档（GetDocument()）的耗时，比较是否压缩
+    '''
+    corpus = make_corpus(n_docs)
+    rnd = random.Random(5)
+    indexes = [rnd.randrange(n_docs) for _ in range(n_reads)]
+    for compress in (False, True):
+        t = MySearch.MySearch('e')
+        t.Train(corpus, 'e')
+        t.compress_documents = compress
+        t_begin = time.time()
+        t.SaveModel('benchmark_docs', select='Y')
+        save_time = time.time() - t_begin
+        loaded = MySearch.MySearch('e')
+        loaded.use_model('benchmark_docs')
+        t_begin = time.time()
+        for index in indexes:
+            loaded.GetDocument(index)
+        read_time = time.time() - t_begin
+        print('compress_documents=%s: SaveModel() %.3fs, corpus %.1fMB, GetDocument() %.1fus' %
+              (compress, save_time, dir_size('benchmark_docs_corpus') / 2 ** 20, 1e6 * read_time / n_reads))
+        t.RemoveCorpus('benchmark_docs')
+
+
+def bench_dedup(n_docs=50000, doc_len=200, dup_ratio=0.1, n_queries=500, top_k=10):
+    '''
+    近似重复检测：合成语料中dup_ratio的文档为随机一篇文档改动一个词的副本，比较Train()是否去重的耗时、找出的副本数，
+    以及Query(collapse=True)的延迟
+    '''
+    corpus = make_corpus(n_docs, doc_len)
+    rnd = random.Random(6)
+    for index in rnd.sample(range(n_docs), int(n_docs * dup_ratio)):
+        words = corpus[rnd.randrange(n_docs)].split(' ')
+        words[rnd.randrange(len(words))] = 'w%d' % rnd.randrange(5000)
+        corpus[index] = ' '.join(words)
+    queries = make_queries(n_queries)
+    for dedup in (False, True):
+        t = MySearch.MySearch('e')
+        t.dedup = dedup
+        t_begin = time.time()
+        t.Train(corpus, 'e')
+        print('dedup=%s: Train() %.3fs, dropped %d of %d near-duplicates' %
+              (dedup, time.time() - t_begin, len(t.duplicates), int(n_docs * dup_ratio)))
+    for collapse in (False, True):
+        t_begin = time.time()
+        for query_str in queries:
+            t.result_cache.clear()
+            t.Query(query_str, top_k=top_k, content=False, collapse=collapse)
+        print('collapse=%s: %.3fms per query' % (collapse, 1000 * (time.time() - t_begin) / n_queries))
+
+
+COLD_START = '''
+import sys, time
+t_begin = time.perf_counter()
+import MySearch
+t = MySearch.MySearch(sys.argv[1] if sys.argv[1] != 'None' else None)
+t.use_model(sys.argv[2])
+t.Query(sys.argv[3], content=False)
+print(time.perf_counter() - t_begin, ' '.join(m for m in ('sklearn', 'jieba', 'pkuseg') if m in sys.modules))
+'''
+
+
+def bench_cold_start(n_docs=2000, repeat=5):
+    '''
+    冷启动：新进程中import MySearch、use_model()并Query()一次的耗时（不含解释器本身的启动），以及进程中导入了哪些重型模块
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(MySearch.__file__)),
+                                                      env.get('PYTHONPATH')]))
+    for seg, corpus, query_str in (('e', make_corpus(n_docs), 'w5 w11'),
+                                   (None, make_chinese_corpus(n_docs), make_chinese_queries(1)[0])):
+        t = MySearch.MySearch(seg)
+        t.Train(corpus, seg)
+        t.SaveModel('benchmark_cold', select='Y')
+        times = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, '-c', COLD_START, str(seg), 'benchmark_cold', query_str], env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+                                 check=True).stdout.split()
+            times.append(float(out[0]))
+        print('seg=%s: cold start median %.3fs, min %.3fs, imported %s' %
+              (seg, float(np.median(times)), min(times), ', '.join(out[1:]) or 'none of sklearn/jieba/pkuseg'))
+        t.RemoveCorpus('benchmark_cold')
+
+
+SUITE_METRICS = ('segment_s', 'train_s', 'save_s', 'load_s', 'index_mb', 'peak_rss_mb',
+                 'query_p50_ms', 'query_p95_ms', 'query_p99_ms')
+
+
+def peak_rss_mb():
+    '''
+    本进程的内存峰值（MB），没有resource模块（Windows）时为None
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def environment():
+    return {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'numpy': np.__version__,
+            'model_version': MySearch.MODEL_VERSION}
+
+
+def bench_case(language, n_docs, n_queries=1000, top_k=10):
+    '''
+    在当前进程中测一组合成语料：切词吞吐量、Train()、SaveModel()、保存的模型大小、use_model()、内存峰值和Query()的延迟分位数
+    :param language: str 'zh'（jieba切词）或'en'（按空格切分）
+    :return: dict 时间单位为秒（延迟为毫秒），大小为MB
+    '''
+    if language == 'zh':
+        corpus, queries, seg = make_chinese_corpus(n_docs), make_chinese_queries(n_queries), None
+    elif language == 'en':
+        corpus, queries, seg = make_corpus(n_docs), make_queries(n_queries), 'e'
+    else:
+        raise ValueError('unknown language, %s' % language)
+    corpus_name = 'benchmark_suite_%s_%d' % (language, n_docs)
+    case = {'language': language, 'n_docs': n_docs, 'n_queries': n_queries, 'top_k': top_k,
+            'corpus_mb': sum(len(text.encode('utf-8')) for text in corpus) / 2 ** 20, 'base_rss_mb': peak_rss_mb()}
+
+    tokenizer = MySearch.MySearch(seg).tokenizer
+    tokenizer.tokenize(corpus[0])
+    t_begin = time.perf_counter()
+    n_tokens = sum(len(tokenizer.tokenize(text)) for text in corpus)
+    case['segment_s'] = time.perf_counter() - t_begin
+    case['segment_docs_per_s'] = n_docs / case['segment_s']
+    case['segment_tokens_per_s'] = n_tokens / case['segment_s']
+
+    t = MySearch.MySearch(seg)
+    t_begin = time.perf_counter()
+    t.Train(corpus, seg)
+    case['train_s'] = time.perf_counter() - t_begin
+    case['vocabulary'] = len(t.word_dict)
+    t_begin = time.perf_counter()
+    t.SaveModel(corpus_name, select='Y')
+    case['save_s'] = time.perf_counter() - t_begin
+    case['index_mb'] = dir_size(corpus_name + '_model') / 2 ** 20
+    del t
+
+    loaded = MySearch.MySearch(seg)
+    t_begin = time.perf_counter()
+    loaded.use_model(corpus_name)
+    case['load_s'] = time.perf_counter() - t_begin
+    latencies = []
+    for query_str in queries:
+        loaded.result_cache.clear()
+        t_begin = time.perf_counter()
+        loaded.Query(query_str, top_k=top_k, content=False)
+        latencies.append(time.perf_counter() - t_begin)
+    latencies = 1000 * np.array(latencies)
+    for q in (50, 95, 99):
+        case['query_p%d_ms' % q] = float(np.percentile(latencies, q))
+    case['query_mean_ms'] = float(latencies.mean())
+    case['peak_rss_mb'] = peak_rss_mb()
+    loaded.RemoveCorpus(corpus_name)
+    return case
+
+
+def compare(baseline, report, threshold=0.2):
+    '''
+    与之前的结果比较，SUITE_METRICS中的指标（都是越小越好）比baseline增加超过threshold（比例）的视为退化
+    :return: list[dict] 退化的指标
+    '''
+    old_cases = {(case['language'], case['n_docs']): case for case in baseline['results']}
+    regressions = []
+    for case in report['results']:
+        old = old_cases.get((case['language'], case['n_docs']))
+        if old == None:
+            continue
+        for metric in SUITE_METRICS:
+            if old.get(metric) and case.get(metric) != None and case[metric] > old[metric] * (1 + threshold):
+                regressions.append({'language': case['language'], 'n_docs': case['n_docs'], 'metric': metric,
+                                    'baseline': old[metric], 'current': case[metric]})
+    return regressions
+
+
+def run_suite(sizes=(1000, 10000), languages=('zh', 'en'), n_queries=1000, top_k=10, output=None, baseline=None,
+              threshold=0.2):
+    '''
+    基准测试套件：每组（语言, 文档数）在一个新的进程中运行bench_case()，内存峰值和jieba的加载互不影响
+    :param output: str 结果写入该json文件
+    :param baseline: str 之前保存的json文件，给出时列出退化超过threshold的指标，见compare()
+    :return: dict {'environment', 'results', 'regressions'}
+    '''
+    results = []
+    for language in languages:
+        for n_docs in sizes:
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                case = executor.submit(bench_case, language, n_docs, n_queries, top_k).result()
+            print('%s n_docs=%d: segment %.3fs (%.0f docs/s), Train %.3fs, SaveModel %.3fs, index %.1fMB, '
+                  'use_model %.3fs, query p50/p95/p99 %.3f/%.3f/%.3fms, peak RSS %sMB'
+                  % (language, n_docs, case['segment_s'], case['segment_docs_per_s'], case['train_s'], case['save_s'],
+                     case['index_mb'], case['load_s'], case['query_p50_ms'], case['query_p95_ms'],
+                     case['query_p99_ms'], case['peak_rss_mb'] and '%.0f' % case['peak_rss_mb']))
+            results.append(case)
+    report = {'environment': environment(), 'results': results, 'regressions': []}
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            report['regressions'] = compare(json.load(f), report, threshold)
+        for item in report['regressions']:
+            print('regression %s n_docs=%d %s: %.4g -> %.4g' % (item['language'], item['n_docs'], item['metric'],
+                                                                 item['baseline'], item['current']))
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MySearch benchmarks, without --suite runs every bench_*()')
+    parser.add_argument('--suite', action='store_true', help='run the benchmark suite, see run_suite()')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--languages', nargs='+', default=['zh', 'en'], choices=['zh', 'en'])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--baseline', help='json file of an earlier run, exit with 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.suite:
+        report = run_suite(args.sizes, args.languages, args.queries, args.top_k, args.output, args.baseline,
+                           args.threshold)
+        sys.exit(1 if report['regressions'] else 0)
+    bench_query_batch()
+    bench_train_workers()
+    bench_query_pool()
+    bench_postings()
+    bench_scorers()
+    bench_pruning()
+    bench_phrases()
+    bench_boolean()
+    bench_segment_cache()
+    bench_doc_store()
+    bench_cold_start()
+    bench_dedup()
@@ -0,0 +1,22 @@
+import MySearch
+
+def serve():
+    '''
+     QueryServer加载保存好的语料库后提供HTTP/JSON查询服务，例如：
+     http://127.0.0.1:8000/query?q=北京下雪&top_k=5&snippet=30
+     workers>0时在多个进程中切词和打分，timeout为每个查询的超时时间，max_pending为排队上限
+    '''
+    Corpus = ['这是第一个文档：新年快乐。',
+              '那是第一个：春节过年好',
+              '这不是第二个文档吧：又一年过去，又长了一岁',
+              '这是最后的文档：我爱北京天安门']
+
+    t = MySearch.MySearch()
+    t.Train(Corpus)
+    t.SaveModel('服务语料库', select='Y')
+
+    server = MySearch.QueryServer(['服务语料库'], port=8000, workers=2, timeout=5.0, max_pending=256)
+    server.run()
+
+if __name__ == '__main__':
+    serve()
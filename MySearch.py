@@ -1,315 +1,2421 @@
-from sklearn.feature_extraction.text import TfidfTransformer
-from sklearn.feature_extraction.text import CountVectorizer
 from scipy.sparse import csc_matrix
-import jieba.posseg as pseg
-import jieba
-import pkuseg
-import codecs
-from collections import Iterable
+from scipy.sparse import csr_matrix
+from scipy.sparse import diags
+from scipy.sparse import vstack
+from scipy.sparse import hstack
+import numpy as np
+from collections.abc import Iterable
 import os
+import math
 import time
-import copy
 import shutil
+import json
+import re
+import ast
+import sys
+import threading
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import asyncio
+import multiprocessing
+import gc
+import zlib
+import hashlib
+import mmap
+import sqlite3
+from array import array
+
+MODEL_FORMAT = 'MySearch-model'
+MODEL_VERSION = 1
+SHARDS_FORMAT = 'MySearch-shards'
+DOCS_FORMAT = 'MySearch-docs'
+BOOLEAN_PATTERN = re.compile(r'["()]|\b(?:AND|OR|NOT)\b')
+TOKEN_PATTERN = re.compile(r'(?u)\b\w\w+\b')
+QUERY_TOKEN_PATTERN = re.compile(r'"([^"]*)"(?:~(\d+))?|([()])|([^\s()"]+)')
+PHRASE_PATTERN = re.compile(r'"([^"]*)"(?:~(\d+))?')
+
+_query_worker = None
+_model_locks = {}
+_model_locks_lock = threading.Lock()
+_trace_local = threading.local()
 
 def pr_runtime(func):
     '''
-    装饰器：增加运行时间打印
+    装饰器：增加运行时间打印，返回原函数的返回值
     '''
     def runtime(*argv, **kw):
         t_begin = time.time()
-        func(*argv, **kw)
+        res = func(*argv, **kw)
         print('*******************')
         print(str(time.time() - t_begin) + 's')
+        return res
     return runtime
 
-class MySearch(object):
+def _read_text(path):
     '''
-    该class可以为中/英文语料库（文件夹/Iterable对象）建立基于tf-idf的检索模型，若涉及文件操作（除stop_words.txt，userdict.txt）
-    外，只支持编码utf-8，其中中文分词可选jieba或者pkuseg，tf-idf依赖sklearn
-    实现以下功能：
-    1.检索模型、语料库的建立（训练） -- 保存 -- 使用 -- 添加语料（从列表/目录） -- 删除 -- 部分删除
-    2.根据搜索词汇，对Iterable元素（元素为字符串）进行相关性排序，返回序列号等
-    3.根据搜索词汇，对指定目录下的文件进行相关性排序，返回文件名序列号等
+    读取一个文本文件（编码utf-8或gbk），读不出时为None
+    '''
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            with open(path, 'r', encoding=encoding) as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+    return None
 
-    :param seg: str 缺省时默认选择jieba进行中文分词，当为'pkuseg'时使用pkuseg进行中文分词
-    :param 参数同 sklearn.feature_extraction.text.TfidfTransformer(), 主要是为了支持不同的tf-idf模式，
-        在Train()中点击相应函数查看介绍。
+def _current_trace():
+    '''
+    :return: QueryTrace 当前线程正在统计的查询，没有时为None
+    '''
+    return getattr(_trace_local, 'trace', None)
 
-    Example：见test(),test2(),go()
+def _model_lock(model_path):
+    '''
+    同一进程内对同一个模型的修改（添加、删除、合并段）需要互斥进行
+    '''
+    with _model_locks_lock:
+        return _model_locks.setdefault(os.path.abspath(model_path), threading.RLock())
 
-    函数简介：
+def _load_array(path):
+    '''
+    以np.memmap方式打开.npy文件，返回普通ndarray视图（不复制数据），避免对np.memmap切片的额外开销
+    '''
+    return np.load(path, mmap_mode='r').view(np.ndarray)
 
-    关于停用词和用户词汇：
-        默认停用词存放在stop_words.txt，可自行修改，也可以在使用 add_stopwords() 函数添加
-        默认用户词存放在userdict.txt，可自行修改，也可以在使用 add_userword() 函数添加
-        add_stopwords()或add_userword() 使用后，将在下一次self.Train()使用时生效
 
-        add_stopwords(self, my_stopword_list) 添加停用词
-            my_stopword_list: list[str,str,...,str] 待添加的停用词
-            :return: 成功返回True，失败返回False
+def _varint_encode(values):
+    '''
+    把非负整数数组编码为变长字节（varint，每字节7位，最高位为1表示后面还有字节）
+    :return: (np.ndarray(uint8), np.ndarray(int64)) 编码后的字节和每个数占用的字节数
+    '''
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += values >= (np.uint64(1) << np.uint64(shift))
+    starts = np.zeros(len(values), dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    data = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max()) if len(sizes) else 0):
+        mask = sizes > k
+        byte = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        byte |= np.where(sizes[mask] > k + 1, 0x80, 0).astype(np.uint64)
+        data[starts[mask] + k] = byte
+    return data, sizes
 
-        add_userword(self, my_word_list) 添加词汇，用来优化中文分词，使jieba、pkuseg语料库中没有的词能正确切分。
-            当self.Train()使用e='e'时，不使用jieba、pkuseg，用户词汇无效。
-            my_word_list: list[str,str,...,str] 待添加的分词
-            :return:成功返回True，失败返回False
 
-    Train(self, argc, e=None) 训练函数，用于建立检索模型
-        argc支持str类型和其它Iterable（list, tuple等，其element应为str类型，表示文本）型变量：
-            argc为str类型时，argc代表语料文件夹目录，Train()将使用该目录下的文档建立检索模型。
-            argc为Iterable类型时，argc即待训练语料库，argc中的element应为str类型，表示语料文本，
-        Train()将使用argc中的element作为语料文本建立检索模型。
-        e默认为None，启用jieba、pkuseg库，当待使用文本为纯英文或其它 *由空格隔开* 无需分词的语料时，可
-        以令e='e',将不使用jieba、pkuseg库，可一定程度提高效率，但用户词汇无效。
+def _varint_decode(data):
+    '''
+    _varint_encode()的逆运算，全部用numpy向量化完成
+    '''
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    shifts = np.arange(len(data), dtype=np.int64) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7f).astype(np.uint64) << (7 * shifts).astype(np.uint64)
+    return np.add.reduceat(parts, starts).astype(np.int64)
 
-    Query(self, query_str, corpus_name=None) 查询函数
-        query_str为查询字符串，corpus_name为查询语料库名称，corpus_name为None时优先查询self.Train(),
-        其次查询默认语料库，若corpus_name不为空，则查询corpus_name指向的语料库，若没有该语料库将出错。
-        :return: list[dict,dict,...,dict]
-            其中dict{'index', 'score', 'content'} or dict{'index', 'score', 'filename', 'content'}
-        注：以'_corpus'结尾的文件夹将被作为保存好的语料库，文件夹名即为语料库名，查询保存好的
-    语料库时，corpus_name结尾可以带'_corpus'也可以不带。另，'_model'结尾的文件被作为保存好的模型。
 
-    SaveModel(self, corpus_name=None, filename=None) 保存模型
-        self.Train()之后才能self.SaveModel(),否则将出错
-        corpus_name:str 保存成名为corpus_name的语料库，缺省时将根据时间生成一个语料库名称
-        filename: list[str,str,...,str] 用于给语料文档document命名，缺省时使用原名称，没有原名称时用index
-        :return:成功将返回True，失败会报错
+def _delta_decode(deltas, lengths):
+    '''
+    差值还原：deltas依次为长度lengths（均大于0）的若干组，每组的第一个值为原值
+    '''
+    total = np.cumsum(deltas)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    return total - np.repeat(total[starts] - deltas[starts], lengths)
 
-    AddCorpus(self, corpus_name, corpus_name2=None, filename=None) 向指定语料库添加语料文档，并更新检索模型
-        向corpus_name指定的语料库中添加语料文档，语料文档来自corpus_name2指定的语料库，当corpus_name2为None时，
-        默认为self.Train()生成的检索模型和其语料库。filename参数可用于给新添加的文档命名，格式错误时视为没有该参数,
-        默认为保存原名称或者按其在原语料库中的Index序号命名。另，名称与新语料库中的名称相同时，将增加‘-副本’后缀
-        corpus_name1: name of Corpus1    str
-        corpus_name2: name of Corpus2    str
-        filename: filename of Corpus2's file     list [str,str...，str]
-        :return: 成功返回True，失败将报错
 
-    GetDefaultCorpusName(self)
-        获取当前默认的搜索库名称
+def _gather_blocks(data, ptr, blocks):
+    '''
+    依次取出blocks这些块在data中的部分，ptr为每块的起始位置（最后一块之后为结束位置）
+    '''
+    sizes = np.asarray(ptr[blocks + 1] - ptr[blocks], dtype=np.int64)
+    offsets = np.repeat(np.asarray(ptr[blocks], dtype=np.int64) - np.concatenate([[0], np.cumsum(sizes)[:-1]]), sizes)
+    return data[np.arange(int(sizes.sum())) + offsets]
 
-    AdjustDefaultCorpus(self, default_corpus=None)
-        调整默认搜索库，参数为新库名称，缺省则使用当前训练的语料库名称，有默认搜索库时，将调整为新搜索库，没有默认搜索库时将设置
-        default_corpus: str,
-                    name of the new default corpus
-        :return: 成功返回True，失败返回False
 
-    RemoveCorpus(self, corpus_name=None) 删除保存好的语料库
-        删除保存好的语料库，参数为None时删除self.corpus_name指定的语料库，语料库不存在将报错
-        corpus_name:想要删除的语料库名称
-        :return:成功返回True,失败将报错
+def _block_starts(indptr, block_size):
+    '''
+    倒排表分块：每个词的倒排表每block_size个posting为一块
+    :return: (block_ptr, starts) 每个词的块在全部块中的起止位置，每块第一个posting的位置
+    '''
+    lengths = np.diff(indptr)
+    block_ptr = np.concatenate([[0], np.cumsum((lengths + block_size - 1) // block_size)]).astype(np.int64)
+    columns = np.repeat(np.arange(len(lengths)), np.diff(block_ptr))
+    starts = indptr[:-1][columns] + (np.arange(block_ptr[-1]) - block_ptr[:-1][columns]) * block_size
+    return block_ptr, starts
 
-    DelDocument(self, documents, corpus_name=None) 删除保存好的语料库的部分语料文档document
-        删除保存好的语料库的部分语料文档document
-        documents: list[str,str,...,str] 待删除的语料文档document的文件名
-        corpus_name: str  语料库名
-        :return: 成功将返回True,失败会报错
+
+def _simhash(counts, terms, idf=None, chunk=2 ** 16):
     '''
-    def __init__(self, seg=None, norm='l2', use_idf=True, smooth_idf=True,
-                 sublinear_tf=False):
+    每个文档的64位SimHash：每个词取blake2b的64位哈希，某一位为1时加上该词的权重（词频x idf），为0时减去，
+    按文档求和后大于0的位为1。常见词的权重小，不会使所有签名趋同。计算后随段保存，之后idf改变也不再重新计算
+    :param counts: scipy.sparse矩阵 文档-词的词频
+    :param terms: list[str] 按矩阵列序的词表
+    :param idf: np.ndarray 每个词（矩阵列序）的idf，缺省时按counts本身的文档频率计算
+    :return: np.ndarray(uint64)
+    '''
+    hashes = np.frombuffer(b''.join(hashlib.blake2b(term.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+                                    for term in terms), dtype=np.uint8).reshape(-1, 8)
+    signs = np.unpackbits(hashes, axis=1, bitorder='little').astype(np.int8) * 2 - 1
+    counts = counts.tocsr()
+    if idf is None:
+        df = np.bincount(np.asarray(counts.indices), minlength=counts.shape[1])
+        idf = np.log((counts.shape[0] + 1) / (df + 1)) + 1
+    weights = counts.dot(diags(np.asarray(idf, dtype=np.float64))).tocsr()
+    res = np.empty(counts.shape[0], dtype=np.uint64)
+    for begin in range(0, counts.shape[0], chunk):
+        sums = np.asarray(weights[begin:begin + chunk].dot(signs))
+        res[begin:begin + chunk] = np.packbits(sums > 0, axis=1, bitorder='little').view('<u8').ravel()
+    return res
+
+
+def _popcount(values):
+    '''
+    :return: np.ndarray 每个uint64中1的位数
+    '''
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1, dtype=np.int64)
+
+
+class Postings(object):
+    '''
+    压缩的倒排表：每个词的文档序号按差值（delta）编码，词频为varint，tf-idf权重（旧版本模型）为float32。
+    以np.memmap方式打开后，查询时只解码查询词对应的几列。每个词的倒排表每block_size个posting为一块，
+    记录每块最后一个文档序号和在docs、tf中的字节位置，lookup()只解码包含指定文档的块（MaxScore剪枝时使用）。
+
+    :param shape: (int, int) 文档数, 词数
+    :param indptr: np.ndarray 每个词的倒排表在全部posting中的起止位置，同csc矩阵
+    :param docs: np.ndarray(uint8) 文档序号的差值，varint
+    :param docs_ptr: np.ndarray 每个词在docs中的字节起止位置
+    :param tf: np.ndarray(uint8) 词频，varint，weights不为None时为None
+    :param tf_ptr: np.ndarray 每个词在tf中的字节起止位置
+    :param weights: np.ndarray(float32) tf-idf权重
+    :param blocks: (block_last, block_docs, block_tf) 块索引：每块最后一个文档序号、每块在docs（和tf）中的字节起始位置
+        （长度为块数+1），缺省时第一次lookup()时计算
+    '''
+    block_size = 128
+
+    def __init__(self, shape, indptr, docs, docs_ptr, tf=None, tf_ptr=None, weights=None, blocks=None):
+        self.shape = shape
+        self.indptr = indptr
+        self.docs = docs
+        self.docs_ptr = docs_ptr
+        self.tf = tf
+        self.tf_ptr = tf_ptr
+        self.weights = weights
+        self.blocks = blocks
+        self.__block_ptr = None
+
+    @staticmethod
+    def encode(counts, weights=False):
         '''
-        :param seg: str 缺省时默认选择jieba进行中文分词，当为'pkuseg'时使用pkuseg进行中文分词
-        :param norm,use_idf,use_idf,smooth_idf,sublinear_tf,这几个参数详见sklearn.feature_extraction.text.TfidfTransformer()
-        的说明，在Train()中点击相应函数查看介绍。
+        :param counts: scipy.sparse.csc_matrix 原始词频（weights为True时为tf-idf权重）
         '''
-        self.seg = seg
-        self.myseg = None
-        self.stop_flag = ['x', 'c', 'u', 'd', 'p', 't', 'uj', 'm', 'f', 'r']
-        self.stop_word_path = "stop_words.txt"
-        self.stopwords = self.__get_stopwords(self.stop_word_path)
-        self.user_word_path = "userdict.txt"
-        self.my_word_list = self.__get_userdict(self.user_word_path)
-        self.corpus = []
-        self.corpus_name = ''
-        self.files = []
-        self.tfidf = None
-        self.word_dict = {}
-        self.norm = norm
-        self.use_idf = use_idf
-        self.smooth_idf = smooth_idf
-        self.sublinear_tf = sublinear_tf
+        counts = counts.tocsc()
+        counts.sort_indices()
+        indptr = np.asarray(counts.indptr, dtype=np.int64)
+        indices = np.asarray(counts.indices, dtype=np.int64)
+        deltas = indices.copy()
+        deltas[1:] -= indices[:-1]
+        starts = indptr[:-1][np.diff(indptr) > 0]
+        deltas[starts] = indices[starts]
+        docs, sizes = _varint_encode(deltas)
+        positions = np.concatenate([[0], np.cumsum(sizes)])
+        block_ptr, starts = _block_starts(indptr, Postings.block_size)
+        ends = np.minimum(starts + Postings.block_size, np.repeat(indptr[1:], np.diff(block_ptr)))
+        block_last = indices[ends - 1]
+        block_docs = np.concatenate([positions[starts], [len(docs)]])
+        if weights:
+            return Postings(counts.shape, indptr, docs, positions[indptr],
+                            weights=np.asarray(counts.data, dtype=np.float32), blocks=(block_last, block_docs, None))
+        tf, sizes = _varint_encode(np.asarray(counts.data))
+        positions_tf = np.concatenate([[0], np.cumsum(sizes)])
+        return Postings(counts.shape, indptr, docs, positions[indptr], tf, positions_tf[indptr],
+                        blocks=(block_last, block_docs, np.concatenate([positions_tf[starts], [len(tf)]])))
 
+    def save(self, path):
+        np.save(path + '/postings_indptr.npy', self.indptr)
+        np.save(path + '/postings_docs.npy', self.docs)
+        np.save(path + '/postings_docs_ptr.npy', self.docs_ptr)
+        if self.blocks is not None:
+            np.save(path + '/postings_block_last.npy', self.blocks[0])
+            np.save(path + '/postings_block_docs.npy', self.blocks[1])
+            if self.blocks[2] is not None:
+                np.save(path + '/postings_block_tf.npy', self.blocks[2])
+        if self.weights is None:
+            np.save(path + '/postings_tf.npy', self.tf)
+            np.save(path + '/postings_tf_ptr.npy', self.tf_ptr)
+        else:
+            np.save(path + '/postings_weights.npy', self.weights)
 
-    def __get_stopwords(self, stop_words):
-        stopwords = codecs.open(stop_words, 'r').readlines()
-        stopwords = [w.strip() for w in stopwords]
-        return ['', ' '] + stopwords
+    @staticmethod
+    def load(path, documents):
+        indptr = _load_array(path + '/postings_indptr.npy')
+        docs = _load_array(path + '/postings_docs.npy')
+        docs_ptr = _load_array(path + '/postings_docs_ptr.npy')
+        blocks = (_load_array(path + '/postings_block_last.npy'), _load_array(path + '/postings_block_docs.npy'), None)
+        if os.path.exists(path + '/postings_weights.npy'):
+            return Postings((documents, len(indptr) - 1), indptr, docs, docs_ptr,
+                            weights=_load_array(path + '/postings_weights.npy'), blocks=blocks)
+        blocks = blocks[:2] + (_load_array(path + '/postings_block_tf.npy'),)
+        return Postings((documents, len(indptr) - 1), indptr, docs, docs_ptr,
+                        _load_array(path + '/postings_tf.npy'), _load_array(path + '/postings_tf_ptr.npy'), blocks=blocks)
 
-    def __get_userdict(self, user_words):
-        with open(user_words, 'r', encoding='utf-8') as f:
-            userwords = f.readlines()
-        userwords = [w.strip().split(' ')[0] for w in userwords if w.strip()]
-        return userwords
+    def __gather(self, data, ptr, columns):
+        return np.concatenate([data[ptr[column]:ptr[column + 1]] for column in columns.tolist()])
 
-    def add_stopwords(self, my_stopword_list):
+    def decode(self, columns):
         '''
-        添加停用词，add_stopwords()使用后，将在下一次self.Train()使用时生效
-        :param my_stopword_list: list[str,str,...,str] 待添加的停用词
-        :return: 成功返回True，失败返回False
+        只解码columns对应的倒排表
+        :return: (rows, values, lengths) 文档序号、词频（或权重）、每个词的posting数
         '''
-        for word in my_stopword_list:
-            if type(word) != str:
-                return False
-        self.stopwords += my_stopword_list
-        return True
+        columns = np.asarray(columns, dtype=np.int64)
+        lengths = np.asarray(self.indptr[columns + 1] - self.indptr[columns], dtype=np.int64)
+        columns = columns[lengths > 0]
+        if not len(columns):
+            return np.empty(0, dtype=np.int64), np.empty(0), lengths
+        rows = _delta_decode(_varint_decode(self.__gather(self.docs, self.docs_ptr, columns)), lengths[lengths > 0])
+        if self.weights is None:
+            values = _varint_decode(self.__gather(self.tf, self.tf_ptr, columns))
+        else:
+            values = self.__gather(self.weights, self.indptr, columns)
+        return rows, values, lengths
 
-    def add_userword(self, my_word_list):
+    def block_starts(self):
         '''
-        添加词汇，用来优化中文分词，使jieba、pkuseg语料库中没有的词能正确切分，
-        add_userword() 使用后，将在下一次self.Train()使用时生效，当self.Train()使用e='e'时，不使用jieba、pkuseg，用户词汇无效。
-        :param my_word_list: list[str,str,...,str] 待添加的分词
-        :return:成功返回True，失败返回False
+        :return: (block_ptr, starts) 每个词的块在全部块中的起止位置，每块第一个posting的位置
         '''
-        if self.seg == 'jieba':
-            for word in self.my_word_list:
-                if type(word) != str:
-                    return False
-                jieba.add_word(word)
-            self.my_word_list += my_word_list
-            return True
+        if self.__block_ptr is None:
+            self.__block_ptr = _block_starts(np.asarray(self.indptr, dtype=np.int64), self.block_size)
+        return self.__block_ptr
+
+    def find_blocks(self, column, documents):
+        '''
+        :param documents: np.ndarray 从小到大排列的文档序号
+        :return: np.ndarray 每个文档在column的倒排表中可能所在的块（全部块中的序号），在最后一块之后的为-1
+        '''
+        if self.blocks is None:
+            self.blocks = Postings.encode(self.decode_all(), self.weights is not None).blocks
+        block_ptr = self.block_starts()[0]
+        first, last = int(block_ptr[column]), int(block_ptr[column + 1])
+        blocks = np.searchsorted(self.blocks[0][first:last], documents) + first
+        blocks[blocks >= last] = -1
+        return blocks
+
+    def decode_blocks(self, column, blocks):
+        '''
+        :param blocks: np.ndarray column的倒排表中的若干块（全部块中的序号，从小到大）
+        :return: (rows, values, lengths) 这些块的文档序号、词频（或权重），以及每块的posting数
+        '''
+        if self.blocks is None:
+            self.blocks = Postings.encode(self.decode_all(), self.weights is not None).blocks
+        block_last, block_docs, block_tf = self.blocks
+        block_ptr, starts = self.block_starts()
+        if not len(blocks):
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64)
+        lengths = np.minimum(starts[blocks] + self.block_size, self.indptr[column + 1]) - starts[blocks]
+        rows = _delta_decode(_varint_decode(_gather_blocks(self.docs, block_docs, blocks)), lengths)
+        rows += np.repeat(np.where(blocks > block_ptr[column], block_last[blocks - 1], 0), lengths)
+        if self.weights is None:
+            values = _varint_decode(_gather_blocks(self.tf, block_tf, blocks))
         else:
-            self.my_word_list += my_word_list
+            values = self.weights[np.arange(int(lengths.sum())) +
+                                  np.repeat(starts[blocks] - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)]
+        return rows, values, lengths
 
-    def __Path2Corpus(self):
-        self.files = os.listdir(self.corpus_name)
-        for file in self.files:
-            try:
-                f = open(self.corpus_name + '/' + file, 'r', -1, encoding='utf-8')
-                s = f.read()
-            except:
-                f = open(self.corpus_name + '/' + file, 'r', -1, encoding='gbk')
-                s = f.read()
-            self.corpus.append(s)
-            f.close()
+    def lookup(self, column, documents):
+        '''
+        只解码column的倒排表中包含documents的块
+        :param documents: np.ndarray 从小到大排列的文档序号
+        :return: (rows, values) documents中出现该词的文档序号和词频（或权重）
+        '''
+        blocks = np.unique(self.find_blocks(column, documents))
+        rows, values, lengths = self.decode_blocks(column, blocks[blocks >= 0])
+        if not len(rows):
+            return rows, values
+        positions = np.minimum(np.searchsorted(documents, rows), len(documents) - 1)
+        found = documents[positions] == rows
+        return rows[found], values[found]
 
-    def __cut_str(self, text):
-        res = ''
-        if self.seg == 'jieba' or self.seg == None:
-            words = pseg.cut(text)
-            for word, flag in words:
-                if flag not in self.stop_flag and word not in self.stopwords:
-                    word_for_search = jieba.cut_for_search(word)
-                    for n in word_for_search:
-                        res += n + ' '
-        elif self.seg == 'pkuseg':
-            if not self.myseg:
-                self.myseg = pkuseg.pkuseg()
-            words = self.myseg.cut(text)
-            for word in words:
-                if word not in self.stopwords:
-                    res += word + ' '
-        elif self.seg == 'e':
-            words = text.split(' ')
-            for word in words:
-                if word not in self.stopwords:
-                    res += word.lower() + ' '
-        return res
+    def decode_all(self):
+        '''
+        :return: scipy.sparse.csc_matrix 解码全部倒排表
+        '''
+        indptr = np.asarray(self.indptr, dtype=np.int64)
+        lengths = np.diff(indptr)
+        rows = np.empty(0, dtype=np.int64)
+        if indptr[-1]:
+            rows = _delta_decode(_varint_decode(self.docs), lengths[lengths > 0])
+        if self.weights is None:
+            values = _varint_decode(self.tf)
+        else:
+            values = np.asarray(self.weights, dtype=np.float64)
+        return csc_matrix((values, rows, indptr), shape=self.shape)
 
-    def __cut_corpus(self):
-        if self.seg == 'jieba' or self.seg == None:
-            jieba.load_userdict(self.user_word_path)
-        elif self.seg == 'pkuseg':
-            self.myseg = pkuseg.pkuseg(user_dict=self.my_word_list)
-        corpus_cut = []
-        for s in self.corpus:
-            corpus_cut.append(self.__cut_str(s))
-        return corpus_cut
-
-    def __cut_for_e(self):
-        corpus_cut = []
-        for text in self.corpus:
-            content = ''
-            for word in text.split(' '):
-                if word not in self.stopwords:
-                    content += word.lower() + ' '
-            corpus_cut.append(content)
-        return corpus_cut
-
-    def __sort_seed(self, document):
-        return document['score']
-
-    def __show(self, document_scores):
-        if not len(document_scores):
-            print('Sorry,the words you queried are not in the corpus')
-            return []
-        res = []
-        for document in document_scores:
-            res.append({'index': document, 'score': document_scores[document]})
+    @property
+    def nbytes(self):
+        nbytes = self.indptr.nbytes + self.docs.nbytes + self.docs_ptr.nbytes
+        if self.blocks is not None:
+            nbytes += sum(array.nbytes for array in self.blocks if array is not None)
+        if self.weights is None:
+            return nbytes + self.tf.nbytes + self.tf_ptr.nbytes
+        return nbytes + self.weights.nbytes
 
-        res = sorted(res, key=self.__sort_seed, reverse=True)
-        if self.corpus_name:
-            try:
-                self.files = os.listdir(self.corpus_name)
-            except:
-                self.files = []
-        if self.corpus:
-            for document in res:
-                document['content'] = self.corpus[document['index']]
-        elif self.files:
-            for document in res:
-                try:
-                    f = open(self.corpus_name + '/' + self.files[document['index']], 'r', encoding='utf-8')
-                    document['content'] = f.read()
-                    f.close()
-                except:
-                    try:
-                        f = open(self.corpus_name + '/' + self.files[document['index']], 'r', encoding='gbk')
-                        document['content'] = f.read()
-                        f.close()
-                    except:
-                        continue
 
-        if self.files:
-            try:
-                for document in res:
-                    document['filename'] = self.files[document['index']]
-            except:
-                pass
-        return res
+class Positions(object):
+    '''
+    可选的位置索引（Train(positions=True)）：每个posting（词, 文档）中该词在文档切词结果里的位置（第几个词），
+    按倒排表的顺序依次排列，每个posting内按差值编码，第一个为原值，varint压缩。与Postings同样按block_size个posting分块，
+    记录每块在data中的字节起始位置，短语查询时只解码候选文档所在的块；不需要短语查询时不读取。
+    位置按去停用词之前的切词结果计算（见Tokenizer.positioned()），去掉的词同样占位置。
 
-    def __save_select(self, corpus_path):
-        print("%s has existed!"
-              "Choosing to continue will delete the old one!\n"
-              "Maybe you can use 'AddCorpus()' or change another corpus_name.\n"
-              "Do you want to continue?(y/n) :" % corpus_path, end='')
-        choose = input()
-        if choose == 'y' or choose == 'Y':
-            return True
-        else:
-            raise ValueError('User termination.')
+    :param data: np.ndarray(uint8) 位置的差值，varint
+    :param block_ptr: np.ndarray 每块在data中的字节起始位置，长度为块数+1
+    '''
+    def __init__(self, data, block_ptr):
+        self.data = data
+        self.block_ptr = block_ptr
 
-    def __creat_corpus(self, corpus_name=None, filename=None, select=None):
-        if not self.corpus_name:
-            if corpus_name:
-                self.corpus_name = corpus_name
-                if self.corpus_name[-7:] == '_corpus':
-                    self.corpus_name = self.corpus_name[:-7]
-            else:
-                self.corpus_name = time.strftime('%Y%m%d%H%M%S', time.localtime(time.time()))
-            corpus_path = self.corpus_name + '_corpus'
-            if os.path.exists(corpus_path):
-                if select != 'Y':
-                    self.__save_select(corpus_path)
-                shutil.rmtree(corpus_path)
-            os.mkdir(corpus_path)
-            self.files = filename
-            if not self.files or len(self.files) != len(self.corpus):
-                if self.files:
-                    print('No filename or filename is not complete')
-                self.files = []
-                for i in range(len(self.corpus)):
-                    self.files.append(str(i)+'.txt')
-            for index in range(len(self.corpus)):
-                try:
-                    f = open(corpus_path + '/' + self.files[index], 'w', encoding='utf-8')
-                    f.write(self.corpus[index])
-                    f.close()
-                except:
-                    continue
+    @staticmethod
+    def encode(counts, positions):
+        '''
+        :param counts: scipy.sparse.csc_matrix 原始词频
+        :param positions: np.ndarray 全部位置，按(词, 文档, 位置)排序，每个posting的个数为其词频
+        '''
+        counts = counts.tocsc()
+        counts.sort_indices()
+        tf = np.asarray(counts.data, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) != tf.sum():
+            raise ValueError('positions do not match the term frequencies')
+        offsets = np.concatenate([[0], np.cumsum(tf)])
+        deltas = positions.copy()
+        deltas[1:] -= positions[:-1]
+        starts = offsets[:-1][tf > 0]
+        deltas[starts] = positions[starts]
+        data, sizes = _varint_encode(deltas)
+        byte_ptr = np.concatenate([[0], np.cumsum(sizes)])
+        starts = _block_starts(np.asarray(counts.indptr, dtype=np.int64), Postings.block_size)[1]
+        return Positions(data, np.concatenate([byte_ptr[offsets[starts]], [len(data)]]))
+
+    def save(self, path):
+        np.save(path + '/positions_data.npy', self.data)
+        np.save(path + '/positions_blocks.npy', self.block_ptr)
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path + '/positions_data.npy'):
+            return None
+        return Positions(_load_array(path + '/positions_data.npy'), _load_array(path + '/positions_blocks.npy'))
+
+    def decode(self, blocks, tf):
+        '''
+        :param blocks: np.ndarray 若干块（全部块中的序号，从小到大）
+        :param tf: np.ndarray 这些块中每个posting的词频
+        :return: np.ndarray 这些块的全部位置，依次拼接
+        '''
+        if not len(blocks):
+            return np.empty(0, dtype=np.int64)
+        return _delta_decode(_varint_decode(_gather_blocks(self.data, self.block_ptr, blocks)), tf)
+
+    def decode_all(self, tf):
+        '''
+        :param tf: np.ndarray 全部posting的词频，按倒排表的顺序
+        '''
+        tf = np.asarray(tf, dtype=np.int64)
+        if not len(self.data):
+            return np.empty(0, dtype=np.int64)
+        return _delta_decode(_varint_decode(self.data), tf[tf > 0])
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.block_ptr.nbytes
+
+
+class IndexSegment(object):
+    '''
+    检索模型的一个段（segment）：一批文档的倒排表，保存后不再修改，新增文档写成新的段，后台再合并。
+    counts为文档-词的原始词频（csc矩阵，每一列是一个词的倒排表），列序号为段内词序号；
+    term_ids为段内词序号到全局词序号（MySearch.word_dict）的映射，norms为按全局idf计算的文档向量长度，
+    deleted为已删除文档的标记，这三项随全局统计量变化，保存在模型的gen_*文件夹中；doc_lengths为每个文档的词数，BM25使用；
+    bounds为MaxScore剪枝的得分上界，按打分函数（Scorer）分别保存(max_scores, block_max)：每个词（段内词序号）在段内的最高得分
+    （查询词权重为1时）和压缩倒排表每一块的最高得分，第一次剪枝查询时计算（见MySearch.__bounds()）。simhash为每个文档的SimHash（见_simhash()），近似重复检测使用，随段保存。
+    weights为True时counts已是tf-idf权重（由旧版本模型读入），查询时直接相加，不再乘idf和归一化。
+    从磁盘读入的段为压缩的倒排表（Postings），查询时只解码用到的列，需要整个矩阵时（合并、QueryBatch()）才解码counts。
+
+    :param counts: scipy.sparse.csc_matrix 文档-词的原始词频，或Postings
+    :param files: list[str,str,...,str] 文档名，按矩阵行序
+    :param terms: list[str,str,...,str] 段内词表，按矩阵列序，从磁盘读入的段为None（可由term_ids还原）
+    :param positions: Positions 位置索引，短语查询使用，没有时为None
+    '''
+    def __init__(self, counts, files, terms=None, name=None, weights=False, positions=None):
+        self.postings = None
+        if type(counts) == Postings:
+            self.postings = counts
+            counts = None
+        self.__counts = counts
+        self.shape = self.postings.shape if counts is None else counts.shape
+        self.files = files
+        self.terms = terms
+        self.name = name
+        self.weights = weights
+        self.positions = positions
+        self.deleted = np.zeros(self.shape[0], dtype=bool)
+        self.term_ids = None
+        self.norms = None
+        self.bounds = {}
+        self.simhash = None
+        self.cache = {}
+        self.__doc_lengths = None
+        self.__sorted_ids = None
+        self.__scale = None
+        self.__block_ptr = None
+
+    @property
+    def counts(self):
+        if self.__counts is None:
+            self.__counts = self.postings.decode_all()
+        return self.__counts
+
+    @property
+    def nbytes(self):
+        nbytes = 0 if self.positions is None else self.positions.nbytes
+        if self.__counts is None:
+            return nbytes + self.postings.nbytes
+        return nbytes + self.__counts.data.nbytes + self.__counts.indices.nbytes + self.__counts.indptr.nbytes
+
+    @property
+    def doc_lengths(self):
+        '''
+        np.ndarray 每个文档的词数（原始词频之和），没有保存时由词频计算
+        '''
+        if self.__doc_lengths is None:
+            counts = self.counts
+            self.__doc_lengths = np.bincount(np.asarray(counts.indices), weights=np.asarray(counts.data),
+                                             minlength=self.shape[0]).astype(np.int64)
+        return self.__doc_lengths
+
+    @doc_lengths.setter
+    def doc_lengths(self, value):
+        self.__doc_lengths = value
+
+    def __len__(self):
+        return self.shape[0]
+
+    def live_df(self):
+        '''
+        :return: np.ndarray 段内每个词的文档频率，不统计已删除的文档
+        '''
+        if not self.deleted.any():
+            return np.diff(np.asarray(self.postings.indptr if self.__counts is None else self.__counts.indptr))
+        indptr = np.asarray(self.counts.indptr)
+        live = np.concatenate([[0], np.cumsum(~self.deleted[self.counts.indices])])
+        return live[indptr[1:]] - live[indptr[:-1]]
+
+    def tf_matrix(self, sublinear_tf=False):
+        if not sublinear_tf or self.weights:
+            return self.counts
+        counts = self.counts.astype(np.float64)
+        np.log(counts.data, counts.data)
+        counts.data += 1
+        return counts
+
+    def compute_norms(self, idf=None, sublinear_tf=False, norm='l2'):
+        '''
+        按全局idf计算每个文档tf-idf向量的长度，norm为None时不归一化。同时清空打分函数的缓存self.cache和得分上界self.bounds
+        '''
+        self.__scale = None
+        self.cache = {}
+        self.bounds = {}
+        if self.weights or not norm:
+            self.norms = None
+            return None
+        weights = self.tf_matrix(sublinear_tf)
+        if idf is not None:
+            weights = weights.dot(diags(idf[self.term_ids]))
+        if norm == 'l1':
+            norms = np.asarray(abs(weights).sum(axis=1), dtype=np.float64).ravel()
         else:
-            old_path = self.corpus_name
-            if corpus_name:
-                self.corpus_name = corpus_name
-            self.corpus_name = self.corpus_name.replace('\\', '/')
+            norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1), dtype=np.float64).ravel())
+        norms[norms == 0] = 1
+        self.norms = norms
+
+    def compute_simhash(self, terms=None, idf=None):
+        '''
+        :param terms: list 全局词表，见get_terms()
+        :param idf: np.ndarray 段内每个词的idf，缺省时按本段的文档频率计算
+        :return: np.ndarray(uint64) 每个文档的SimHash（见_simhash()），没有保存时（新建的段、文本模型读入的段）由词频计算
+        '''
+        if self.simhash is None:
+            if self.weights:
+                idf = np.ones(self.shape[1])
+            self.simhash = _simhash(self.counts, self.get_terms(terms), idf)
+        return self.simhash
+
+    def scale(self):
+        '''
+        :return: np.ndarray 每个文档得分的缩放系数：已删除为0，否则为1/norms。norms或deleted改变后需先调用compute_norms()
+        '''
+        if self.__scale is None:
+            scale = (~self.deleted).astype(np.float64)
+            if self.norms is not None:
+                scale /= self.norms
+            self.__scale = scale
+        return self.__scale
+
+    def decode(self, columns):
+        '''
+        :param columns: np.ndarray 段内词序号
+        :return: (rows, values, lengths) 这些列的倒排表依次拼接：文档序号、词频（或权重），以及每列的长度
+        '''
+        if self.__counts is None:
+            return self.postings.decode(columns)
+        tf = self.counts[:, columns]
+        return tf.indices, tf.data, np.diff(tf.indptr)
+
+    def decode_all(self):
+        '''
+        :return: scipy.sparse.csc_matrix 全部词频，从磁盘读入的段解码后不缓存（同counts，但不占用内存）
+        '''
+        if self.__counts is None:
+            return self.postings.decode_all()
+        return self.__counts
+
+    def column_lengths(self, columns):
+        '''
+        :return: np.ndarray 这些词（段内词序号）的倒排表长度
+        '''
+        indptr = self.postings.indptr if self.__counts is None else self.__counts.indptr
+        return np.asarray(indptr[columns + 1] - indptr[columns], dtype=np.int64)
+
+    def find_blocks(self, column, documents):
+        '''
+        :return: np.ndarray documents在column的压缩倒排表中可能所在的块（见Postings.find_blocks()），没有压缩的倒排表时为None
+        '''
+        if self.__counts is not None or self.postings is None:
+            return None
+        return self.postings.find_blocks(column, documents)
+
+    def lookup(self, column, documents):
+        '''
+        :param column: int 段内词序号
+        :param documents: np.ndarray 从小到大排列的段内文档序号
+        :return: (rows, values) documents中出现该词的文档序号和词频，压缩的倒排表只解码包含这些文档的块，
+            未压缩的csc矩阵在较长的一方中二分查找较短的一方
+        '''
+        if self.__counts is None:
+            return self.postings.lookup(column, documents)
+        start, end = self.__counts.indptr[column], self.__counts.indptr[column + 1]
+        rows = np.asarray(self.__counts.indices[start:end])
+        if not len(rows) or not len(documents):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if len(documents) < len(rows):
+            positions = np.minimum(np.searchsorted(rows, documents), len(rows) - 1)
+            found = rows[positions] == documents
+            return np.asarray(documents[found], dtype=np.int64), np.asarray(self.__counts.data[start:end])[positions[found]]
+        positions = np.minimum(np.searchsorted(documents, rows), len(documents) - 1)
+        found = documents[positions] == rows
+        return rows[found], np.asarray(self.__counts.data[start:end])[found]
+
+    def positions_of(self, column, documents):
+        '''
+        :param column: int 段内词序号
+        :param documents: np.ndarray 从小到大排列的段内文档序号
+        :return: (rows, tf, positions) documents中出现该词的文档序号、词频，以及该词在这些文档中的位置（每个文档tf个，依次拼接）。
+            只解码包含这些文档的块
+        '''
+        if self.__counts is None:
+            blocks = np.unique(self.postings.find_blocks(column, documents))
+            blocks = blocks[blocks >= 0]
+            rows, tf, lengths = self.postings.decode_blocks(column, blocks)
+        else:
+            if self.__block_ptr is None:
+                self.__block_ptr = _block_starts(np.asarray(self.__counts.indptr, dtype=np.int64), Postings.block_size)
+            block_ptr, starts = self.__block_ptr
+            start, end = int(self.__counts.indptr[column]), int(self.__counts.indptr[column + 1])
+            blocks = np.unique(np.searchsorted(self.__counts.indices[start:end], documents) // Postings.block_size)
+            blocks = blocks[blocks < block_ptr[column + 1] - block_ptr[column]] + block_ptr[column]
+            lengths = np.minimum(starts[blocks] + Postings.block_size, end) - starts[blocks]
+            index = np.arange(int(lengths.sum())) + np.repeat(starts[blocks] - np.cumsum(lengths) + lengths, lengths)
+            rows, tf = np.asarray(self.__counts.indices)[index].astype(np.int64), self.__counts.data[index]
+        tf = np.asarray(tf, dtype=np.int64)
+        positions = self.positions.decode(blocks, tf)
+        if not len(rows):
+            return rows, tf, positions
+        found = documents[np.minimum(np.searchsorted(documents, rows), len(documents) - 1)] == rows
+        return rows[found], tf[found], positions[np.repeat(found, tf)]
+
+    def match_phrase(self, columns, slop=0, documents=None, offsets=None):
+        '''
+        短语和邻近匹配：columns（段内词序号，按短语中的顺序）在文档中依次出现，且中间插入的词一共不超过slop个，slop为0时为精确短语。
+        先从最短的倒排表开始求文档的交集，再只为这些文档解码位置，按位置对每个起点依次找下一个词最早的出现位置。
+        :param documents: np.ndarray 从小到大排列的候选文档，缺省时为全部文档
+        :param offsets: list[int] 短语中每个词的位置（见Tokenizer.positioned()），缺省时为0, 1, 2...
+        :return: np.ndarray 匹配的段内文档序号，从小到大，不包括已删除的文档
+        '''
+        columns = np.asarray(columns, dtype=np.int64)
+        if offsets is None:
+            offsets = range(len(columns))
+        offsets = np.asarray(offsets, dtype=np.int64) - offsets[0]
+        unique = np.unique(columns)
+        order = unique[np.argsort(self.column_lengths(unique), kind='stable')]
+        if documents is None:
+            documents = np.asarray(self.decode(order[:1])[0], dtype=np.int64)
+            order = order[1:]
+        for column in order.tolist():
+            if not len(documents):
+                break
+            documents = self.lookup(column, documents)[0]
+        documents = documents[~self.deleted[documents]]
+        if not len(documents):
+            return documents
+        keys = {}
+        for column in unique.tolist():
+            rows, tf, positions = self.positions_of(column, documents)
+            keys[column] = (np.repeat(rows, tf) << 32) | positions
+        starts = current = keys[int(columns[0])]
+        for i in range(1, len(columns)):
+            candidates = keys[int(columns[i])]
+            index = np.searchsorted(candidates, current + (offsets[i] - offsets[i - 1]))
+            found = index < len(candidates)
+            found[found] = candidates[index[found]] >> 32 == current[found] >> 32
+            starts, current = starts[found], candidates[index[found]]
+            keep = (current - starts) - offsets[i] <= slop
+            starts, current = starts[keep], current[keep]
+        return np.unique(starts >> 32)
+
+    def columns(self, term_ids):
+        '''
+        全局词序号 -> 段内词序号
+        :return: (段内词序号, 每个全局词序号是否在本段出现的bool数组)
+        '''
+        if self.__sorted_ids is None:
+            order = np.argsort(self.term_ids, kind='stable')
+            self.__sorted_ids = (order, np.asarray(self.term_ids)[order])
+        order, sorted_ids = self.__sorted_ids
+        if not len(sorted_ids):
+            return np.empty(0, dtype=np.int64), np.zeros(len(term_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(sorted_ids, term_ids), len(sorted_ids) - 1)
+        found = sorted_ids[pos] == term_ids
+        return order[pos[found]], found
+
+    def get_terms(self, terms=None):
+        '''
+        :param terms: list 全局词表，self.terms为None时由term_ids还原段内词表
+        '''
+        if self.terms is None:
+            self.terms = [terms[index] for index in self.term_ids.tolist()]
+        return self.terms
+
+    def save(self, path):
+        '''
+        保存段中不变的部分：压缩的倒排表（Postings）、位置索引（Positions，有时）、SimHash、段内词表和文档名
+        '''
+        os.mkdir(path)
+        np.save(path + '/simhash.npy', self.compute_simhash())
+        if self.postings is None:
+            self.postings = Postings.encode(self.counts, self.weights)
+        self.postings.save(path)
+        if self.positions is not None:
+            self.positions.save(path)
+        with open(path + '/vocab.txt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.terms))
+        with open(path + '/files.txt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.files))
+
+    @staticmethod
+    def load(path, documents, name=None, weights=False):
+        '''
+        以np.memmap方式打开保存好的段，词表不读入
+        '''
+        counts = Postings.load(path, documents)
+        with open(path + '/files.txt', 'r', encoding='utf-8') as f:
+            content = f.read()
+        segment = IndexSegment(counts, content.split('\n') if content else [], name=name, weights=weights,
+                               positions=Positions.load(path))
+        segment.simhash = _load_array(path + '/simhash.npy')
+        return segment
+
+    @staticmethod
+    def merge(segments, terms=None):
+        '''
+        把多个段合并为一个新段，丢弃已删除的文档和不再出现的词。每个段都有位置索引时新段也有
+        :param terms: list 全局词表，用于还原从磁盘读入的段的词表
+        :return: (IndexSegment, list[np.ndarray]) 新段和每个原段的行号映射（已删除的为-1）
+        '''
+        word_dict = {}
+        rows, columns, data, files, mappings, simhash = [], [], [], [], [], []
+        with_positions = bool(segments) and not [segment for segment in segments if segment.positions is None]
+        positions = ([], [], [])
+        offset = 0
+        for segment in segments:
+            mapping = np.array([word_dict.setdefault(word, len(word_dict)) for word in segment.get_terms(terms)],
+                               dtype=np.int64)
+            live = np.flatnonzero(~segment.deleted)
+            row_map = np.full(len(segment), -1, dtype=np.int64)
+            row_map[live] = np.arange(len(live)) + offset
+            counts = segment.counts.tocoo()
+            keep = row_map[counts.row] >= 0
+            rows.append(row_map[counts.row[keep]])
+            columns.append(mapping[counts.col[keep]])
+            data.append(np.asarray(counts.data)[keep])
+            if with_positions:
+                csc = segment.counts
+                tf = np.asarray(csc.data, dtype=np.int64)
+                keep = np.repeat(row_map[csc.indices] >= 0, tf)
+                positions[0].append(np.repeat(mapping[np.repeat(np.arange(csc.shape[1]), np.diff(csc.indptr))], tf)[keep])
+                positions[1].append(np.repeat(row_map[csc.indices], tf)[keep])
+                positions[2].append(segment.positions.decode_all(tf)[keep])
+            if len(segment.files) == len(segment):
+                files += [segment.files[index] for index in live.tolist()]
+            simhash.append(np.asarray(segment.compute_simhash(terms))[live])
+            mappings.append(row_map)
+            offset += len(live)
+        if len(files) != offset:
+            files = []
+        merged_terms = list(word_dict)
+        counts = csc_matrix((np.concatenate(data) if data else [],
+                             (np.concatenate(rows) if rows else [], np.concatenate(columns) if columns else [])),
+                            shape=(offset, len(merged_terms)))
+        used = np.flatnonzero(np.diff(counts.indptr))
+        counts = counts[:, used].tocsc()
+        counts.sort_indices()
+        merged = IndexSegment(counts, files, [merged_terms[index] for index in used.tolist()])
+        merged.simhash = np.concatenate(simhash).astype(np.uint64) if simhash else np.empty(0, dtype=np.uint64)
+        if with_positions:
+            columns, rows, values = [np.concatenate(part) for part in positions]
+            merged.positions = Positions.encode(counts, values[np.lexsort((values, rows, np.searchsorted(used, columns)))])
+        return merged, mappings
+
+
+class SimHashIndex(object):
+    '''
+    SimHash的近似重复查找：64位签名按位分成distance+1段，海明距离不超过distance的两个签名至少有一段完全相同（抽屉原理），
+    只与某一段相同的签名比较海明距离。初始的一批签名（如已保存的模型中的文档）按每一段排序后二分查找，之后add()的放在dict中
+
+    :param distance: int 海明距离不超过distance的视为近似重复，0~63
+    :param signatures: np.ndarray(uint64) 初始的签名
+    :param keys: list 与signatures一一对应的编号，缺省时为序号
+    '''
+    def __init__(self, distance=3, signatures=None, keys=None):
+        if type(distance) != int or not 0 <= distance < 64:
+            raise ValueError('distance must be an int between 0 and 63, %s' % (distance,))
+        self.distance = distance
+        bounds = [64 * i // (distance + 1) for i in range(distance + 2)]
+        self.bands = [(bounds[i], (1 << (bounds[i + 1] - bounds[i])) - 1) for i in range(distance + 1)]
+        self.signatures = np.asarray(signatures if signatures is not None else [], dtype=np.uint64)
+        self.keys = keys if keys is not None else range(len(self.signatures))
+        self.sorted = []
+        for shift, mask in self.bands:
+            values = (self.signatures >> np.uint64(shift)) & np.uint64(mask)
+            order = np.argsort(values, kind='stable')
+            self.sorted.append((values[order], order))
+        self.tables = [{} for _ in self.bands]
+        self.added = {}
+
+    def __len__(self):
+        return len(self.signatures) + len(self.added)
+
+    def find(self, signature):
+        '''
+        :return: 与signature海明距离不超过distance的一个签名的编号，没有时为None
+        '''
+        signature = int(signature)
+        if len(self.signatures):
+            found = self.find_initial([signature])[0]
+            if found is not None:
+                return found
+        for (shift, mask), table in zip(self.bands, self.tables):
+            for key in table.get((signature >> shift) & mask, ()):
+                if bin(self.added[key] ^ signature).count('1') <= self.distance:
+                    return key
+        return None
+
+    def find_initial(self, signatures):
+        '''
+        在初始的签名中批量查找，每一段对全部signatures二分查找一次，只为同一段相同的候选计算海明距离
+        :return: list 每个签名对应的一个海明距离不超过distance的初始签名的编号，没有时为None
+        '''
+        signatures = np.asarray(signatures, dtype=np.uint64)
+        found = np.full(len(signatures), -1, dtype=np.int64)
+        for (shift, mask), (values, order) in zip(self.bands, self.sorted):
+            bands = (signatures >> np.uint64(shift)) & np.uint64(mask)
+            begin, end = np.searchsorted(values, bands), np.searchsorted(values, bands, side='right')
+            counts = np.where(found < 0, end - begin, 0)
+            rows = np.repeat(np.arange(len(signatures)), counts)
+            if not len(rows):
+                continue
+            candidates = order[np.arange(len(rows)) + np.repeat(begin - np.cumsum(counts) + counts, counts)]
+            match = _popcount(self.signatures[candidates] ^ signatures[rows]) <= self.distance
+            rows, candidates = rows[match][::-1], candidates[match][::-1]
+            found[rows] = candidates
+        return [self.keys[row] if row >= 0 else None for row in found.tolist()]
+
+    def find_duplicates(self, signatures):
+        '''
+        一批签名内部去重（不使用也不修改本对象中的签名）：按顺序，与前面未去掉的某个签名海明距离不超过distance的签名去掉，
+        去掉的签名与逐个find()、add()相同。每一段排序后取出该段相同的签名对，向量化计算海明距离，只对近似重复的签名对逐个判断
+        :return: list[(int, int)] 去掉的签名的序号，及与之重复的前面的签名的序号，按序号排列
+        '''
+        signatures = np.asarray(signatures, dtype=np.uint64)
+        pairs = []
+        for shift, mask in self.bands:
+            values = (signatures >> np.uint64(shift)) & np.uint64(mask)
+            order = np.argsort(values, kind='stable')
+            values = values[order]
+            for k in range(1, len(signatures)):
+                same = np.flatnonzero(values[k:] == values[:-k])
+                if not len(same):
+                    break
+                pairs.append(np.stack([order[same], order[same + k]]))
+        if not pairs:
+            return []
+        first, second = np.concatenate(pairs, axis=1)
+        close = _popcount(signatures[first] ^ signatures[second]) <= self.distance
+        first, second = first[close], second[close]
+        order = np.lexsort((first, second))
+        dropped = {}
+        for a, b in zip(first[order].tolist(), second[order].tolist()):
+            if b not in dropped and a not in dropped:
+                dropped[b] = a
+        return sorted(dropped.items())
+
+    def add(self, key, signature):
+        signature = int(signature)
+        self.added[key] = signature
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table.setdefault((signature >> shift) & mask, []).append(key)
+
+
+class TermDict(object):
+    '''
+    不可变的紧凑词表，代替{词: 词序号}的dict：全部词按utf-8编码后排序拼接成一个字节数组data，offsets为每个词的起止位置，
+    ids为排序后每个词的词序号。三个数组可以np.memmap方式打开，查找时二分，O(log n)；支持前缀查找。
+    用法同dict：get()、[]、in、len()、items()。
+
+    :param data: np.ndarray(uint8) 排序后拼接的词
+    :param offsets: np.ndarray(int64) 长度为词数+1
+    :param ids: np.ndarray(int64) 词序号
+    '''
+    def __init__(self, data, offsets, ids):
+        self.data = data
+        self.offsets = offsets
+        self.ids = ids
+        self.__view = memoryview(data)
+
+    @staticmethod
+    def from_terms(terms):
+        '''
+        :param terms: list[str,str,...,str] 按词序号排列的词表
+        '''
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        encoded = [terms[index].encode('utf-8') for index in order]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return TermDict(data, offsets, np.array(order, dtype=np.int64))
+
+    def save(self, path):
+        np.save(path + '/vocab_data.npy', self.data)
+        np.save(path + '/vocab_offsets.npy', self.offsets)
+        np.save(path + '/vocab_ids.npy', self.ids)
+
+    @staticmethod
+    def load(path):
+        return TermDict(_load_array(path + '/vocab_data.npy'), _load_array(path + '/vocab_offsets.npy'),
+                        _load_array(path + '/vocab_ids.npy'))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __word(self, position):
+        return self.__view[self.offsets[position]:self.offsets[position + 1]].tobytes()
+
+    def __lower_bound(self, key):
+        low, high = 0, len(self.ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self.__word(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, word, default=None):
+        key = word.encode('utf-8')
+        position = self.__lower_bound(key)
+        if position < len(self.ids) and self.__word(position) == key:
+            return int(self.ids[position])
+        return default
+
+    def __getitem__(self, word):
+        index = self.get(word)
+        if index == None:
+            raise KeyError(word)
+        return index
+
+    def __contains__(self, word):
+        return self.get(word) != None
+
+    def prefix(self, prefix, limit=None):
+        '''
+        前缀查找，可用于查询扩展
+        :return: list[(str, int)] 以prefix开头的(词, 词序号)，按词排序，最多limit个
+        '''
+        key = prefix.encode('utf-8')
+        position = self.__lower_bound(key)
+        res = []
+        while position < len(self.ids) and (limit == None or len(res) < limit):
+            word = self.__word(position)
+            if not word.startswith(key):
+                break
+            res.append((word.decode('utf-8'), int(self.ids[position])))
+            position += 1
+        return res
+
+    def __iter__(self):
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for position in range(len(self.ids)):
+            yield data[offsets[position]:offsets[position + 1]].decode('utf-8')
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        return zip(iter(self), self.ids.tolist())
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes + self.ids.nbytes
+
+
+class Scorer(object):
+    '''
+    打分函数的接口：文档得分 = sum(查询词次数 x idf[词] x tf_weights(词频, 文档)) x scale[文档]。
+    用到的统计量（df、idf、BM25的idf、每个文档的词数和平均词数）在Train()时计算并随模型保存，切换打分函数不增加查询耗时。
+    自定义打分函数继承Scorer并注册到SCORERS，保存模型时记录name和params()，读取时按name重新创建。
+    '''
+    name = None
+
+    def params(self):
+        '''
+        :return: dict 打分函数的参数，随模型保存，读取时作为关键字参数重新创建
+        '''
+        return {}
+
+    def idf(self, search):
+        '''
+        :return: np.ndarray 全局词序号 -> 查询词的idf，为None时不乘idf
+        '''
+        raise NotImplementedError
+
+    def tf_weights(self, search, segment, rows, tf):
+        '''
+        :param rows: np.ndarray 段内文档序号
+        :param tf: np.ndarray 对应的原始词频（旧版本模型的段为tf-idf权重）
+        :return: np.ndarray(float64) 每个posting的词频权重
+        '''
+        raise NotImplementedError
+
+    def scale(self, search, segment):
+        '''
+        :return: np.ndarray 段内每个文档得分的系数，已删除的文档为0
+        '''
+        raise NotImplementedError
+
+    def score(self, search, segment, columns, query_weights):
+        '''
+        :param columns: np.ndarray 段内词序号
+        :param query_weights: np.ndarray 对应的查询词权重（已乘idf）
+        :return: np.ndarray 段内每个文档的得分
+        '''
+        rows, tf, lengths = segment.decode(columns)
+        weights = self.tf_weights(search, segment, rows, tf) * np.repeat(query_weights, lengths)
+        return np.bincount(rows, weights=weights, minlength=len(segment)) * self.scale(search, segment)
+
+    def weights_matrix(self, search, segment):
+        '''
+        :return: scipy.sparse.csc_matrix 文档-段内词的权重（已乘idf和scale），已删除的文档为0
+        '''
+        counts = segment.counts
+        weights = csc_matrix((self.tf_weights(search, segment, counts.indices, counts.data), counts.indices,
+                              counts.indptr), shape=counts.shape)
+        idf = self.idf(search)
+        if idf is not None and not segment.weights:
+            weights = weights.dot(diags(idf[segment.term_ids]))
+        return diags(self.scale(search, segment)).dot(weights).tocsc()
+
+    def max_scores(self, search, segment):
+        '''
+        MaxScore剪枝的上界：查询词权重为1时的tf_weights x scale的最大值
+        :return: (np.ndarray, np.ndarray) 段内每个词的最高得分，压缩倒排表每一块的最高得分（段没有压缩的倒排表时为None）
+        '''
+        counts = segment.decode_all()
+        rows = np.asarray(counts.indices)
+        weights = self.tf_weights(search, segment, rows, counts.data) * self.scale(search, segment)[rows]
+        lengths = np.diff(np.asarray(counts.indptr))
+        bounds = np.zeros(len(lengths))
+        if len(weights):
+            bounds[lengths > 0] = np.maximum.reduceat(weights, np.asarray(counts.indptr[:-1])[lengths > 0])
+        if segment.postings is None:
+            return bounds, None
+        starts = segment.postings.block_starts()[1]
+        return bounds, np.maximum.reduceat(weights, starts) if len(starts) else np.zeros(0)
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.params() == other.params()
+
+    def __hash__(self):
+        return hash((self.name, tuple(sorted(self.params().items()))))
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % item for item in sorted(self.params().items())))
+
+    @staticmethod
+    def create(scorer=None):
+        '''
+        :param scorer: Scorer对象，或名称'tfidf'、'bm25'、'bm25+'，或模型中保存的dict{'name', 参数...}，缺省为'tfidf'
+        :return: Scorer
+        '''
+        if isinstance(scorer, Scorer):
+            return scorer
+        params = {}
+        if type(scorer) == dict:
+            params = dict(scorer)
+            scorer = params.pop('name', None)
+        if scorer == None:
+            scorer = 'tfidf'
+        if scorer not in SCORERS:
+            raise ValueError('unknown scorer, %s' % scorer)
+        return SCORERS[scorer](**params)
+
+
+class TfidfScorer(Scorer):
+    '''
+    tf-idf，同sklearn的TfidfTransformer（参数为MySearch的norm、use_idf、smooth_idf、sublinear_tf），文档向量按norm归一化
+    '''
+    name = 'tfidf'
+
+    def idf(self, search):
+        return search.idf
+
+    def tf_weights(self, search, segment, rows, tf):
+        tf = np.asarray(tf, dtype=np.float64)
+        if search.sublinear_tf and not segment.weights:
+            tf = np.log(tf) + 1
+        return tf
+
+    def scale(self, search, segment):
+        return segment.scale()
+
+
+class BM25Scorer(Scorer):
+    '''
+    BM25：idf为log(1 + (N - df + 0.5) / (df + 0.5))，词频权重为tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))，
+    dl为文档词数，avgdl为平均词数。每个段的k1 * (1 - b + b * dl / avgdl)第一次查询时计算，缓存在段的cache中。
+    旧版本模型中只有tf-idf权重的段按tf-idf打分。
+
+    :param k1: float 词频饱和的快慢
+    :param b: float 文档长度归一化的程度，0为不归一化
+    '''
+    name = 'bm25'
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+
+    def params(self):
+        return {'k1': self.k1, 'b': self.b}
+
+    def idf(self, search):
+        return search.bm25_idf
+
+    def length_factors(self, search, segment):
+        '''
+        :return: np.ndarray 段内每个文档的k1 * (1 - b + b * dl / avgdl)
+        '''
+        key = ('bm25', self.k1, self.b, search.avgdl)
+        factors = segment.cache.get(key)
+        if factors is None:
+            factors = self.k1 * (1 - self.b + self.b * np.asarray(segment.doc_lengths) / (search.avgdl or 1))
+            segment.cache[key] = factors
+        return factors
+
+    def tf_weights(self, search, segment, rows, tf):
+        tf = np.asarray(tf, dtype=np.float64)
+        if segment.weights:
+            return tf
+        return tf * (self.k1 + 1) / (tf + self.length_factors(search, segment)[rows])
+
+    def scale(self, search, segment):
+        scale = segment.cache.get('live')
+        if scale is None:
+            scale = (~segment.deleted).astype(np.float64)
+            segment.cache['live'] = scale
+        return scale
+
+
+class BM25PlusScorer(BM25Scorer):
+    '''
+    BM25+：出现查询词的文档的词频权重再加delta，避免长文档的得分被过度压低；idf同BM25
+
+    :param delta: float 词频权重的下限
+    '''
+    name = 'bm25+'
+
+    def __init__(self, k1=1.2, b=0.75, delta=1.0):
+        BM25Scorer.__init__(self, k1, b)
+        self.delta = delta
+
+    def params(self):
+        return {'k1': self.k1, 'b': self.b, 'delta': self.delta}
+
+    def tf_weights(self, search, segment, rows, tf):
+        weights = BM25Scorer.tf_weights(self, search, segment, rows, tf)
+        if segment.weights:
+            return weights
+        return weights + self.delta
+
+
+SCORERS = {'tfidf': TfidfScorer, 'bm25': BM25Scorer, 'bm25+': BM25PlusScorer}
+
+
+class Tokenizer(object):
+    '''
+    分词器：tokenize()直接返回词的列表（与原来切词后再用CountVectorizer切分的结果相同：小写，只保留两个字符以上的词），
+    Train()和查询都使用它，不再拼接成字符串再切分。分为两步：segment()为切词本身（耗时），结果可以由SegmentCache缓存；
+    tokens()去停用词并规范化（很快），停用词改变后只需重新执行这一步。自定义分词器继承Tokenizer，实现segment()和filter()，
+    赋值给MySearch.tokenizer；再实现words()时位置索引中去掉的词也占位置（见positioned()）。
+
+    :param stopwords: list[str] 停用词
+    '''
+    name = ''
+
+    def __init__(self, stopwords=()):
+        self.stopwords = frozenset(stopwords)
+
+    def signature(self):
+        '''
+        :return: str segment()结果的标识（分词器名称和用户词典），用作SegmentCache的键，为None时不缓存
+        '''
+        return None
+
+    def load(self):
+        '''
+        加载分词器和用户词典，每个进程只需一次
+        '''
+        pass
+
+    def segment(self, text):
+        '''
+        :return: list 切词结果，可以json序列化
+        '''
+        raise NotImplementedError
+
+    def filter(self, units):
+        '''
+        :return: list[str] 去掉停用词后的词
+        '''
+        raise NotImplementedError
+
+    def words(self, units):
+        '''
+        :return: list[(str, bool)] segment()的结果中依次的每个词和它是否保留（不是停用词），保留的词同filter()。
+            缺省由filter()得到，全部保留，此时位置只计保留的词
+        '''
+        return [(word, True) for word in self.filter(units)]
+
+    def tokens(self, units):
+        '''
+        :return: list[str] segment()的结果去停用词、转为小写，并按CountVectorizer的规则（两个字符以上的\\w）切分
+        '''
+        res = []
+        for word in self.filter(units):
+            res += self.__normalize(word)
+        return res
+
+    def positioned(self, units):
+        '''
+        位置索引使用：每个词的位置按去停用词之前的切词结果（words()）计算，去掉的停用词、单字和标点同样占一个位置，
+        空白不占位置。这样短语"a b"要求两个词在原文中真正相邻，"a b"~n的n为中间实际的词数。
+        :return: (list[str], list[int]) 同tokens()的词，和每个词的位置
+        '''
+        tokens, offsets = [], []
+        position = 0
+        for word, keep in self.words(units):
+            found = self.__normalize(word)
+            if keep:
+                tokens += found
+                offsets += range(position, position + len(found))
+            if word.strip():
+                position += max(len(found), 1)
+        return tokens, offsets
+
+    def __normalize(self, word):
+        word = word.lower()
+        if len(word) > 1 and word.isalnum():
+            return [word]
+        return TOKEN_PATTERN.findall(word)
+
+    def tokenize(self, text):
+        return self.tokens(self.segment(text))
+
+    def __repr__(self):
+        return '%s()' % type(self).__name__
+
+    @staticmethod
+    def create(seg, stopwords=(), stop_flag=(), user_word_path=None, user_words=(), dict_cache=None):
+        '''
+        :param seg: str None或'jieba'、'pkuseg'、'e'（按空格切分），同MySearch(seg)
+        :param dict_cache: str jieba词典缓存文件，见JiebaTokenizer
+        '''
+        if seg == 'jieba' or seg == None:
+            return JiebaTokenizer(stopwords, stop_flag, user_word_path, user_words, dict_cache)
+        if seg == 'pkuseg':
+            return PkusegTokenizer(stopwords, user_words)
+        if seg == 'e':
+            return WhitespaceTokenizer(stopwords)
+        raise ValueError('unknown seg, %s' % seg)
+
+
+class JiebaTokenizer(Tokenizer):
+    '''
+    jieba按词性切词（pseg.cut），去掉词性在stop_flag中的词和停用词，每个词再用cut_for_search()切出其中的短词。
+    jieba在load()时才导入，词典在第一次切词时加载
+
+    :param user_word_path: str 用户词典文件，load()时加载
+    :param user_words: list[str] 另外添加的用户词汇
+    :param dict_cache: str jieba默认词典预先编译的缓存文件（前缀词典的marshal），不存在时第一次加载词典后生成，
+        之后直接读取；缺省时jieba缓存在临时文件夹，可能被清理。只在本进程第一次加载jieba词典前设置有效
+    '''
+    name = 'jieba'
+
+    def __init__(self, stopwords=(), stop_flag=(), user_word_path=None, user_words=(), dict_cache=None):
+        Tokenizer.__init__(self, stopwords)
+        self.stop_flag = frozenset(stop_flag)
+        self.user_word_path = user_word_path
+        self.user_words = list(user_words)
+        self.dict_cache = dict_cache
+        self.loaded = False
+        self.parts = {}
+
+    def signature(self):
+        digest = hashlib.blake2b(digest_size=16)
+        if self.user_word_path and os.path.exists(self.user_word_path):
+            with open(self.user_word_path, 'rb') as f:
+                digest.update(f.read())
+        digest.update('\n'.join(self.user_words).encode('utf-8'))
+        return 'jieba:' + digest.hexdigest()
+
+    def load(self):
+        if not self.loaded:
+            import jieba
+            if self.dict_cache and not jieba.dt.initialized:
+                jieba.dt.cache_file = os.path.abspath(self.dict_cache)
+            if self.user_word_path:
+                jieba.load_userdict(self.user_word_path)
+            for word in self.user_words:
+                jieba.add_word(word)
+            self.parts = {}
+            self.loaded = True
+
+    def segment(self, text):
+        '''
+        :return: list[[词, 词性, cut_for_search()的结果]]，cut_for_search()的结果只有该词本身时省略
+        '''
+        import jieba
+        import jieba.posseg as pseg
+        self.load()
+        units = []
+        for word, flag in pseg.cut(text):
+            parts = self.parts.get(word)
+            if parts is None:
+                if len(self.parts) > 100000:
+                    self.parts.clear()
+                parts = self.parts[word] = list(jieba.cut_for_search(word))
+            units.append([word, flag] if parts == [word] else [word, flag, parts])
+        return units
+
+    def filter(self, units):
+        res = []
+        for unit in units:
+            if unit[1] not in self.stop_flag and unit[0] not in self.stopwords:
+                res += unit[2] if len(unit) > 2 else unit[:1]
+        return res
+
+    def words(self, units):
+        res = []
+        for unit in units:
+            keep = unit[1] not in self.stop_flag and unit[0] not in self.stopwords
+            res += [(word, keep) for word in (unit[2] if len(unit) > 2 else unit[:1])]
+        return res
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['parts'] = {}
+        return state
+
+
+class PkusegTokenizer(Tokenizer):
+    '''
+    pkuseg切词，pkuseg在第一次切词时才导入并加载模型（不随对象pickle到子进程）
+
+    :param user_words: list[str] 用户词汇
+    '''
+    name = 'pkuseg'
+
+    def __init__(self, stopwords=(), user_words=()):
+        Tokenizer.__init__(self, stopwords)
+        self.user_words = list(user_words)
+        self.model = None
+
+    def signature(self):
+        return 'pkuseg:' + hashlib.blake2b('\n'.join(self.user_words).encode('utf-8'), digest_size=16).hexdigest()
+
+    def load(self):
+        if self.model is None:
+            import pkuseg
+            self.model = pkuseg.pkuseg(user_dict=self.user_words)
+
+    def segment(self, text):
+        self.load()
+        return list(self.model.cut(text))
+
+    def filter(self, units):
+        return [word for word in units if word not in self.stopwords]
+
+    def words(self, units):
+        return [(word, word not in self.stopwords) for word in units]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['model'] = None
+        return state
+
+
+class WhitespaceTokenizer(Tokenizer):
+    '''
+    按空格切分，用于英文等不需要分词的语料（Train(e='e')），切分很快，不缓存
+    '''
+    name = 'e'
+
+    def segment(self, text):
+        return text.split(' ')
+
+    def filter(self, units):
+        return [word for word in units if word not in self.stopwords]
+
+    def words(self, units):
+        return [(word, word not in self.stopwords) for word in units]
+
+
+class SegmentCache(object):
+    '''
+    切词结果的磁盘缓存：以分词器的签名和文档内容的哈希为键，保存Tokenizer.segment()的结果（去停用词之前），
+    修改停用词、打分函数等之后重新Train()时，内容相同的文档不再切词。保存在path文件夹下的sqlite数据库中，可多个进程共用。
+
+    :param path: str 缓存文件夹
+    '''
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path + '/segments.sqlite', check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS segments (key BLOB PRIMARY KEY, value BLOB)')
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(signature, text):
+        return hashlib.blake2b((signature + '\0' + text).encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    def get_many(self, keys):
+        '''
+        :return: list 与keys一一对应的切词结果，没有缓存的为None
+        '''
+        found = {}
+        for begin in range(0, len(keys), 500):
+            part = keys[begin:begin + 500]
+            rows = self.connection.execute('SELECT key, value FROM segments WHERE key IN (%s)' %
+                                           ','.join('?' * len(part)), part)
+            for key, value in rows:
+                found[key] = json.loads(zlib.decompress(value).decode('utf-8'))
+        res = [found.get(key) for key in keys]
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return res
+
+    def put_many(self, items):
+        '''
+        :param items: list[(key, 切词结果)]
+        '''
+        self.connection.executemany('INSERT OR REPLACE INTO segments VALUES (?, ?)',
+                                    [(key, zlib.compress(json.dumps(units, ensure_ascii=False).encode('utf-8')))
+                                     for key, units in items])
+        self.connection.commit()
+
+    def info(self):
+        '''
+        :return: (hits, misses, size)
+        '''
+        size = self.connection.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+        return (self.hits, self.misses, size)
+
+    def clear(self):
+        self.connection.execute('DELETE FROM segments')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class DocStore(object):
+    '''
+    文档库：保存好的语料库（<name>_corpus文件夹）中的全部文档，代替每篇文档一个文件。docs_<代>.dat为只追加的数据文件，
+    docs_<代>.idx为每篇文档的定长记录（所在块在数据文件中的偏移、块的字节数、文档在块中的起止位置），docs.names为文档名
+    （每行一个），docs.deleted为已删除的文档号，docs.json记录格式、压缩方式和当前的代，原子替换。compress为True时文档按顺序
+    每满约block_bytes字节压缩为一个zlib块，否则每篇文档就是一个块。数据文件以mmap读取，读一篇文档只需定位一次（压缩时
+    再解压一个块）。文档号为写入的顺序，删除、合并段和compact()都不改变；MySearch按文档名（未删除的文档中唯一）找到文档号。
+
+    :param path: str 语料库文件夹
+    '''
+    RECORD = np.dtype([('offset', '<u8'), ('size', '<u4'), ('start', '<u4'), ('end', '<u4')])
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + '/docs.json', 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != DOCS_FORMAT:
+            raise ValueError('%s is not a MySearch document store' % path)
+        self.lock = threading.Lock()
+        self.reload()
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path + '/docs.json')
+
+    @staticmethod
+    def create(path, names, texts, compress=False, block_bytes=2 ** 12):
+        '''
+        在path文件夹中新建文档库，写入names、texts，最后才写docs.json，中途出错时不会留下半个文档库
+        :param texts: Iterable[str] 与names一一对应，可以是生成器
+        '''
+        os.makedirs(path, exist_ok=True)
+        meta = {'format': DOCS_FORMAT, 'version': 1, 'compress': 'zlib' if compress else None,
+                'block_bytes': block_bytes, 'generation': 0}
+        for name in ('docs_000000.dat', 'docs_000000.idx', 'docs.names', 'docs.deleted'):
+            open(path + '/' + name, 'wb').close()
+        store = DocStore.__new__(DocStore)
+        store.path = path
+        store.meta = meta
+        store.lock = threading.Lock()
+        store.reload()
+        store.append(names, texts)
+        store.__write_meta()
+        return store
+
+    def __write_meta(self):
+        with open(self.path + '/docs.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(self.path + '/docs.json.tmp', self.path + '/docs.json')
+
+    def __file(self, suffix, generation=None):
+        return self.path + '/docs_%06d.%s' % (self.meta['generation'] if generation == None else generation, suffix)
+
+    def reload(self):
+        '''
+        重新读入文档记录、文档名和已删除的文档（其他MySearch对象追加了文档之后）
+        '''
+        with open(self.__file('idx'), 'rb') as f:
+            records = np.frombuffer(f.read(), dtype=np.uint8)
+        names = self.__read_names()
+        n = min(len(records) // self.RECORD.itemsize, len(names))
+        self.records = records[:n * self.RECORD.itemsize].view(self.RECORD)
+        self.names = names[:n]
+        with open(self.path + '/docs.deleted', 'rb') as f:
+            deleted = f.read()
+        self.deleted = set(np.frombuffer(deleted[:len(deleted) // 8 * 8], dtype='<u8').tolist())
+        self.ids = None
+        self.data = None
+        self.block = (None, None)
+
+    def __read_names(self):
+        with open(self.path + '/docs.names', 'r', encoding='utf-8', newline='\n') as f:
+            return f.read().split('\n')[:-1]
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def nbytes(self):
+        return os.path.getsize(self.__file('dat')) + self.records.nbytes
+
+    def __data(self, end):
+        data = self.data
+        if data is None or len(data) < end:
+            with open(self.__file('dat'), 'rb') as f:
+                data = self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return data
+
+    def get(self, doc_id):
+        '''
+        :return: str 文档号为doc_id的文档，已删除或不存在时为None
+        '''
+        if doc_id < 0 or doc_id >= len(self.records) or doc_id in self.deleted:
+            return None
+        offset, size, start, end = self.records[doc_id].tolist()
+        if start == end:
+            return ''
+        if not self.meta['compress']:
+            return self.__data(offset + size)[offset + start:offset + end].decode('utf-8', 'surrogatepass')
+        cached_offset, block = self.block
+        if cached_offset != offset:
+            block = zlib.decompress(self.__data(offset + size)[offset:offset + size])
+            self.block = (offset, block)
+        return block[start:end].decode('utf-8', 'surrogatepass')
+
+    def id_of(self, name):
+        '''
+        :return: int 未删除的文档中名为name的文档号，没有时为None
+        '''
+        ids = self.ids
+        if ids is None:
+            ids = self.ids = {self.names[doc_id]: doc_id for doc_id in self.live()}
+        doc_id = ids.get(name)
+        if doc_id == None and len(self.__read_names()) > len(self.names):
+            self.reload()
+            return self.id_of(name)
+        return doc_id
+
+    def get_by_name(self, name):
+        doc_id = self.id_of(name)
+        return None if doc_id == None else self.get(doc_id)
+
+    def live(self):
+        '''
+        :return: list[int] 未删除的文档号，按写入顺序
+        '''
+        return [doc_id for doc_id in range(len(self.records)) if doc_id not in self.deleted]
+
+    def live_names(self):
+        return [self.names[doc_id] for doc_id in self.live()]
+
+    def append(self, names, texts):
+        '''
+        在末尾追加文档：先写数据，再写记录，最后写文档名，中途出错时多写的部分在读入时忽略
+        :return: list[int] 新文档的文档号
+        '''
+        names = list(names)
+        for name in names:
+            if '\n' in name or '\r' in name:
+                raise ValueError('document name with line break, %r' % name)
+        with self.lock:
+            with open(self.__file('dat'), 'ab') as f:
+                records = self.__write(f, f.seek(0, 2), texts)
+            if len(records) != len(names):
+                raise ValueError('names and texts have different lengths, %d != %d' % (len(names), len(records)))
+            with open(self.__file('idx'), 'ab') as f:
+                f.write(records.tobytes())
+            with open(self.path + '/docs.names', 'a', encoding='utf-8', newline='\n') as f:
+                f.write(''.join(name + '\n' for name in names))
+            first = len(self.records)
+            self.records = np.concatenate([self.records, records])
+            self.names = self.names + names
+            if self.ids is not None:
+                self.ids.update(zip(names, range(first, first + len(names))))
+            return list(range(first, first + len(names)))
+
+    def __write(self, f, offset, texts):
+        '''
+        从数据文件的offset处写入texts
+        :return: np.ndarray 每篇文档的记录（RECORD）
+        '''
+        records = []
+        pending = []
+        size = 0
+        for text in texts:
+            raw = (text or '').encode('utf-8', 'surrogatepass')
+            if not self.meta['compress']:
+                f.write(raw)
+                records.append((offset, len(raw), 0, len(raw)))
+                offset += len(raw)
+                continue
+            pending.append(raw)
+            size += len(raw)
+            if size >= self.meta['block_bytes']:
+                offset = self.__write_block(f, offset, pending, records)
+                pending, size = [], 0
+        if pending:
+            self.__write_block(f, offset, pending, records)
+        return np.array(records, dtype=self.RECORD)
+
+    def __write_block(self, f, offset, pending, records):
+        block = zlib.compress(b''.join(pending))
+        start = 0
+        for raw in pending:
+            records.append((offset, len(block), start, start + len(raw)))
+            start += len(raw)
+        f.write(block)
+        return offset + len(block)
+
+    def delete(self, names):
+        '''
+        把这些文档标记为已删除（追加到docs.deleted），数据在compact()时才真正删除
+        :return: list[str] 不存在的文档名
+        '''
+        missing = []
+        doc_ids = []
+        for name in names:
+            doc_id = self.id_of(name)
+            if doc_id == None:
+                missing.append(name)
+            else:
+                doc_ids.append(doc_id)
+                del self.ids[name]
+        with self.lock:
+            with open(self.path + '/docs.deleted', 'ab') as f:
+                f.write(np.array(doc_ids, dtype='<u8').tobytes())
+            self.deleted.update(doc_ids)
+        return missing
+
+    def compact(self):
+        '''
+        重写数据文件，去掉已删除文档的数据；文档号不变（已删除文档的记录清零），写完新的一代后替换docs.json
+        '''
+        with self.lock:
+            old = self.meta['generation']
+            live = self.live()
+            with open(self.__file('dat', old + 1), 'wb') as f:
+                records = self.__write(f, 0, (self.get(doc_id) for doc_id in live))
+            placed = np.zeros(len(self.records), dtype=self.RECORD)
+            placed[live] = records
+            with open(self.__file('idx', old + 1), 'wb') as f:
+                f.write(placed.tobytes())
+            self.meta['generation'] = old + 1
+            self.__write_meta()
+            self.records = placed
+            self.data = None
+            self.block = (None, None)
+            for suffix in ('dat', 'idx'):
+                try:
+                    os.unlink(self.__file(suffix, old))
+                except OSError:
+                    pass
+
+    def rename(self, names):
+        '''
+        按顺序重新命名未删除的文档，重写docs.names
+        '''
+        live = self.live()
+        if len(names) != len(live):
+            raise ValueError('need %d names, got %d' % (len(live), len(names)))
+        with self.lock:
+            all_names = list(self.names)
+            for doc_id, name in zip(live, names):
+                all_names[doc_id] = name
+            with open(self.path + '/docs.names.tmp', 'w', encoding='utf-8', newline='\n') as f:
+                f.write(''.join(name + '\n' for name in all_names))
+            os.replace(self.path + '/docs.names.tmp', self.path + '/docs.names')
+            self.names = all_names
+            self.ids = None
+
+
+class QueryTrace(object):
+    '''
+    一次查询的分阶段耗时（秒）和计数，由MySearch.Query()在self.stats不为None时创建，见QueryStats
+
+    :param query: str 查询字符串
+    :param corpus_name: str 查询的语料库，None为当前模型
+    '''
+    def __init__(self, query, corpus_name=None):
+        self.query = query
+        self.corpus_name = corpus_name
+        self.total = 0.0
+        self.times = {}
+        self.counters = {}
+
+    def stage(self, name, t_begin):
+        '''
+        name阶段的耗时加上从t_begin（time.perf_counter()）到现在的时间
+        :return: float 现在的time.perf_counter()，可作为下一阶段的t_begin
+        '''
+        now = time.perf_counter()
+        self.times[name] = self.times.get(name, 0.0) + now - t_begin
+        return now
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        return {'query': self.query, 'corpus_name': self.corpus_name, 'total': self.total, 'times': dict(self.times),
+                'counters': dict(self.counters)}
+
+    def __repr__(self):
+        return 'QueryTrace(%r, total=%.6f, times=%r, counters=%r)' % (self.query, self.total, self.times, self.counters)
+
+
+class QueryStats(object):
+    '''
+    可选的查询统计：MySearch.stats = QueryStats()后，每次Query()记录一个QueryTrace，阶段（times）有：
+    parse（切词和解析查询）、load（取得保存的语料库的模型，未缓存时为use_model()）、match（布尔、短语查询求满足条件的文档）、
+    score（打分）、sort（选出前top_k并排序）、show（读取文档、生成摘要）；计数（counters）有：postings（读取的posting数）、
+    scored（得分不为0的文档数）、files_read（读取的文档文件数）、query_cache_hits、result_cache_hits、result_cache_misses、
+    model_cache_hits。self.stats为None（缺省）时每次查询只多几次判断。
+
+    :param hook: callable 不为None时每次查询结束后调用hook(trace)，用于导出到日志或监控系统，应尽快返回
+    '''
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.clear()
+
+    @property
+    def last(self):
+        '''
+        :return: QueryTrace 本线程最近一次查询的统计
+        '''
+        return getattr(self.local, 'last', None)
+
+    def record(self, trace):
+        self.local.last = trace
+        with self.lock:
+            self.queries += 1
+            self.total += trace.total
+            for name, value in trace.times.items():
+                self.times[name] = self.times.get(name, 0.0) + value
+            for name, value in trace.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+        if self.hook is not None:
+            self.hook(trace)
+
+    def summary(self):
+        '''
+        :return: dict{'queries', 'total', 'times', 'counters', 'mean'} 累计的统计，mean为每次查询各阶段的平均耗时
+        '''
+        with self.lock:
+            n = max(self.queries, 1)
+            return {'queries': self.queries, 'total': self.total, 'times': dict(self.times),
+                    'counters': dict(self.counters),
+                    'mean': dict([('total', self.total / n)] + [(name, value / n) for name, value in self.times.items()])}
+
+    def clear(self):
+        with self.lock:
+            self.queries = 0
+            self.total = 0.0
+            self.times = {}
+            self.counters = {}
+
+
+class MySearch(object):
+    '''
+    该class可以为中/英文语料库（文件夹/Iterable对象）建立基于tf-idf（或BM25）的检索模型，若涉及文件操作（除stop_words.txt，userdict.txt）
+    外，只支持编码utf-8，其中中文分词可选jieba或者pkuseg，tf-idf依赖sklearn。
+    jieba、pkuseg和sklearn都在用到时才导入：只加载所选的分词器，只查询（use_model()后Query()）时不导入sklearn，
+    查询英文等按空格切分的模型（MySearch('e')）时也不导入jieba
+    实现以下功能：
+    1.检索模型、语料库的建立（训练） -- 保存 -- 使用 -- 添加语料（从列表/目录） -- 删除 -- 部分删除
+    2.根据搜索词汇，对Iterable元素（元素为字符串）进行相关性排序，返回序列号等
+    3.根据搜索词汇，对指定目录下的文件进行相关性排序，返回文件名序列号等
+
+    :param seg: str 缺省时默认选择jieba进行中文分词，当为'pkuseg'时使用pkuseg进行中文分词
+    :param 参数同 sklearn.feature_extraction.text.TfidfTransformer(), 主要是为了支持不同的tf-idf模式，
+        在Train()中点击相应函数查看介绍。
+    :param scorer: 打分函数，'tfidf'（缺省）、'bm25'、'bm25+'或Scorer对象，见self.scorer
+
+    Example：见test(),test2(),go()
+
+    函数简介：
+
+    关于停用词和用户词汇：
+        默认停用词存放在stop_words.txt，可自行修改，也可以在使用 add_stopwords() 函数添加
+        默认用户词存放在userdict.txt，可自行修改，也可以在使用 add_userword() 函数添加
+        add_stopwords()或add_userword() 使用后，将在下一次self.Train()使用时生效
+
+        add_stopwords(self, my_stopword_list) 添加停用词
+            my_stopword_list: list[str,str,...,str] 待添加的停用词
+            :return: 成功返回True，失败返回False
+
+        add_userword(self, my_word_list) 添加词汇，用来优化中文分词，使jieba、pkuseg语料库中没有的词能正确切分。
+            当self.Train()使用e='e'时，不使用jieba、pkuseg，用户词汇无效。
+            my_word_list: list[str,str,...,str] 待添加的分词
+            :return:成功返回True，失败返回False
+
+    Train(self, argc, e=None, workers=None, stream=False, positions=False) 训练函数，用于建立检索模型
+        argc支持str类型和其它Iterable（list, tuple等，其element应为str类型，表示文本）型变量：
+            argc为str类型时，argc代表语料文件夹目录，Train()将使用该目录下的文档建立检索模型。
+            argc为Iterable类型时，argc即待训练语料库，argc中的element应为str类型，表示语料文本，
+        Train()将使用argc中的element作为语料文本建立检索模型。
+        e默认为None，启用jieba、pkuseg库，当待使用文本为纯英文或其它 *由空格隔开* 无需分词的语料时，可
+        以令e='e',将不使用jieba、pkuseg库，可一定程度提高效率，但用户词汇无效。
+        workers为切词使用的进程数，缺省时在当前进程切词；workers>1时文档分块交给进程池切词（每个进程只加载一次
+        分词器、用户词典和停用词），结果按原顺序合并，切词是Train()的主要耗时，可随核数近似线性加速。
+        self.segment_cache为SegmentCache（或缓存文件夹的路径）时，切词结果按文档内容的哈希缓存在磁盘上（去停用词之前），
+        修改停用词、打分函数后重新Train()时内容相同的文档不再切词。
+        self.jieba_dict_cache为文件路径时，jieba默认词典的预编译缓存保存在该文件（见JiebaTokenizer），缩短进程启动后第一次切词的时间。
+        stream为True时流式训练：逐篇读取（argc为目录时）、分块切词、逐篇统计词频并增量建立矩阵，内存中只保留文档名，
+        不保留原文和切词结果，可以训练比内存还大的语料库；argc为Iterable时可以是生成器，只遍历一次。
+        查询结果的内容在需要时从文件中读取，argc为生成器时结果中没有content。
+        positions为True时同时建立位置索引（每个词在文档中的位置，压缩后随模型保存），用于短语和邻近查询。
+        位置按去停用词之前的切词结果计算，去掉的停用词、单字和标点同样占位置（见Tokenizer.positioned()）。
+
+    Query(self, query_str, corpus_name=None, top_k=None, offset=0, content=True, snippet=None, collapse=False,
+          boolean=False) 查询函数
+        query_str为查询字符串，corpus_name为查询语料库名称，corpus_name为None时优先查询self.Train(),
+        其次查询默认语料库，若corpus_name不为空，则查询corpus_name指向的语料库，若没有该语料库将出错。
+        top_k为int时只返回得分最高的top_k个结果（np.argpartition选取，不对全部结果排序），缺省时返回全部结果；
+        self.pruning为True（默认）时用MaxScore提前终止：按每个词的得分上界，高频词只解码可能进入前top_k的文档所在的块，结果不变。
+        offset与top_k一起用于分页，只为返回的这一页读取文档内容；content=False时不读取内容，之后可用GetDocument()读取；
+        snippet为int时结果中增加'snippet'：第一个查询词附近约snippet个字符，查询词用self.highlight（默认<em></em>）标记。
+        query_str中用双引号括起的部分为短语，如'"机器 学习" 教材'，只返回包含该短语的文档；'"机器 学习"~2'为邻近查询，
+        短语中的词按顺序出现、中间一共最多插入2个词（包括停用词和单字）即可。短语中的词同时作为查询词打分，需要Train(positions=True)的模型。
+        模型没有位置索引时短语中的词作为普通查询词。boolean为True时支持布尔查询（缺省不解析，AND、OR、NOT和括号作为普通文字）：
+        AND、OR、NOT（大写）和括号，如'(北京 OR 杭州) AND 大学 NOT 图书馆'，相邻的普通词作为一段文字，出现其中任意一个即可。
+        先求出满足条件的文档（AND从最短的倒排表开始，之后只在候选文档中查找，跳过不含候选文档的块），只为这些文档打分，
+        条件越严格越快；NOT的词不参与打分。语法详见__parse_query()。
+        collapse为True（或海明距离）时合并近似重复的结果，见self.dedup，结果中增加'duplicates'：并入该结果的文档序号。
+        :return: list[dict,dict,...,dict]
+            其中dict{'index', 'score', 'content'} or dict{'index', 'score', 'filename', 'content'}
+        注：以'_corpus'结尾的文件夹将被作为保存好的语料库，文件夹名即为语料库名，查询保存好的
+    语料库时，corpus_name结尾可以带'_corpus'也可以不带。另，'_model'结尾的文件夹被作为保存好的模型。
+        查询保存好的语料库时，模型只加载一次，保存在进程内的model_cache（ModelCache）中，之后的查询直接复用。
+
+    GetDocument(self, index, corpus_name=None) 读取Query()结果中序号为index的文档内容
+
+    self.compress_documents 保存语料库时是否压缩文档，缺省为False。语料库（'_corpus'文件夹）保存为一个文档库（DocStore）：
+        所有文档在一个只追加的数据文件中，另有定长的偏移表和文档名，以mmap读取，读一篇文档只需定位一次；为True时约每4KB文档
+        压缩为一个zlib块。每篇文档一个文件的旧语料库仍可读取、添加和删除，再次SaveModel()时打包为文档库。
+
+    self.dedup 近似重复检测，缺省为False。每个文档由切词后的词和词频计算64位SimHash，随模型的段保存；
+        为True时Train()、AddCorpus()去掉与前面的文档（AddCorpus()时包括语料库中已有的文档）SimHash的海明距离不超过
+        self.dedup_distance（默认3）的文档：Train()中标记为已删除（同DelDocument()，文档序号不变），AddCorpus()中不添加。
+        去掉的文档记录在self.duplicates中：[(去掉的文档, 与之重复的文档)]，Train()为文档序号，AddCorpus()为文档名。
+        查询时Query(collapse=True)把近似重复的结果合并到得分最高的一个中。
+
+    self.tokenizer 分词器：缺省按seg创建JiebaTokenizer、PkusegTokenizer或WhitespaceTokenizer（'e'），tokenize()直接返回词的列表，
+        Train()和查询共用；可赋值为自定义的Tokenizer（实现segment()和filter()）。
+
+    self.scorer 打分函数：TfidfScorer（缺省）、BM25Scorer(k1=1.2, b=0.75)、BM25PlusScorer(k1=1.2, b=0.75, delta=1.0)，
+        可以直接赋值为名称'tfidf'、'bm25'、'bm25+'。每个文档的词数、平均词数和两种idf在Train()时都已计算并随模型保存，
+        切换打分函数不增加查询耗时；保存的模型记录打分函数，use_model()后沿用。
+
+    CacheInfo(self, corpus_name=None) 查询缓存的命中情况
+        Query()缓存查询字符串的切词结果（self.query_cache，默认1万条）和排序结果（self.result_cache，默认1000条），
+        均为LRU淘汰，模型重新训练或重新读入后排序结果缓存失效。
+        :return: dict{'query': (hits, misses, size), 'result': (hits, misses, size)}
+
+    self.stats 查询统计，缺省为None（不统计）。赋值为QueryStats(hook=None)后Query()记录各阶段（切词解析、加载模型、匹配、打分、
+        排序、读取文档）的耗时和计数（读取的posting数、打分的文档数、读取的文件数、各缓存的命中），self.stats.last为本线程
+        最近一次查询的QueryTrace，self.stats.summary()为累计的统计，hook在每次查询后以QueryTrace调用，用于导出。
+
+    QueryBatch(self, queries, corpus_name=None, top_k=10, workers=None, batch_size=1024) 批量查询
+        queries为查询字符串列表，全部查询组成一个稀疏查询矩阵，与检索模型一次相乘，适合离线任务。
+        workers为切词进程数，缺省时不使用多进程。不支持布尔和短语查询，只用其中的查询词（不包括NOT的词）打分。
+        :return: list[(np.ndarray, np.ndarray),...] 每个查询得分最高的top_k个(文档序号, 得分)
+
+    SaveModel(self, corpus_name=None, filename=None, select=None, shards=None) 保存模型
+        self.Train()之后才能self.SaveModel(),否则将出错
+        corpus_name:str 保存成名为corpus_name的语料库，缺省时将根据时间生成一个语料库名称
+        filename: list[str,str,...,str] 用于给语料文档document命名，缺省时使用原名称，没有原名称时用index
+        :return:成功将返回True，失败会报错
+        模型保存为'_model'结尾的文件夹，由若干个不再修改的段（seg_*，各自的倒排表）和当前一代的全局统计量（gen_*，
+        词表、df、idf）组成，meta.json原子替换，写到一半中断不会损坏模型。use_model()以np.memmap方式打开，
+        启动很快，多个进程可共享同一份页缓存；旧版本的模型仍可读取。
+        shards>1时按文档名的哈希分成shards个分片（<corpus_name>_shard<i>），idf按整个语料库计算，用ShardedSearch查询。
+
+    AddCorpus(self, corpus_name, corpus_name2=None, filename=None) 向指定语料库添加语料文档，并更新检索模型
+        向corpus_name指定的语料库中添加语料文档，语料文档来自corpus_name2指定的语料库，当corpus_name2为None时，
+        默认为self.Train()生成的检索模型和其语料库。filename参数可用于给新添加的文档命名，格式错误时视为没有该参数,
+        默认为保存原名称或者按其在原语料库中的Index序号命名。另，名称与新语料库中的名称相同时，将增加‘-副本’后缀
+        corpus_name1: name of Corpus1    str
+        corpus_name2: name of Corpus2    str
+        filename: filename of Corpus2's file     list [str,str...，str]
+        :return: 成功返回True，失败将报错
+        新文档的原始词频写成模型中的一个新段，只重新计算全局idf和归一化，不重新切词训练整个语料库；
+        段多了以后在后台线程中合并（self.background_merge，默认True）。
+
+    GetDefaultCorpusName(self)
+        获取当前默认的搜索库名称
+
+    AdjustDefaultCorpus(self, default_corpus=None)
+        调整默认搜索库，参数为新库名称，缺省则使用当前训练的语料库名称，有默认搜索库时，将调整为新搜索库，没有默认搜索库时将设置
+        default_corpus: str,
+                    name of the new default corpus
+        :return: 成功返回True，失败返回False
+
+    RemoveCorpus(self, corpus_name=None) 删除保存好的语料库
+        删除保存好的语料库，参数为None时删除self.corpus_name指定的语料库，语料库不存在将报错
+        corpus_name:想要删除的语料库名称
+        :return:成功返回True,失败将报错
+
+    DelDocument(self, documents, corpus_name=None) 删除保存好的语料库的部分语料文档document
+        删除保存好的语料库的部分语料文档document
+        documents: list[str,str,...,str] 待删除的语料文档document的文件名
+        corpus_name: str  语料库名
+        :return: 成功将返回True,失败会报错
+        删除时只标记文档，某个段已删除的比例超过self.compact_ratio（默认0.25）时在后台重写该段。
+
+    CompactCorpus(self, corpus_name=None) 压缩保存好的语料库
+        把所有段合并为一个，真正删除DelDocument()标记删除的文档和不再出现的词，压缩后文档序号会改变
+        :return: 成功将返回True,失败会报错
+
+    MergeSegments(self, corpus_name=None, background=False) 合并保存好的语料库中的段
+        文档数处于同一数量级（以self.merge_factor为底，默认4）的段达到merge_factor个时合并，
+        已删除比例超过self.compact_ratio的段单独重写。合并时不阻塞查询，合并后文档序号会改变。
+        :return: 合并了返回True，不需要合并返回False；background为True时返回后台线程threading.Thread
+    '''
+    def __init__(self, seg=None, norm='l2', use_idf=True, smooth_idf=True,
+                 sublinear_tf=False, scorer=None):
+        '''
+        :param seg: str 缺省时默认选择jieba进行中文分词，当为'pkuseg'时使用pkuseg进行中文分词
+        :param norm,use_idf,use_idf,smooth_idf,sublinear_tf,这几个参数详见sklearn.feature_extraction.text.TfidfTransformer()
+        的说明，在Train()中点击相应函数查看介绍。
+        :param scorer: 'tfidf'、'bm25'、'bm25+'或Scorer对象，缺省为'tfidf'
+        '''
+        self.seg = seg
+        self.__tokenizer = None
+        self.__custom_tokenizer = False
+        self.segment_cache = None
+        self.jieba_dict_cache = None
+        self.stop_flag = ['x', 'c', 'u', 'd', 'p', 't', 'uj', 'm', 'f', 'r']
+        self.stop_word_path = "stop_words.txt"
+        self.stopwords = self.__get_stopwords(self.stop_word_path)
+        self.user_word_path = "userdict.txt"
+        self.my_word_list = self.__get_userdict(self.user_word_path)
+        self.corpus = []
+        self.corpus_name = ''
+        self.files = []
+        self.compress_documents = False
+        self.__doc_store = None
+        self.dedup = False
+        self.dedup_distance = 3
+        self.duplicates = []
+        self.__simhash_cache = None
+        self.segments = []
+        self.tfidf = None
+        self.word_dict = {}
+        self.df = None
+        self.idf = None
+        self.bm25_idf = None
+        self.avgdl = None
+        self.merge_factor = 4
+        self.compact_ratio = 0.25
+        self.background_merge = True
+        self.pruning = True
+        self.highlight = ('<em>', '</em>')
+        self.model_version = 0
+        self.query_cache = LRUCache(10000)
+        self.result_cache = LRUCache(1000)
+        self.stats = None
+        self.norm = norm
+        self.use_idf = use_idf
+        self.smooth_idf = smooth_idf
+        self.sublinear_tf = sublinear_tf
+        self.__scorer_given = False
+        self.scorer = scorer
+
+
+    @property
+    def scorer(self):
+        '''
+        打分函数（Scorer），可以赋值为Scorer对象或名称'tfidf'、'bm25'、'bm25+'，赋值后查询结果缓存失效。
+        没有指定（None）时use_model()使用模型保存时的打分函数，指定了则保持不变
+        '''
+        return self.__scorer
+
+    @scorer.setter
+    def scorer(self, value):
+        self.__scorer = Scorer.create(value)
+        self.__scorer_given = value is not None
+        if self.segments and self.avgdl is None:
+            self.__bm25_stats(self.df, sum(len(segment) - int(segment.deleted.sum()) for segment in self.segments))
+        self.tfidf = None
+        self.__model_changed()
+
+    def __bounds(self, segment):
+        '''
+        :return: (max_scores, block_max) 当前打分函数下段内每个词的最高得分和压缩倒排表每一块的最高得分，
+            按打分函数保存在segment.bounds中，第一次用到时才计算
+        '''
+        bounds = segment.bounds.get(self.scorer)
+        if bounds is None:
+            bounds = self.scorer.max_scores(self, segment)
+            segment.bounds[self.scorer] = bounds
+        return bounds
+
+    @property
+    def tfidf(self):
+        '''
+        文本（行）-词（列）-权重（内容）的csc矩阵，权重由self.scorer计算（缺省为tf-idf），由各个段拼接而成，第一次访问时计算
+        '''
+        if self.__tfidf is None and self.segments:
+            matrices = []
+            for segment in self.segments:
+                weights = self.scorer.weights_matrix(self, segment).tocoo()
+                matrices.append(csr_matrix((weights.data, (weights.row, np.asarray(segment.term_ids)[weights.col])),
+                                           shape=(len(segment), len(self.word_dict))))
+            self.__tfidf = vstack(matrices, format='csc')
+        return self.__tfidf
+
+    @tfidf.setter
+    def tfidf(self, value):
+        self.__tfidf = value
+
+    @property
+    def tokenizer(self):
+        '''
+        分词器（Tokenizer），缺省时按seg、停用词、stop_flag和用户词汇创建；可以赋值为自定义的Tokenizer，
+        之后add_stopwords()、add_userword()对它无效
+        '''
+        if self.__tokenizer is None:
+            self.__tokenizer = Tokenizer.create(self.seg, self.stopwords, self.stop_flag, self.user_word_path,
+                                                self.my_word_list, self.jieba_dict_cache)
+        return self.__tokenizer
+
+    @tokenizer.setter
+    def tokenizer(self, value):
+        self.__tokenizer = value
+        self.__custom_tokenizer = value is not None
+        self.query_cache.clear()
+
+    def __get_stopwords(self, stop_words):
+        '''
+        停用词文件按utf-8读取，不是utf-8时按gbk（自带的stop_words.txt为gbk），不依赖系统的默认编码
+        '''
+        with open(stop_words, 'rb') as f:
+            content = f.read()
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            content = content.decode('gbk')
+        stopwords = [w.strip() for w in content.splitlines()]
+        return ['', ' '] + stopwords
+
+    def __get_userdict(self, user_words):
+        with open(user_words, 'r', encoding='utf-8') as f:
+            userwords = f.readlines()
+        userwords = [w.strip().split(' ')[0] for w in userwords if w.strip()]
+        return userwords
+
+    def add_stopwords(self, my_stopword_list):
+        '''
+        添加停用词，add_stopwords()使用后，将在下一次self.Train()使用时生效
+        :param my_stopword_list: list[str,str,...,str] 待添加的停用词
+        :return: 成功返回True，失败返回False
+        '''
+        for word in my_stopword_list:
+            if type(word) != str:
+                return False
+        self.stopwords += my_stopword_list
+        self.query_cache.clear()
+        if not self.__custom_tokenizer:
+            self.__tokenizer = None
+        return True
+
+    def add_userword(self, my_word_list):
+        '''
+        添加词汇，用来优化中文分词，使jieba、pkuseg语料库中没有的词能正确切分，
+        add_userword() 使用后，将在下一次self.Train()使用时生效，当self.Train()使用e='e'时，不使用jieba、pkuseg，用户词汇无效。
+        :param my_word_list: list[str,str,...,str] 待添加的分词
+        :return:成功返回True，失败返回False
+        '''
+        self.query_cache.clear()
+        if not self.__custom_tokenizer:
+            self.__tokenizer = None
+        if self.seg == 'jieba':
+            for word in my_word_list:
+                if type(word) != str:
+                    return False
+            self.my_word_list += my_word_list
+            return True
+        else:
+            self.my_word_list += my_word_list
+
+    def __store(self):
+        '''
+        :return: DocStore self.corpus_name为文档库时打开（只打开一次），旧格式（每篇文档一个文件）或没有语料库时为None
+        '''
+        store = self.__doc_store
+        if store is not None and store.path == self.corpus_name:
+            return store
+        if not self.corpus_name or not DocStore.exists(self.corpus_name):
+            return None
+        store = self.__doc_store = DocStore(self.corpus_name)
+        return store
+
+    def __list_documents(self):
+        '''
+        :return: list[str] self.corpus_name中的文档名：文档库中未删除的文档按写入顺序，旧格式为文件夹中的文件
+        '''
+        store = self.__store()
+        if store is not None:
+            return store.live_names()
+        return os.listdir(self.corpus_name)
+
+    def __Path2Corpus(self):
+        store = self.__store()
+        if store is not None:
+            live = store.live()
+            self.files = [store.names[doc_id] for doc_id in live]
+            self.corpus = [store.get(doc_id) for doc_id in live]
+            return None
+        self.files = os.listdir(self.corpus_name)
+        for file in self.files:
+            try:
+                f = open(self.corpus_name + '/' + file, 'r', -1, encoding='utf-8')
+                s = f.read()
+            except:
+                f = open(self.corpus_name + '/' + file, 'r', -1, encoding='gbk')
+                s = f.read()
+            self.corpus.append(s)
+            f.close()
+
+    def __iter_files(self):
+        '''
+        逐个读取self.corpus_name目录下的文档（编码utf-8或gbk），读不出的文档视为空文档
+        '''
+        for index in range(len(self.files)):
+            content = self.__read_document(index)
+            yield content if content != None else ''
+
+    def __cut_stream(self, texts, e=None, workers=None, chunksize=64, positions=False):
+        '''
+        流式切词：每次只从texts中取chunksize篇文档，按原顺序逐篇返回词的列表（list[str]）。self.segment_cache不为None时
+        先按内容的哈希查缓存，只为没有缓存的文档切词，结果写入缓存；workers>1时交给进程池切词，最多同时有2*workers块在进程池中
+        :param positions: bool 为True时逐篇返回(词的列表, 每个词的位置)，见Tokenizer.positioned()
+        '''
+        tokenizer = WhitespaceTokenizer(self.stopwords) if e == 'e' else self.tokenizer
+        cache = self.segment_cache
+        if type(cache) == str:
+            cache = self.segment_cache = SegmentCache(cache)
+        signature = tokenizer.signature() if cache is not None else None
+        parallel = e != 'e' and workers and workers > 1
+        if type(texts) == list and len(texts) <= chunksize:
+            parallel = False
+        texts = iter(texts)
+        chunks = iter(lambda: [text for _, text in zip(range(chunksize), texts)], [])
+        executor = None
+        if parallel:
+            executor = ProcessPoolExecutor(workers, initializer=MySearch._init_query_worker, initargs=(self.seg, tokenizer))
+        else:
+            tokenizer.load()
+        try:
+            pending = deque()
+            for chunk in chunks:
+                keys = [SegmentCache.key(signature, text) for text in chunk] if signature else None
+                units = cache.get_many(keys) if keys else [None] * len(chunk)
+                missing = [text for text, unit in zip(chunk, units) if unit is None]
+                if executor is not None and missing:
+                    pending.append((keys, units, executor.submit(MySearch._corpus_worker_segment, missing).result))
+                else:
+                    segmented = [tokenizer.segment(text) for text in missing]
+                    pending.append((keys, units, lambda segmented=segmented: segmented))
+                while pending and (executor is None or len(pending) >= 2 * workers):
+                    yield from self.__finish_chunk(tokenizer, cache, positions, *pending.popleft())
+            while pending:
+                yield from self.__finish_chunk(tokenizer, cache, positions, *pending.popleft())
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def __finish_chunk(self, tokenizer, cache, positions, keys, units, segmented):
+        '''
+        把新切词的结果填入units并写入缓存，再去停用词
+        :param segmented: 返回没有缓存的文档的切词结果的函数（进程池中为Future.result）
+        '''
+        segmented = iter(segmented())
+        new = []
+        for i in range(len(units)):
+            if units[i] is None:
+                units[i] = next(segmented)
+                if keys:
+                    new.append((keys[i], units[i]))
+        if new:
+            cache.put_many(new)
+        if positions:
+            return [tokenizer.positioned(unit) for unit in units]
+        return [tokenizer.tokens(unit) for unit in units]
+
+    def __count_stream(self, corpus_cut, positions=False):
+        '''
+        逐篇统计词频，增量地建立csr矩阵（与CountVectorizer().fit_transform()结果相同），只保留词表和矩阵的三个数组
+        :param corpus_cut: Iterable[list[str]] 每篇文档的词，见Tokenizer.tokenize()；positions为True时为(词的列表, 位置的列表)，
+            见Tokenizer.positioned()
+        :param positions: bool 为True时同时记录每个词在文档中的位置
+        :return: (scipy.sparse.csr_matrix, dict, np.ndarray) 文本（行）-词（列）-词频（内容）、词表，
+            以及按(词, 文档, 位置)排序的全部位置（positions为False时为None）
+        '''
+        vocabulary = {}
+        indices, data, indptr = array('q'), array('q'), array('q', [0])
+        words_at, rows_at, offsets_at = array('q'), array('q'), array('q')
+        for tokens in corpus_cut:
+            if positions:
+                tokens, offsets = tokens
+            counter = {}
+            for word in tokens:
+                index = vocabulary.setdefault(word, len(vocabulary))
+                counter[index] = counter.get(index, 0) + 1
+            if positions:
+                words_at.extend(vocabulary[word] for word in tokens)
+                rows_at.extend([len(indptr) - 1] * len(tokens))
+                offsets_at.extend(offsets)
+            indices.extend(counter.keys())
+            data.extend(counter.values())
+            indptr.append(len(indices))
+        if not vocabulary:
+            raise ValueError('empty vocabulary; perhaps the documents only contain stop words')
+        terms = sorted(vocabulary)
+        order = np.empty(len(terms), dtype=np.int64)
+        order[np.fromiter((vocabulary[word] for word in terms), dtype=np.int64, count=len(terms))] = np.arange(len(terms))
+        words = csr_matrix((np.frombuffer(data, dtype=np.int64), order[np.frombuffer(indices, dtype=np.int64)],
+                            np.frombuffer(indptr, dtype=np.int64)), shape=(len(indptr) - 1, len(terms)))
+        words.sort_indices()
+        flat = None
+        if positions:
+            columns = order[np.frombuffer(words_at, dtype=np.int64)]
+            rows = np.frombuffer(rows_at, dtype=np.int64)
+            flat = np.frombuffer(offsets_at, dtype=np.int64)
+            flat = flat[np.lexsort((flat, rows, columns))]
+        return words, {word: index for index, word in enumerate(terms)}, flat
+
+    def __top_k(self, documents, scores, top_k=None):
+        '''
+        按得分从大到小排序，top_k不为None时先用np.argpartition选出前top_k个，只对这top_k个排序
+        '''
+        if top_k != None and top_k < len(documents):
+            part = np.argpartition(-scores, top_k - 1)[:top_k] if top_k > 0 else []
+            documents, scores = documents[part], scores[part]
+        order = np.argsort(-scores, kind='stable')
+        return documents[order], scores[order]
+
+    def __show(self, documents, scores, query_list=None, content=True, snippet=None):
+        '''
+        只为documents（已经是要返回的这一页结果）读取内容；content为False且不要snippet时不读取任何文档
+        '''
+        if not len(documents):
+            print('Sorry,the words you queried are not in the corpus')
+            return []
+        res = []
+        for document, score in zip(documents.tolist(), scores.tolist()):
+            res.append({'index': document, 'score': score})
+
+        if self.corpus_name and not self.files:
+            try:
+                self.files = self.__list_documents()
+            except:
+                self.files = []
+        if content or snippet:
+            for document in res:
+                text = self.__get_document(document['index'])
+                if text == None:
+                    continue
+                if content:
+                    document['content'] = text
+                if snippet:
+                    document['snippet'] = self.__snippet(text, query_list or [], snippet)
+
+        if self.files:
+            try:
+                for document in res:
+                    document['filename'] = self.files[document['index']]
+            except:
+                pass
+        return res
+
+    def __get_document(self, index):
+        if self.corpus:
+            return self.corpus[index]
+        elif self.files:
+            trace = _current_trace()
+            if trace is not None:
+                trace.count('files_read')
+            return self.__read_document(index)
+        return None
+
+    def __snippet(self, text, query_list, width):
+        '''
+        截取text中第一个查询词附近约width个字符，查询词用self.highlight标记
+        '''
+        terms = sorted(set(word for word in query_list if word.strip()), key=len, reverse=True)
+        if not terms:
+            return text[:width]
+        pattern = re.compile('|'.join(re.escape(word) for word in terms), re.IGNORECASE)
+        match = pattern.search(text)
+        start = 0
+        if match:
+            start = max(0, match.start() - (width - len(match.group(0))) // 2)
+        end = min(len(text), start + width)
+        start = max(0, end - width)
+        window = pattern.sub(lambda m: self.highlight[0] + m.group(0) + self.highlight[1], text[start:end])
+        return ('...' if start > 0 else '') + window + ('...' if end < len(text) else '')
+
+    def __read_document(self, index):
+        store = self.__store()
+        if store is not None:
+            return store.get_by_name(self.files[index]) if 0 <= index < len(self.files) else None
+        try:
+            f = open(self.corpus_name + '/' + self.files[index], 'r', encoding='utf-8')
+            content = f.read()
+            f.close()
+        except:
+            try:
+                f = open(self.corpus_name + '/' + self.files[index], 'r', encoding='gbk')
+                content = f.read()
+                f.close()
+            except:
+                return None
+        return content
+
+    def __save_select(self, corpus_path):
+        print("%s has existed!"
+              "Choosing to continue will delete the old one!\n"
+              "Maybe you can use 'AddCorpus()' or change another corpus_name.\n"
+              "Do you want to continue?(y/n) :" % corpus_path, end='')
+        choose = input()
+        if choose == 'y' or choose == 'Y':
+            return True
+        else:
+            raise ValueError('User termination.')
+
+    def __creat_corpus(self, corpus_name=None, filename=None, select=None):
+        '''
+        语料库保存为<corpus_name>_corpus文件夹中的文档库（DocStore），self.compress_documents为True时按块压缩。
+        Train()的是一个文件夹时移动该文件夹，其中每篇文档一个文件时再打包为文档库
+        '''
+        self.__doc_store = None
+        if not self.corpus_name:
+            if corpus_name:
+                self.corpus_name = corpus_name
+                if self.corpus_name[-7:] == '_corpus':
+                    self.corpus_name = self.corpus_name[:-7]
+            else:
+                self.corpus_name = time.strftime('%Y%m%d%H%M%S', time.localtime(time.time()))
+            corpus_path = self.corpus_name + '_corpus'
+            if os.path.exists(corpus_path):
+                if select != 'Y':
+                    self.__save_select(corpus_path)
+                shutil.rmtree(corpus_path)
+            self.files = filename
+            if not self.files or len(self.files) != len(self.corpus):
+                if self.files:
+                    print('No filename or filename is not complete')
+                self.files = []
+                for i in range(len(self.corpus)):
+                    self.files.append(str(i)+'.txt')
+            DocStore.create(corpus_path, self.files, self.corpus, self.compress_documents)
+        else:
+            old_path = self.corpus_name
+            if corpus_name:
+                self.corpus_name = corpus_name
+            self.corpus_name = self.corpus_name.replace('\\', '/')
             if '/' in self.corpus_name:
                 self.corpus_name = self.corpus_name.split('/')[-1]
             if self.corpus_name[-7:] == '_corpus':
@@ -321,312 +2427,2092 @@ class MySearch(object):
                 old_path1 = old_path if old_path[-7:] != '_corpus' else old_path[:-7]
                 exist_list = self.__is_corpus_exit(old_path1)
                 if exist_list[1]:
-                    os.unlink(exist_list[1])
+                    self.__unlink_model(exist_list[1])
                 shutil.move(old_path, corpus_path)
+            elif self.corpus and not DocStore.exists(corpus_path):
+                files = os.listdir(old_path)
+                for file in files:
+                    os.unlink(old_path + '/' + file)
+                self.files = files
+                for index in range(len(self.corpus)):
+                    try:
+                        f = open(corpus_path + '/' + files[index], 'w', encoding='utf-8')
+                        f.write(self.corpus[index])
+                        f.close()
+                    except:
+                        try:
+                            f = open(corpus_path + '/' + files[index], 'w', encoding='gbk')
+                            f.write(self.corpus[index])
+                            f.close()
+                        except:
+                            continue
+            packed = DocStore.exists(corpus_path)
+            if not filename or len(filename) != len(self.corpus):
+                if filename:
+                    print('No filename or filename is not complete')
+            elif packed:
+                DocStore(corpus_path).rename(filename)
+                self.files = filename
+            else:
+                self.files = filename
+                files = os.listdir(corpus_path)
+                for index in range(len(files)):
+                    os.rename(corpus_path + '/' + files[index], corpus_path + '/' + filename[index])
+            if not packed:
+                self.__pack_corpus(corpus_path)
+        self.corpus_name = corpus_path
+        return self.corpus_name[:-7]
+
+    def __pack_corpus(self, corpus_path):
+        '''
+        把每篇文档一个文件的语料库文件夹按self.files的顺序打包为文档库，再删除这些文件
+        '''
+        names = [name for name in self.files if os.path.isfile(corpus_path + '/' + name)]
+        if len(self.corpus) == len(self.files) == len(names):
+            texts = self.corpus
+        else:
+            texts = (_read_text(corpus_path + '/' + name) for name in names)
+        DocStore.create(corpus_path, names, texts, self.compress_documents)
+        for name in names:
+            os.unlink(corpus_path + '/' + name)
+
+    def SaveModel(self, corpus_name=None, filename=None, select=None, shards=None):
+        '''
+        self.Train()之后才能self.SaveModel(),否则将出错
+        :param corpus_name:str 保存成名为corpus_name的语料库，缺省时将根据时间生成一个语料库名称
+        :param filename: list[str,str,...,str] 用于给语料文档document命名，缺省时使用原名称，没有原名称时用index
+        :param shards: int 大于1时按文档名的哈希把语料库分成shards个分片保存，用ShardedSearch查询
+        :return:成功将返回True，失败会报错
+        '''
+        if not self.segments:
+            raise ValueError("SaveModel() must be used after Train()")
+        if not self.corpus and not self.corpus_name:
+            raise ValueError("nothing to save after Train(Iterable, stream=True), Train() a directory instead")
+        if shards and shards > 1:
+            return self.__save_shards(corpus_name, filename, select, shards)
+        path = self.__creat_corpus(corpus_name, filename, select)
+        try:
+            self.__write_model(path + '_model')
+        except Exception:
+            # 写模型失败时已保存的模型不受影响，不删除语料库
+            print('save errors! %s_model is unchanged' % path)
+            raise
+        return True
+
+    def __save_shards(self, corpus_name, filename, select, shards):
+        '''
+        按文档名的crc32把文档分到shards个分片，每个分片保存为名为<corpus_name>_shard<i>的语料库，
+        idf、norms和平均文档词数按整个语料库的统计量计算；另写<corpus_name>_shards.json记录各分片的名称
+        '''
+        if not corpus_name:
+            corpus_name = self.corpus_name or time.strftime('%Y%m%d%H%M%S', time.localtime(time.time()))
+        corpus_name = corpus_name.replace('\\', '/').split('/')[-1]
+        if corpus_name[-7:] == '_corpus':
+            corpus_name = corpus_name[:-7]
+        n = sum(len(segment) for segment in self.segments)
+        if filename and len(filename) == n and not [i for i in filename if type(i) != str]:
+            names = list(filename)
+        else:
+            if filename:
+                print('No filename or filename is not complete')
+            names = self.files if len(self.files) == n else [str(i) + '.txt' for i in range(n)]
+        shard_ids = np.array([zlib.crc32(name.encode('utf-8')) % shards for name in names], dtype=np.int64)
+        terms = self.__terms()
+        n_documents = n - sum(int(segment.deleted.sum()) for segment in self.segments)
+        global_stats = (self.word_dict, self.df, n_documents, self.avgdl)
+        shard_names = []
+        for shard in range(shards):
+            parts = []
+            base = 0
+            for segment in self.segments:
+                part = IndexSegment(segment.counts, [], segment.get_terms(terms), positions=segment.positions)
+                part.deleted = segment.deleted | (shard_ids[base:base + len(segment)] != shard)
+                parts.append(part)
+                base += len(segment)
+            rows = np.flatnonzero(~np.concatenate([part.deleted for part in parts]))
+            if not len(rows):
+                continue
+            sub = MySearch(self.seg, self.norm, self.use_idf, self.smooth_idf, self.sublinear_tf, self.scorer)
+            sub.corpus = [self.__get_document(index) or '' for index in rows.tolist()]
+            sub.segments = [IndexSegment.merge(parts, terms)[0]]
+            sub.__update_stats(global_stats=global_stats)
+            shard_name = '%s_shard%d' % (corpus_name, shard)
+            sub.SaveModel(shard_name, [names[index] for index in rows.tolist()], select)
+            shard_names.append(shard_name)
+        manifest = {'format': SHARDS_FORMAT, 'version': 1, 'shards': shard_names, 'documents': n_documents,
+                    'seg': self.seg}
+        with open(corpus_name + '_shards.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(corpus_name + '_shards.json.tmp', corpus_name + '_shards.json')
+        return True
+
+    def __write_model(self, model_path):
+        '''
+        模型保存为文件夹：meta.json记录格式版本、tf-idf参数和段列表；seg_*文件夹为各个段（IndexSegment）的原始词频
+        （和位置索引）和文档名，写入后不再修改；gen_*文件夹为当前这一代的全局统计量（词表vocab_*.npy（TermDict）、df.npy、idf.npy、bm25_idf.npy）
+        和每个段的term_ids、norms、doc_lengths、max_scores、block_max、deleted，平均文档词数avgdl和打分函数记录在meta.json中。
+        已有当前格式的模型时，新段以新的名称写入该文件夹，由__commit()原子地替换meta.json切换到新模型，模型文件夹始终存在。
+        否则（没有模型或文本模型）先写入临时文件夹，把旧模型改名为'.old'后换入新模型，最后才删除旧模型；
+        中途中断时由__is_corpus_exit()在同一个锁（_model_lock()）下恢复旧模型。
+        '''
+        with _model_lock(model_path):
+            self.__write_model_locked(model_path)
+        model_cache.invalidate(model_path[:-6])
+
+    def __write_model_locked(self, model_path):
+        if len(self.files) == sum(len(segment) for segment in self.segments):
+            base = 0
+            for segment in self.segments:
+                segment.files = self.files[base:base + len(segment)]
+                base += len(segment)
+        elif len(self.segments) == 1 and self.segments[0].name == None:
+            self.segments[0].files = self.files
+        old_meta = None
+        if os.path.isfile(model_path + '/meta.json'):
+            try:
+                old_meta = self.__read_meta(model_path)
+            except ValueError:
+                pass
+        terms = self.__terms()
+        if old_meta is not None and old_meta.get('format') == MODEL_FORMAT and old_meta.get('version') == MODEL_VERSION:
+            meta = {'format': MODEL_FORMAT, 'version': MODEL_VERSION, 'generation': old_meta['generation'],
+                    'next_segment': old_meta['next_segment'], 'segments': []}
+            for segment in self.segments:
+                segment.get_terms(terms)
+                segment.name = self.__new_segment(meta)
+                while os.path.exists(model_path + '/' + segment.name):
+                    segment.name = self.__new_segment(meta)
+                segment.save(model_path + '/' + segment.name + '.tmp')
+                os.rename(model_path + '/' + segment.name + '.tmp', model_path + '/' + segment.name)
+            self.__commit(model_path, meta)
+            return
+        tmp_path = model_path + '.tmp'
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.mkdir(tmp_path)
+        meta = {'format': MODEL_FORMAT, 'version': MODEL_VERSION, 'generation': 0, 'next_segment': 1, 'segments': []}
+        for segment in self.segments:
+            segment.get_terms(terms)
+            segment.name = self.__new_segment(meta)
+            segment.save(tmp_path + '/' + segment.name)
+        self.__commit(tmp_path, meta)
+        old_path = model_path + '.old'
+        if os.path.exists(model_path):
+            self.__unlink_model(old_path)
+            os.rename(model_path, old_path)
+        os.rename(tmp_path, model_path)
+        self.__unlink_model(old_path)
+
+    def __new_segment(self, meta):
+        name = 'seg_%06d' % meta['next_segment']
+        meta['next_segment'] += 1
+        return name
+
+    def __read_meta(self, model_path):
+        with open(model_path + '/meta.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def __commit(self, model_path, meta):
+        '''
+        写入新一代（generation）的全局统计量，再原子地替换meta.json，最后删除旧的统计量和不再使用的段。
+        写到一半中断时meta.json仍指向上一代，模型保持完整。
+        '''
+        meta['generation'] += 1
+        gen_path = model_path + '/gen_%06d' % meta['generation']
+        if os.path.exists(gen_path):
+            shutil.rmtree(gen_path)
+        os.mkdir(gen_path)
+        if type(self.word_dict) == dict:
+            self.word_dict = TermDict.from_terms(self.__terms())
+        self.word_dict.save(gen_path)
+        np.save(gen_path + '/df.npy', self.df)
+        if self.idf is not None:
+            np.save(gen_path + '/idf.npy', self.idf)
+        if self.avgdl is None:
+            self.__bm25_stats(self.df, sum(len(segment) - int(segment.deleted.sum()) for segment in self.segments))
+        np.save(gen_path + '/bm25_idf.npy', self.bm25_idf)
+        meta['segments'] = []
+        for segment in self.segments:
+            np.save(gen_path + '/' + segment.name + '.term_ids.npy', segment.term_ids)
+            np.save(gen_path + '/' + segment.name + '.doc_lengths.npy', segment.doc_lengths)
+            max_scores, block_max = self.__bounds(segment)
+            np.save(gen_path + '/' + segment.name + '.max_scores.npy', max_scores)
+            if block_max is not None:
+                np.save(gen_path + '/' + segment.name + '.block_max.npy', block_max)
+            np.save(gen_path + '/' + segment.name + '.deleted.npy', segment.deleted)
+            if segment.norms is not None:
+                np.save(gen_path + '/' + segment.name + '.norms.npy', segment.norms)
+            meta['segments'].append({'name': segment.name, 'documents': len(segment),
+                                     'deleted': int(segment.deleted.sum()), 'weights': segment.weights})
+        meta.update({'version': MODEL_VERSION, 'seg': self.seg, 'norm': self.norm, 'use_idf': self.use_idf,
+                     'smooth_idf': self.smooth_idf, 'sublinear_tf': self.sublinear_tf, 'avgdl': self.avgdl,
+                     'scorer': dict(self.scorer.params(), name=self.scorer.name)})
+        with open(model_path + '/meta.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(model_path + '/meta.json.tmp', model_path + '/meta.json')
+        keep = set(segment.name for segment in self.segments) | {'gen_%06d' % meta['generation'], 'meta.json'}
+        for name in os.listdir(model_path):
+            if name in keep or name[-4:] == '.tmp':
+                continue
+            try:
+                if os.path.isdir(model_path + '/' + name):
+                    shutil.rmtree(model_path + '/' + name)
+                else:
+                    os.unlink(model_path + '/' + name)
+            except OSError:
+                pass
+
+    def __add_segment(self, model_path, segment):
+        '''
+        把新段写入保存好的模型：只写新段和新一代的统计量，已有的段不动
+        '''
+        meta = self.__read_meta(model_path)
+        segment.name = self.__new_segment(meta)
+        if os.path.exists(model_path + '/' + segment.name):
+            shutil.rmtree(model_path + '/' + segment.name)
+        segment.save(model_path + '/' + segment.name + '.tmp')
+        os.rename(model_path + '/' + segment.name + '.tmp', model_path + '/' + segment.name)
+        self.segments.append(segment)
+        self.__update_stats()
+        self.__commit(model_path, meta)
+        model_cache.invalidate(model_path[:-6])
+
+    def __terms(self):
+        '''
+        :return: list[str] 按词序号排列的词表
+        '''
+        terms = [''] * len(self.word_dict)
+        for word, index in self.word_dict.items():
+            terms[index] = word
+        return terms
+
+    def __update_stats(self, rebuild=False, global_stats=None):
+        '''
+        由各个段计算全局统计量：词表self.word_dict、文档频率self.df、self.idf、BM25的self.avgdl和self.bm25_idf，
+        以及每个段的term_ids和norms。idf的计算方法同sklearn的TfidfTransformer，已删除的文档不参与统计。
+        :param rebuild: bool 为True时重新建立词表，去掉不再出现的词
+        :param global_stats: (dict, np.ndarray, int, float) 分片时整个语料库的(词表, 文档频率, 文档数, 平均文档词数)，
+            idf、norms和BM25的统计量按它计算，使各分片的得分与不分片时相同
+        '''
+        if rebuild:
+            terms = self.__terms()
+            for segment in self.segments:
+                segment.get_terms(terms)
+                segment.term_ids = None
+            self.word_dict = {}
+        if [segment for segment in self.segments if segment.term_ids is None] and type(self.word_dict) != dict:
+            self.word_dict = dict(self.word_dict.items())
+        for segment in self.segments:
+            if segment.term_ids is None:
+                segment.term_ids = np.array([self.word_dict.setdefault(word, len(self.word_dict))
+                                             for word in segment.terms], dtype=np.int64)
+        self.df = np.zeros(len(self.word_dict), dtype=np.int64)
+        n_documents = 0
+        for segment in self.segments:
+            self.df[segment.term_ids] += segment.live_df()
+            n_documents += len(segment) - int(segment.deleted.sum())
+        df = self.df
+        avgdl = None
+        if global_stats:
+            word_dict, df, n_documents, avgdl = global_stats
+            df = df[np.array([word_dict[word] for word in self.__terms()], dtype=np.int64)]
+        if type(self.word_dict) == dict:
+            self.word_dict = TermDict.from_terms(self.__terms())
+        self.__bm25_stats(df, n_documents, avgdl)
+        self.idf = None
+        if self.use_idf:
+            with np.errstate(divide='ignore'):
+                self.idf = np.log((n_documents + int(self.smooth_idf)) / (df + int(self.smooth_idf))) + 1
+            self.idf[~np.isfinite(self.idf)] = 0
+        self.files = []
+        for segment in self.segments:
+            segment.compute_norms(self.idf, self.sublinear_tf, self.norm)
+            self.files += segment.files
+        self.tfidf = None
+        self.__model_changed()
+
+    def __bm25_stats(self, df, n_documents, avgdl=None):
+        '''
+        BM25的全局统计量：平均文档词数self.avgdl（avgdl为None时由各个段未删除的文档计算）和self.bm25_idf
+        '''
+        if avgdl is None:
+            lengths = sum(int(np.asarray(segment.doc_lengths)[~segment.deleted].sum()) for segment in self.segments)
+            avgdl = lengths / n_documents if n_documents else 0.0
+        self.avgdl = float(avgdl)
+        self.bm25_idf = np.log(1 + (n_documents - np.asarray(df, dtype=np.float64) + 0.5) / (df + 0.5))
+
+    def __simhash(self, segments):
+        '''
+        :return: list[np.ndarray] 各段的SimHash，没有保存时由词频计算
+        '''
+        terms = self.__terms() if [segment for segment in segments
+                                   if segment.simhash is None and segment.terms is None] else None
+        return [segment.compute_simhash(terms) for segment in segments]
+
+    def __signatures(self):
+        '''
+        :return: np.ndarray(uint64) 全部文档的SimHash，按文档序号，模型改变后重新拼接
+        '''
+        if self.__simhash_cache is None or self.__simhash_cache[0] != self.model_version:
+            simhash = self.__simhash(self.segments)
+            self.__simhash_cache = (self.model_version, np.concatenate(simhash) if simhash else np.empty(0, np.uint64))
+        return self.__simhash_cache[1]
+
+    def __idf_of(self, terms):
+        '''
+        :return: np.ndarray 这些词按当前模型的文档频率计算的idf（同_simhash()），模型中没有的词文档频率为0，
+            AddCorpus()时新文档的SimHash与已有的文档按同样的权重计算
+        '''
+        n_documents = sum(len(segment) - int(segment.deleted.sum()) for segment in self.segments)
+        ids = [self.word_dict.get(word) for word in terms]
+        df = np.array([0 if index is None else self.df[index] for index in ids], dtype=np.float64)
+        return np.log((n_documents + 1) / (df + 1)) + 1
+
+    def __drop_duplicates(self, segment):
+        '''
+        去重：segment中与之前的文档（self.segments中其它段未删除的文档，以及segment中排在前面的文档）的SimHash海明距离
+        不超过self.dedup_distance的文档标记为已删除，同DelDocument()
+        :return: list[(int, int)] 去掉的文档的段内序号，及与之重复的文档的序号（其它段按顺序在前，segment中的文档接在后面）
+        '''
+        others = [other for other in self.segments if other is not segment]
+        base = sum(len(other) for other in others)
+        if others:
+            live = np.flatnonzero(~np.concatenate([other.deleted for other in others]))
+            index = SimHashIndex(self.dedup_distance, np.concatenate(self.__simhash(others))[live], live.tolist())
+        else:
+            index = SimHashIndex(self.dedup_distance)
+        simhash = self.__simhash([segment])[0]
+        rows = np.flatnonzero(~segment.deleted)
+        found = index.find_initial(simhash[rows]) if len(index) else [None] * len(rows)
+        duplicates = [(row, key) for row, key in zip(rows.tolist(), found) if key is not None]
+        rows = rows[np.array([key is None for key in found], dtype=bool)]
+        duplicates += [(int(rows[i]), base + int(rows[j])) for i, j in index.find_duplicates(simhash[rows])]
+        for row, _ in duplicates:
+            segment.deleted[row] = True
+        return sorted(duplicates)
+
+    def __model_changed(self):
+        '''
+        模型重新训练或重新读入后调用：模型版本号加一，清空查询结果缓存
+        '''
+        self.model_version += 1
+        self.result_cache.clear()
+
+    def __incremental(self):
+        '''
+        模型的每个段都保存了原始词频时才能增量更新（旧版本的模型只有tf-idf权重）
+        '''
+        return bool(self.segments) and not [segment for segment in self.segments if segment.weights]
+
+    def __pick_merge(self):
+        '''
+        合并策略：文档数处于同一数量级（以merge_factor为底）的段达到merge_factor个时，合并这些段；
+        已删除文档的比例超过compact_ratio的段单独重写
+        :return: list[str] 需要合并的段名
+        '''
+        tiers = {}
+        for segment in self.segments:
+            if segment.deleted.sum() > self.compact_ratio * len(segment):
+                return [segment.name]
+            tier = int(math.log(max(len(segment), 1), self.merge_factor))
+            tiers.setdefault(tier, []).append(segment.name)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier]
+        return []
+
+    def __merge(self, corpus_name, names=None):
+        '''
+        合并保存好的模型中的段。合并时不持有锁（只读取不变的段文件），提交前检查这些段在此期间新删除的文档。
+        '''
+        model_path = corpus_name + '_model'
+        lock = _model_lock(model_path)
+        with lock:
+            search = MySearch(self.seg)
+            search.merge_factor = self.merge_factor
+            search.compact_ratio = self.compact_ratio
+            search.use_model(corpus_name)
+            if not search.__incremental():
+                return False
+            if [segment for segment in search.segments if segment.name == None]:
+                search.__write_model(model_path)
+            if names == None:
+                names = search.__pick_merge()
+            chosen = [segment for segment in search.segments if segment.name in names]
+            if not chosen or (len(chosen) == 1 and not chosen[0].deleted.any()):
+                return False
+            terms = search.__terms()
+            snapshots = [segment.deleted.copy() for segment in chosen]
+        merged, mappings = IndexSegment.merge(chosen, terms)
+        with lock:
+            current = MySearch(self.seg)
+            current.use_model(corpus_name)
+            segments = dict((segment.name, segment) for segment in current.segments)
+            if [segment for segment in chosen if segment.name not in segments]:
+                return False
+            for segment, snapshot, mapping in zip(chosen, snapshots, mappings):
+                rows = np.flatnonzero(segments[segment.name].deleted & ~snapshot)
+                merged.deleted[mapping[rows]] = True
+            merged.get_terms()
+            meta = self.__read_meta(model_path)
+            merged.name = self.__new_segment(meta)
+            merged.save(model_path + '/' + merged.name + '.tmp')
+            os.rename(model_path + '/' + merged.name + '.tmp', model_path + '/' + merged.name)
+            position = current.segments.index(segments[chosen[0].name])
+            current.segments = [segment for segment in current.segments if segment.name not in names]
+            current.segments.insert(position, merged)
+            current.__update_stats()
+            current.__commit(model_path, meta)
+            model_cache.invalidate(corpus_name)
+        return True
+
+    def __merge_all(self, corpus_name):
+        merged = False
+        while self.__merge(corpus_name):
+            merged = True
+        return merged
+
+    def MergeSegments(self, corpus_name=None, background=False):
+        '''
+        按合并策略（见merge_factor、compact_ratio）合并保存好的语料库中的段，AddCorpus()/DelDocument()之后会自动在后台调用
+        :param corpus_name: str  语料库名，缺省时为self.corpus_name
+        :param background: bool 为True时在后台线程中合并，立即返回该线程
+        :return: 合并了返回True，不需要合并返回False；background为True时返回threading.Thread
+        '''
+        if not corpus_name:
+            corpus_name = self.corpus_name
+        if corpus_name[-7:] == '_corpus':
+            corpus_name = corpus_name[:-7]
+        if background:
+            thread = threading.Thread(target=self.__merge_all, args=(corpus_name,))
+            thread.start()
+            return thread
+        return self.__merge_all(corpus_name)
+
+    def __unlink_model(self, model_path):
+        if os.path.isdir(model_path):
+            shutil.rmtree(model_path)
+        elif os.path.exists(model_path):
+            os.unlink(model_path)
+
+    def AddCorpus(self, corpus_name, corpus_name2=None, filename=None):
+        '''
+        向corpus_name指定的语料库中添加语料文档，语料文档来自corpus_name2指定的语料库，当corpus_name2为None时，
+        默认为self.Train()生成的检索模型和其语料库。filename参数可用于给新添加的文档命名，格式错误时视为没有该参数,
+        默认为保存原名称或者按其在原语料库中的Index序号命名。另，名称与新语料库中的名称相同时，将增加‘-副本’后缀
+        新文档的原始词频直接写成模型中的一个新段，只重新计算全局idf和归一化，不重新切词，已有的段不动；
+        段的数量多了以后在后台合并（见MergeSegments()）。旧版本的模型（只有tf-idf权重）将重新训练整个语料库。
+        self.dedup为True时，与语料库中已有文档或前面的新文档近似重复的新文档不添加，记录在self.duplicates中（按文档名）。
+        :param corpus_name1: name of Corpus1    str
+        :param corpus_name2: name of Corpus2    str
+        :param filename: filename of Corpus2's file     list [str,str...]
+        :return: 成功返回True，失败将报错
+        '''
+        if corpus_name[-7:] == '_corpus':
+            corpus_name = corpus_name[:-7]
+        exist_list = self.__is_corpus_exit(corpus_name)
+        if not exist_list[0]:
+            raise ValueError('no corpus found, %s' % (corpus_name + '_corpus'))
+        if not exist_list[1]:
+            raise ValueError('no model found, %s' % (corpus_name + '_model'))
+        corpus_path = exist_list[0]
+        if corpus_name2:
+            if corpus_name2[-7:] == '_corpus':
+                corpus_name2 = corpus_name2[:-7]
+            source = MySearch(self.seg)
+            source.use_model(corpus_name2)
+        elif not self.segments:
+            raise ValueError('AddCorpus() must be used after Train() when corpus_name2 is None')
+        elif not self.corpus and not self.corpus_name:
+            raise ValueError("nothing to add after Train(Iterable, stream=True), Train() a directory instead")
+        else:
+            source = self
+        live = []
+        base = 0
+        for segment in source.segments:
+            live += (np.flatnonzero(~segment.deleted) + base).tolist()
+            base += len(segment)
+        if source.corpus:
+            contents = [source.corpus[index] for index in live]
+        else:
+            contents = [source.__read_document(index) for index in live]
+        if len(source.files) == base:
+            names = [source.files[index] for index in live]
+        else:
+            names = [str(index) + '.txt' for index in live]
+        if filename:
+            if len(filename) != len(names) or [i for i in filename if type(i) != str]:
+                print('No filename or filename is not complete')
+            else:
+                names = list(filename)
+        model_path = exist_list[1]
+        with _model_lock(model_path):
+            target = MySearch(self.seg)
+            target.use_model(corpus_name)
+            incremental = target.__incremental() and source.__incremental()
+            duplicates = []
+            if incremental:
+                segment = IndexSegment.merge(source.segments, source.__terms())[0]
+                segment.simhash = None
+                segment.compute_simhash(idf=target.__idf_of(segment.terms))
+                if self.dedup:
+                    target.dedup_distance = self.dedup_distance
+                    duplicates = target.__drop_duplicates(segment)
+                if duplicates:
+                    kept = np.flatnonzero(~segment.deleted).tolist()
+                    dropped_names = [names[row] for row, _ in duplicates]
+                    names = [names[row] for row in kept]
+                    contents = [contents[row] for row in kept]
+                    segment = IndexSegment.merge([segment])[0]
+            store = DocStore(corpus_path) if DocStore.exists(corpus_path) else None
+            files2 = set(store.live_names() if store is not None else os.listdir(corpus_path))
+            for i in range(len(names)):
+                while names[i] in files2:
+                    names[i] = names[i].split('.')[0] + '-副本.' + names[i].split('.')[1] if '.' in names[i] else names[i] + '-副本'
+                files2.add(names[i])
+                if store is None:
+                    with open(corpus_path + '/' + names[i], 'w', encoding='utf-8') as f:
+                        f.write(contents[i] or '')
+            if store is not None:
+                store.append(names, contents)
+            self.duplicates = []
+            if duplicates:
+                base = sum(len(segment) for segment in target.segments)
+                old_names = target.files if len(target.files) == base else [str(index) for index in range(base)]
+                new_names = dict(zip(kept, names))
+                self.duplicates = [(name, old_names[found] if found < base else new_names[found - base])
+                                   for name, (_, found) in zip(dropped_names, duplicates)]
+            if incremental:
+                if [segment for segment in target.segments if segment.name == None]:
+                    target.__write_model(model_path)
+                segment.files = names
+                if len(segment):
+                    target.__add_segment(model_path, segment)
+            else:
+                NewSearch = MySearch(self.seg)
+                NewSearch.segment_cache = self.segment_cache
+                NewSearch.jieba_dict_cache = self.jieba_dict_cache
+                NewSearch.dedup = self.dedup
+                NewSearch.dedup_distance = self.dedup_distance
+                if self.__custom_tokenizer:
+                    NewSearch.tokenizer = self.tokenizer
+                NewSearch.Train(corpus_path)
+                if len(NewSearch.files) == sum(len(segment) for segment in NewSearch.segments):
+                    self.duplicates = [(NewSearch.files[row], NewSearch.files[found])
+                                       for row, found in NewSearch.duplicates]
+                NewSearch.SaveModel(select='Y')
+                target = NewSearch
+        target.merge_factor = self.merge_factor
+        target.compact_ratio = self.compact_ratio
+        if self.background_merge and target.__pick_merge():
+            self.MergeSegments(corpus_name, background=True)
+        print('Added!')
+        return True
+
+    def GetDefaultCorpusName(self):
+        '''
+        :return: str
+                当前默认的搜索库名称，如果失败将返回False
+        '''
+        try:
+            f = open('venv/default_corpus', 'r', encoding='utf-8')
+            default_corpus = f.read()
+            f.close()
+        except:
+            print('Get default_corpus error! '
+                             'Make sure venv/default_corpus exist')
+            return False
+        return default_corpus
+
+    def AdjustDefaultCorpus(self, default_corpus=None):
+        '''
+        调整默认搜索库，参数为新库名称,缺省时使用当前class的corpus_name。
+        有默认搜索库时，将调整为新搜索库，没有默认搜索库时将设置。
+        :param default_corpus: str,
+                    name of the new default corpus
+        :return: 成功返回True，失败返回False
+        '''
+        if default_corpus == None and self.corpus_name:
+            default_corpus = self.corpus_name
+        elif default_corpus == None:
+            ValueError("Missing name of default corpus!")
+        exist_list = self.__is_corpus_exit(default_corpus)
+        if not exist_list[0]:
+            print('Adjust default corpus failed!'
+                             'Make sure "%s_corpus" exist.\n'
+                  'Maybe you can use "SaveModel()" first.' % default_corpus)
+            return False
+        elif not exist_list[1]:
+            print('Adjust default corpus failed!'
+                             'Make sure "%s_model" exist.\n'
+                  'Maybe you can use "SaveModel()" first.' % default_corpus)
+            return False
+        else:
+            f = open('venv/default_corpus', 'w', encoding='utf-8')
+            f.write(default_corpus)
+            f.close()
+            return True
+
+    def __is_corpus_exit(self, corpus_name=None):
+        if corpus_name == None:
+            corpus_name = self.GetDefaultCorpusName()
+        corpus_path = corpus_name + '_corpus'
+        model_path = corpus_name + '_model'
+        fs = os.listdir('.')
+        if model_path not in fs and model_path + '.old' in fs:
+            # __write_model()在换入新模型前中断，恢复旧模型；持有写模型时的锁，不与正在换入的__write_model()冲突
+            with _model_lock(model_path):
+                if not os.path.exists(model_path) and os.path.exists(model_path + '.old'):
+                    os.rename(model_path + '.old', model_path)
+            fs = os.listdir('.')
+        exist_list = [corpus_path in fs, model_path in fs]
+        if exist_list[0]:
+            exist_list[0] = corpus_path
+        if exist_list[1]:
+            exist_list[1] = model_path
+        return exist_list
+
+    def __generate_csc_matrix(self, model_path):
+        '''
+        读取SaveModel()保存的模型，各个段的数组以np.memmap方式打开，多个进程可共享同一份页缓存。
+        旧版本的文本模型文件仍可读取，读入后为一个只有tf-idf权重的未命名段，AddCorpus()/DelDocument()时重新训练，
+        SaveModel()时保存为当前格式。其他格式或版本的模型报错。
+        '''
+        self.segments = []
+        if not os.path.isdir(model_path):
+            with open(model_path, 'r', encoding='utf-8') as f:
+                sparse_matrix_saved = ast.literal_eval(f.read())
+            self.word_dict = sparse_matrix_saved[2]
+            segment = IndexSegment(csc_matrix(sparse_matrix_saved[0], sparse_matrix_saved[1]), [], weights=True)
+            segment.term_ids = np.arange(segment.counts.shape[1])
+            self.segments.append(segment)
+            self.__update_stats()
+            return None
+        meta = self.__read_meta(model_path)
+        if meta.get('format') != MODEL_FORMAT or meta.get('version') != MODEL_VERSION:
+            raise ValueError('unsupported model format, %s' % model_path)
+        self.norm = meta['norm']
+        self.use_idf = meta['use_idf']
+        self.smooth_idf = meta['smooth_idf']
+        self.sublinear_tf = meta['sublinear_tf']
+        gen_path = model_path + '/gen_%06d' % meta['generation']
+        self.word_dict = TermDict.load(gen_path)
+        self.df = _load_array(gen_path + '/df.npy')
+        self.idf = _load_array(gen_path + '/idf.npy') if os.path.exists(gen_path + '/idf.npy') else None
+        self.avgdl = meta['avgdl']
+        self.bm25_idf = _load_array(gen_path + '/bm25_idf.npy')
+        self.files = []
+        saved_scorer = Scorer.create(meta['scorer'])
+        for info in meta['segments']:
+            segment = IndexSegment.load(model_path + '/' + info['name'], info['documents'], info['name'],
+                                        info['weights'])
+            segment.term_ids = _load_array(gen_path + '/' + info['name'] + '.term_ids.npy')
+            segment.deleted = np.load(gen_path + '/' + info['name'] + '.deleted.npy', mmap_mode='c')
+            segment.doc_lengths = _load_array(gen_path + '/' + info['name'] + '.doc_lengths.npy')
+            if os.path.exists(gen_path + '/' + info['name'] + '.norms.npy'):
+                segment.norms = _load_array(gen_path + '/' + info['name'] + '.norms.npy')
+            # 写入时段还没有压缩的倒排表则没有block_max，第一次剪枝查询时重新计算上界
+            if os.path.exists(gen_path + '/' + info['name'] + '.block_max.npy'):
+                segment.bounds[saved_scorer] = (_load_array(gen_path + '/' + info['name'] + '.max_scores.npy'),
+                                                _load_array(gen_path + '/' + info['name'] + '.block_max.npy'))
+            self.segments.append(segment)
+            self.files += segment.files
+        if not self.__scorer_given:
+            self.__scorer = saved_scorer
+        self.tfidf = None
+        self.__model_changed()
+        return meta
+
+    def use_model(self, corpus_name=None):
+        if corpus_name == None:
+            corpus_name = self.GetDefaultCorpusName()
+        exist_list = self.__is_corpus_exit(corpus_name)
+        if not exist_list[0]:
+            raise ValueError('no corpus found, %s' % (corpus_name + '_corpus'))
+        if not exist_list[1]:
+            raise ValueError('no model found, %s' % (corpus_name + '_model'))
+        self.corpus_name = exist_list[0]
+        self.corpus = []
+        if not self.__generate_csc_matrix(exist_list[1]):
+            self.files = self.__list_documents()
+            self.segments[0].files = self.files
+        if sum(len(segment) for segment in self.segments) != len(self.files) or not len(self.word_dict):
+            raise ValueError("Error! Corpus was destroyed!\n"
+                             "Suggest you .Train() the corpus.")
+
+    def __del_corpus(self, corpus_name=None):
+        if corpus_name == None:
+            corpus_name = self.corpus_name
+        if corpus_name[-7:] == '_corpus':
+            corpus_name = corpus_name[:-7]
+        if corpus_name[-6:] == '_model':
+            corpus_name = corpus_name[:-6]
+        if corpus_name[-10:] == '_model':
+            corpus_name = corpus_name[:-10]
+        files = os.listdir('.')
+        model_cache.invalidate(corpus_name)
+        self.__doc_store = None
+        try:
+            if corpus_name + '_corpus' in files:
+                shutil.rmtree(corpus_name + '_corpus')
+            if corpus_name + '_model' in files:
+                self.__unlink_model(corpus_name + '_model')
+        except:
+            pass
+        else:
+            return corpus_name + '_corpus and ' + corpus_name + '_model'
+
+    def RemoveCorpus(self, corpus_name=None):
+        '''
+        删除保存好的语料库，参数为None时删除self.corpus_name指定的语料库，语料库不存在将报错
+        :param corpus_name:想要删除的语料库名称
+        :return:成功返回True,失败将报错
+        '''
+        res = self.__del_corpus(corpus_name)
+        if res:
+            print("%s have Removed!" % res)
+            return True
+        else:
+            ValueError('Remove Error!')
+
+    def DelDocument(self, documents, corpus_name=None):
+        '''
+        删除保存好的语料库的部分语料文档document，未保存（SaveModel()）不能删除
+        只把文档标记为已删除并重新计算全局idf和归一化，不重新训练；已删除文档较多的段在后台重写（见MergeSegments()），
+        重写后文档序号会改变。旧版本的模型（只有tf-idf权重）将重新训练整个语料库。
+        :param documents: list[str,str,...,str] 待删除的语料文档document的文件名
+        :param corpus_name: str  语料库名
+        :return: 成功将返回True,失败会报错
+        '''
+        if not corpus_name:
+            corpus_name = self.corpus_name
+        if corpus_name[-7:] == '_corpus':
+            corpus_name = corpus_name[:-7]
+        exist_list = self.__is_corpus_exit(corpus_name)
+        if not exist_list[0]:
+            raise ValueError('no corpus found, %s' % (corpus_name + '_corpus'))
+        if not exist_list[1]:
+            raise ValueError('no model found, %s' % (corpus_name + '_model'))
+        for file in documents:
+            if type(file) != str:
+                raise ValueError("The element of parameter 1 must be 'str' type,representing the name of the file to be deleted.")
+        corpus_path = exist_list[0]
+        model_path = exist_list[1]
+        with _model_lock(model_path):
+            target = MySearch(self.seg)
+            target.use_model(corpus_name)
+            store = DocStore(corpus_path) if DocStore.exists(corpus_path) else None
+            files2 = set(store.live_names() if store is not None else os.listdir(corpus_path))
+            rows = {}
+            for segment in target.segments:
+                for index in np.flatnonzero(~segment.deleted).tolist():
+                    rows[segment.files[index]] = (segment, index)
+            for file in documents:
+                if file not in files2:
+                    print(file + 'not in ' + (corpus_path + '/'))
+                    continue
+                files2.discard(file)
+                if store is not None:
+                    store.delete([file])
+                else:
+                    os.unlink(corpus_path + '/' + file)
+                if file in rows:
+                    rows[file][0].deleted[rows[file][1]] = True
+            if target.__incremental():
+                if [segment for segment in target.segments if segment.name == None]:
+                    target.__update_stats()
+                    target.__write_model(model_path)
+                else:
+                    target.__update_stats()
+                    target.__commit(model_path, self.__read_meta(model_path))
+                    model_cache.invalidate(corpus_name)
             else:
-                files = os.listdir(old_path)
-                for file in files:
-                    os.unlink(old_path + '/' + file)
-                for index in range(len(self.corpus)):
-                    try:
-                        f = open(corpus_path + '/' + files[index], 'w', encoding='utf-8')
-                        f.write(self.corpus[index])
-                        f.close()
-                    except:
-                        try:
-                            f = open(corpus_path + '/' + files[index], 'w', encoding='gbk')
-                            f.write(self.corpus[index])
-                            f.close()
-                        except:
-                            continue
-            if not filename or len(filename) != len(self.corpus):
-                if filename:
-                    print('No filename or filename is not complete')
+                NewSearch = MySearch(self.seg)
+                NewSearch.segment_cache = self.segment_cache
+                NewSearch.jieba_dict_cache = self.jieba_dict_cache
+                NewSearch.dedup = self.dedup
+                NewSearch.dedup_distance = self.dedup_distance
+                if self.__custom_tokenizer:
+                    NewSearch.tokenizer = self.tokenizer
+                NewSearch.Train(corpus_path)
+                NewSearch.SaveModel(select='Y')
+                target = NewSearch
+        target.merge_factor = self.merge_factor
+        target.compact_ratio = self.compact_ratio
+        if self.background_merge and target.__pick_merge():
+            self.MergeSegments(corpus_name, background=True)
+        print('Deleted!')
+        return True
+
+    def CompactCorpus(self, corpus_name=None):
+        '''
+        压缩保存好的语料库：把所有段合并为一个，真正删除DelDocument()标记删除的文档和不再出现的词，压缩后文档序号会改变
+        :param corpus_name: str  语料库名，缺省时为self.corpus_name
+        :return: 成功将返回True,失败会报错
+        '''
+        if not corpus_name:
+            corpus_name = self.corpus_name
+        if corpus_name[-7:] == '_corpus':
+            corpus_name = corpus_name[:-7]
+        with _model_lock(corpus_name + '_model'):
+            target = MySearch(self.seg)
+            target.use_model(corpus_name)
+            if not target.__incremental():
+                raise ValueError('%s_model has no term counts, Train() and SaveModel() it again first.' % corpus_name)
+            target.segments = [IndexSegment.merge(target.segments, target.__terms())[0]]
+            target.__update_stats(rebuild=True)
+            target.__write_model(corpus_name + '_model')
+            if DocStore.exists(corpus_name + '_corpus'):
+                DocStore(corpus_name + '_corpus').compact()
+        return True
+
+    def Train(self, argc, e=None, workers=None, stream=False, positions=False):
+        if stream:
+            if type(argc) == str:
+                self.corpus_name = argc
+                self.files = self.__list_documents()
+                self.corpus = []
+                texts = self.__iter_files()
             else:
-                self.files = filename
-                files = os.listdir(corpus_path)
-                for index in range(len(files)):
-                    os.rename(corpus_path + '/' + files[index], corpus_path + '/' + filename[index])
-        self.corpus_name = corpus_path
-        return self.corpus_name[:-7]
+                texts = argc
+            words, vocabulary, flat = self.__count_stream(self.__cut_stream(texts, e, workers, positions=positions),
+                                                          positions)
+        else:
+            if type(argc) == str:
+                self.corpus_name = argc
+                self.__Path2Corpus()
+            elif isinstance(argc, Iterable):
+                self.corpus = argc
+            corpus_cut = list(self.__cut_stream(list(self.corpus), e, workers, positions=positions))
+
+            if positions:
+                words, vocabulary, flat = self.__count_stream(corpus_cut, positions)
+            else:
+                from sklearn.feature_extraction.text import CountVectorizer
+                vectorizer = CountVectorizer(analyzer=list)
+                words = vectorizer.fit_transform(corpus_cut)
+                vocabulary = vectorizer.vocabulary_
+        terms = [''] * len(vocabulary)
+        for word, index in vocabulary.items():
+            terms[index] = word
+        files = self.files if len(self.files) == words.shape[0] else []
+        counts = words.tocsc()
+        self.segments = [IndexSegment(counts, files, terms, positions=Positions.encode(counts, flat) if positions else None)]
+        self.word_dict = {}
+        self.duplicates = self.__drop_duplicates(self.segments[0]) if self.dedup else []
+        self.__update_stats()
+
+        return words
+
+    def __get_scores(self, query_list, top_k=None, documents=None):
+        '''
+        每个段中查询词对应的倒排表按self.scorer计算词频权重，乘以其在查询中的权重（次数x idf）后求和，再乘以各文档的系数
+        （tf-idf为1/norms），各段的得分按段的顺序拼接。top_k不为None且self.pruning为True时各段用__max_score()剪枝，
+        前一个段的第top_k个得分作为下一个段的初始阈值。
+        :param documents: np.ndarray 从小到大的文档序号，不为None时只为这些文档打分（布尔查询），见__score_documents()
+        :return: (documents, scores) 得分不为0的文档序号及其得分，均为np.ndarray；剪枝时不可能进入前top_k的文档得分可能不完整
+        '''
+        columns = {}
+        for word in query_list:
+            index = self.word_dict.get(word)
+            if index != None:
+                columns[index] = columns.get(index, 0) + 1
+        weights = np.fromiter(columns.values(), dtype=np.float64, count=len(columns))
+        columns = np.fromiter(columns.keys(), dtype=np.int64, count=len(columns))
+        if documents is not None:
+            return documents, self.__score_documents(columns, weights, documents)
+        if not len(columns):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        idf = self.scorer.idf(self)
+        trace = _current_trace()
+        pruning = bool(top_k) and self.pruning and len(columns) > 1
+        best = np.empty(0)
+        res_documents, res_scores = [], []
+        base = 0
+        for segment in self.segments:
+            local, found = segment.columns(columns)
+            if len(local):
+                query_weights = weights[found]
+                if idf is not None and not segment.weights:
+                    query_weights = query_weights * idf[columns[found]]
+                if pruning and len(local) > 1:
+                    threshold = best[-top_k] if len(best) >= top_k else 0.0
+                    scores = self.__max_score(segment, local, query_weights, top_k, threshold)
+                else:
+                    scores = self.scorer.score(self, segment, local, query_weights)
+                    if trace is not None:
+                        trace.count('postings', int(segment.column_lengths(local).sum()))
+                documents = np.flatnonzero(scores)
+                res_documents.append(documents + base)
+                res_scores.append(scores[documents])
+                if pruning and segment is not self.segments[-1]:
+                    best = np.concatenate([best, scores[documents]])
+                    best = np.sort(best if len(best) <= top_k else np.partition(best, -top_k)[-top_k:])
+            base += len(segment)
+        if not res_documents:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(res_documents), np.concatenate(res_scores)
+
+    def __score_documents(self, columns, weights, documents):
+        '''
+        只为documents打分：每个查询词只查找这些文档（压缩的倒排表只解码它们所在的块），满足布尔条件的文档很少时远快于为全部文档打分
+        :param columns: np.ndarray 全局词序号
+        :param weights: np.ndarray 每个词在查询中的次数
+        :return: np.ndarray 与documents一一对应的得分，可能为0（例如只有NOT的查询）
+        '''
+        idf = self.scorer.idf(self)
+        trace = _current_trace()
+        scores = np.zeros(len(documents))
+        bounds = np.searchsorted(documents, np.cumsum([0] + [len(segment) for segment in self.segments]))
+        base = 0
+        for segment, begin, end in zip(self.segments, bounds[:-1].tolist(), bounds[1:].tolist()):
+            local, found = segment.columns(columns)
+            if len(local) and end > begin:
+                rows_wanted = documents[begin:end] - base
+                query_weights = weights[found]
+                if idf is not None and not segment.weights:
+                    query_weights = query_weights * idf[columns[found]]
+                part = np.zeros(end - begin)
+                for column, weight in zip(local.tolist(), query_weights.tolist()):
+                    rows, tf = segment.lookup(column, rows_wanted)
+                    part[np.searchsorted(rows_wanted, rows)] += self.scorer.tf_weights(self, segment, rows, tf) * weight
+                    if trace is not None:
+                        trace.count('postings', len(rows))
+                scores[begin:end] = part * self.scorer.scale(self, segment)[rows_wanted]
+            base += len(segment)
+        return scores
+
+    def __max_score(self, segment, columns, query_weights, top_k, threshold=0.0):
+        '''
+        MaxScore剪枝：每个词的得分上界为查询词权重x该词在段内的最高得分（见__bounds()）。按倒排表从短到长逐词累加得分，剩下的词上界之和
+        小于当前第top_k个得分（阈值）时，只出现这些词的文档不可能进入前top_k，之后只为已有得分、且加上剩余上界仍不小于阈值的
+        候选文档查找剩下的词；压缩的倒排表再按块的最高得分（block_max）去掉候选文档，只解码剩下的候选文档所在的块。
+        阈值只用已经算出的部分得分，是真实第top_k个得分的下界，剪掉的文档一定不在前top_k中。
+        :param threshold: float 已知的第top_k个得分的下界（前面的段）
+        :return: np.ndarray 段内每个文档的得分，前top_k个准确，其余文档的得分可能不完整
+        '''
+        max_scores, block_max = self.__bounds(segment)
+        bounds = query_weights * np.asarray(max_scores)[columns]
+        order = np.lexsort((-bounds, segment.column_lengths(columns)))
+        columns, query_weights, bounds = columns[order], query_weights[order], bounds[order]
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1], [0.0]])
+        scale = self.scorer.scale(self, segment)
+        trace = _current_trace()
+        scores = np.zeros(len(segment))
+        margin = 1 - 1e-9
+        essential = len(columns)
+        for i in range(len(columns)):
+            if remaining[i] < threshold * margin:
+                essential = i
+                break
+            rows, tf, lengths = segment.decode(columns[i:i + 1])
+            if trace is not None:
+                trace.count('postings', len(rows))
+            weights = self.scorer.tf_weights(self, segment, rows, tf) * query_weights[i]
+            if len(rows) * 8 < len(scores):
+                scores[rows] += weights
+            else:
+                scores += np.bincount(rows, weights=weights, minlength=len(scores))
+            if i + 1 < len(columns) and len(rows) >= top_k:
+                threshold = max(threshold, np.partition(scores[rows] * scale[rows], -top_k)[-top_k])
+        scores *= scale
+        if essential == len(columns):
+            return scores
+        candidates = np.flatnonzero(scores + remaining[essential] >= threshold * margin)
+        for i in range(essential, len(columns)):
+            if not len(candidates):
+                break
+            blocks = segment.find_blocks(columns[i], candidates)
+            if blocks is not None:
+                block_bounds = np.where(blocks >= 0, np.asarray(block_max)[blocks], 0) * query_weights[i]
+                candidates = candidates[scores[candidates] + block_bounds + remaining[i + 1] >= threshold * margin]
+            rows, tf = segment.lookup(columns[i], candidates)
+            if trace is not None:
+                trace.count('postings', len(rows))
+            scores[rows] += self.scorer.tf_weights(self, segment, rows, tf) * query_weights[i] * scale[rows]
+            if len(candidates) >= top_k:
+                threshold = max(threshold, np.partition(scores[candidates], -top_k)[-top_k])
+            candidates = candidates[scores[candidates] + remaining[i + 1] >= threshold * margin]
+        return scores
+
+    def Query(self, query_str, corpus_name=None, top_k=None, offset=0, content=True, snippet=None, collapse=False,
+              boolean=False):
+        '''
+        查询函数
+        :param query_str: str query_str为查询字符串
+        :param corpus_name: str corpus_name为查询语料库名称，corpus_name为None时优先查询self.Train(),
+        其次查询默认语料库，若corpus_name不为空，则查询corpus_name指向的语料库，若没有该语料库将出错。
+        :param top_k: int 只返回得分最高的top_k个结果，缺省时返回全部结果
+        :param offset: int 跳过得分最高的offset个结果，与top_k一起用于分页（第n页为offset=n*top_k）
+        :param content: bool 为False时不读取文档内容，需要时再用GetDocument()读取
+        :param snippet: int 不为None时为每个结果截取约snippet个字符的摘要，查询词用self.highlight标记
+        :param collapse: bool或int 为True或int时合并近似重复的结果：SimHash与得分更高的某个结果的海明距离不超过collapse
+            （为True时为self.dedup_distance）的结果并入该结果，不占top_k的名额
+        :param boolean: bool 为True时解析布尔查询（AND、OR、NOT和括号），见__parse_query()；缺省时只解析双引号的短语
+        :return: list[dict,dict,...,dict]
+            其中dict{'index', 'score', 'content'} or dict{'index', 'score', 'filename', 'content'}，
+            有snippet参数时还有'snippet'，有collapse参数时还有'duplicates'（并入的结果的文档序号）。只为返回的这一页结果读取文档
+        注：以'_corpus'结尾的文件夹将被作为保存好的语料库，文件夹名即为语料库名，查询保存好的
+    语料库时，corpus_name结尾可以带'_corpus'也可以不带。另，'_model'结尾的文件被作为保存好的模型。
+        self.stats为QueryStats时记录本次查询各阶段的耗时和计数，见QueryStats
+        '''
+        if self.stats is None or _current_trace() is not None:
+            return self.__query(query_str, corpus_name, top_k, offset, content, snippet, collapse, boolean)
+        trace = _trace_local.trace = QueryTrace(query_str, corpus_name)
+        t_begin = time.perf_counter()
+        try:
+            return self.__query(query_str, corpus_name, top_k, offset, content, snippet, collapse, boolean)
+        finally:
+            trace.total = time.perf_counter() - t_begin
+            _trace_local.trace = None
+            self.stats.record(trace)
+
+    def __query(self, query_str, corpus_name, top_k, offset, content, snippet, collapse=False, boolean=False):
+        distance = None if collapse is False or collapse is None else self.dedup_distance if collapse is True else collapse
+        if not query_str:
+            print('Query nothing.')
+            return []
+        if self.corpus_name == corpus_name:
+            corpus_name = None
+        trace = _current_trace()
+        if self.segments and corpus_name == None:
+            if trace is not None:
+                t_begin = time.perf_counter()
+            query_list, query_tree = self.__parse_query(query_str, boolean)
+            if trace is not None:
+                trace.stage('parse', t_begin)
+            if distance is not None:
+                documents, scores, duplicates = self.__collapse(query_list, query_tree, top_k, offset, distance)
+            else:
+                documents, scores = self.__ranked(query_list, None if top_k == None else offset + top_k, query_tree)
+                documents, scores = documents[offset:], scores[offset:]
+            if trace is not None:
+                t_begin = time.perf_counter()
+            res = self.__show(documents, scores, query_list, content, snippet)
+            if distance is not None:
+                for document in res:
+                    document['duplicates'] = duplicates[document['index']]
+            if trace is not None:
+                trace.stage('show', t_begin)
+        else:
+            if corpus_name == None:
+                corpus_name = self.GetDefaultCorpusName()
+                if not corpus_name:
+                    raise ValueError('no default corpus found, use AdjustDefaultCorpus() first.')
+            if trace is not None:
+                t_begin = time.perf_counter()
+            newSerch = model_cache.get(corpus_name, self.seg, self.scorer if self.__scorer_given else None)
+            if trace is not None:
+                trace.stage('load', t_begin)
+            res = newSerch.Query(query_str, top_k=top_k, offset=offset, content=content, snippet=snippet,
+                                 collapse=False if distance is None else distance, boolean=boolean)
+        return res
+
+    def __collapse(self, query_list, query_tree, top_k, offset, distance):
+        '''
+        Query(collapse)：按得分从高到低，与排在前面的某个结果的SimHash海明距离不超过distance的结果并入该结果。
+        先取4*(offset+top_k)个结果，合并后不够offset+top_k个且还有更多结果时再取4倍
+        :return: (documents, scores, duplicates) 合并后这一页的结果，以及每个结果并入的文档序号{文档序号: list[int]}
+        '''
+        want = None if top_k == None else offset + top_k
+        limit = None if want == None else max(4 * want, 16)
+        signatures = self.__signatures()
+        while True:
+            documents, scores = self.__ranked(query_list, limit, query_tree)
+            trace = _current_trace()
+            if trace is not None:
+                t_begin = time.perf_counter()
+            index = SimHashIndex(distance)
+            kept, duplicates = [], {}
+            for position, document in enumerate(documents.tolist()):
+                found = index.find(signatures[document])
+                if found is None:
+                    index.add(document, signatures[document])
+                    kept.append(position)
+                    duplicates[document] = []
+                else:
+                    duplicates[found].append(document)
+            if trace is not None:
+                trace.stage('collapse', t_begin)
+            if limit == None or len(kept) >= want or len(documents) < limit:
+                break
+            limit *= 4
+        kept = np.array(kept[offset:want], dtype=np.int64)
+        return documents[kept], scores[kept], duplicates
+
+    def GetDocument(self, index, corpus_name=None):
+        '''
+        读取一个文档的内容，用于Query(content=False)之后按需读取
+        :param index: int 文档序号，即Query()结果中的'index'
+        :param corpus_name: str 同Query()
+        :return: str 文档内容，读取失败返回None
+        '''
+        if self.corpus_name == corpus_name:
+            corpus_name = None
+        if self.segments and corpus_name == None:
+            return self.__get_document(index)
+        if corpus_name == None:
+            corpus_name = self.GetDefaultCorpusName()
+            if not corpus_name:
+                raise ValueError('no default corpus found, use AdjustDefaultCorpus() first.')
+        return model_cache.get(corpus_name, self.seg).GetDocument(index)
+
+    def __ranked(self, query_list, top_k=None, query_tree=None):
+        '''
+        带缓存的打分和排序，缓存键为(语料库, 模型版本, 排序后的查询词, top_k, 查询树)，查询词的顺序不影响得分。
+        有查询树（布尔、短语查询）时先求出满足条件的文档，只为这些文档打分，不剪枝。
+        所有段都没有位置索引时，只由短语组成的查询树（boolean为False时的短语）不再过滤文档，按普通查询打分
+        '''
+        if query_tree is not None and self.__only_phrases(query_tree) and \
+                not [segment for segment in self.segments if segment.positions is not None]:
+            query_tree = None
+        key = (self.corpus_name, self.model_version, tuple(sorted(query_list)), top_k, query_tree)
+        ranked = self.result_cache.get(key)
+        trace = _current_trace()
+        if trace is not None:
+            trace.count('result_cache_misses' if ranked == None else 'result_cache_hits')
+            t_begin = time.perf_counter()
+        if ranked == None:
+            if query_tree is not None:
+                documents = self.__match(query_tree)
+                if trace is not None:
+                    t_begin = trace.stage('match', t_begin)
+                documents, scores = self.__get_scores(query_list, documents=documents)
+            else:
+                documents, scores = self.__get_scores(query_list, top_k)
+            if trace is not None:
+                t_begin = trace.stage('score', t_begin)
+                trace.count('scored', int(np.count_nonzero(scores)))
+            ranked = self.__top_k(documents, scores, top_k)
+            if trace is not None:
+                trace.stage('sort', t_begin)
+            self.result_cache.put(key, ranked)
+        return ranked
+
+    def __only_phrases(self, node):
+        '''
+        :return: bool 查询树是否只由短语（及其AND）组成
+        '''
+        if node[0] == 'and':
+            return all(self.__only_phrases(child) for child in node[1])
+        return node[0] == 'phrase'
+
+    def __match(self, query_tree):
+        '''
+        :param query_tree: tuple 查询树，见__parse_query()
+        :return: np.ndarray 满足查询树的文档序号（各段按顺序拼接），不包括已删除的文档
+        '''
+        res = []
+        base = 0
+        for segment in self.segments:
+            documents = self.__match_node(segment, query_tree)
+            res.append(documents[~segment.deleted[documents]] + base)
+            base += len(segment)
+        return np.concatenate(res) if res else np.empty(0, dtype=np.int64)
+
+    def __node_columns(self, segment, words):
+        '''
+        :return: (段内词序号, 是否每个词都在本段出现)
+        '''
+        columns, found = segment.columns(np.array([self.word_dict.get(word, -1) for word in words], dtype=np.int64))
+        return columns, bool(found.all())
+
+    def __node_cost(self, segment, node):
+        '''
+        估计求node的文档需要读取的posting数，AND时先求最小的
+        '''
+        if node[0] == 'terms':
+            return int(segment.column_lengths(self.__node_columns(segment, node[1])[0]).sum())
+        if node[0] == 'phrase':
+            columns, found = self.__node_columns(segment, node[1])
+            return int(segment.column_lengths(columns).min()) if found else 0
+        if node[0] == 'or':
+            return sum(self.__node_cost(segment, child) for child in node[1])
+        costs = [self.__node_cost(segment, child) for child in node[1] if child[0] != 'not']
+        return min(costs) if costs else len(segment)
+
+    def __match_node(self, segment, node, candidates=None):
+        '''
+        在一个段中求满足node的文档。AND从估计最小的子节点开始，之后的子节点只在已有的候选文档中查找：
+        压缩的倒排表按每块的最后一个文档序号跳过不含候选文档的块，只解码剩下的块；未压缩的csc矩阵在较长的一方中二分查找。
+        :param candidates: np.ndarray 从小到大的段内文档序号，不为None时只在其中查找
+        :return: np.ndarray 从小到大的段内文档序号
+        '''
+        if node[0] == 'terms':
+            columns = self.__node_columns(segment, node[1])[0]
+            if candidates is None:
+                return np.unique(segment.decode(columns)[0]).astype(np.int64)
+            parts = [segment.lookup(column, candidates)[0] for column in columns.tolist()]
+            return np.unique(np.concatenate(parts)).astype(np.int64) if parts else np.empty(0, dtype=np.int64)
+        if node[0] == 'phrase' and segment.positions is None:
+            # 没有位置索引时短语中的词作为普通查询词
+            return self.__match_node(segment, ('terms', node[1]), candidates)
+        if node[0] == 'phrase':
+            columns, found = self.__node_columns(segment, node[1])
+            if not found:
+                return np.empty(0, dtype=np.int64)
+            return segment.match_phrase(columns, node[2], candidates, node[3])
+        if node[0] == 'or':
+            return np.unique(np.concatenate([self.__match_node(segment, child, candidates) for child in node[1]]))
+        positives = [child for child in node[1] if child[0] != 'not']
+        positives.sort(key=lambda child: self.__node_cost(segment, child))
+        documents = candidates
+        for child in positives:
+            documents = self.__match_node(segment, child, documents)
+            if not len(documents):
+                return documents
+        if documents is None:
+            documents = np.arange(len(segment))
+        for child in node[1]:
+            if child[0] == 'not' and len(documents):
+                documents = np.setdiff1d(documents, self.__match_node(segment, child[1], documents), assume_unique=True)
+        return documents
+
+    def __query_list(self, query_str):
+        query_list = self.query_cache.get(query_str)
+        if query_list != None and _current_trace() is not None:
+            _current_trace().count('query_cache_hits')
+        if query_list == None:
+            tokenizer = self.tokenizer
+            query_list = tuple(word for word in tokenizer.tokenize(query_str) if word not in tokenizer.stopwords)
+            self.query_cache.put(query_str, query_list)
+        return list(query_list)
+
+    def __parse_query(self, query_str, boolean=False):
+        '''
+        解析短语查询和布尔查询，查询字符串中没有双引号（boolean为True时还有括号和AND、OR、NOT）时为普通查询，查询树为None。
+        boolean为False时只解析双引号括起的短语，短语都必须满足，其余的文字作为普通查询词，只影响得分；
+        模型没有位置索引时短语中的词也作为普通查询词，与不带双引号的查询相同（见__ranked()和__match_node()）。
+        boolean为True时的语法：AND、OR、NOT（大写）和括号，优先级NOT > 相邻 > AND > OR；相邻的普通词作为一段文字一起切词，其中的词出现任意一个即可；
+        双引号括起的部分为短语，"..."~n为邻近查询。相邻的几项中有短语或NOT时，短语都必须满足、NOT的项都不能出现，
+        没有短语时相邻的几段文字出现任意一个即可，例如'"机器 学习" 教材 NOT 视频'为包含短语、不包含“视频”的文档，“教材”只影响得分。
+        短语按语料库同样的方法切词（self.tokenizer）。结果缓存在self.query_cache中
+        :return: (list[str], tuple) 打分用的查询词（不包括NOT的词），和查询树：('terms', 词)、('phrase', 词, slop, 词的位置)、
+            ('and', 子节点)、('or', 子节点)、('not', 子节点)，子节点为tuple，全部由tuple组成，可作为缓存键
+        '''
+        if not (BOOLEAN_PATTERN if boolean else PHRASE_PATTERN).search(query_str):
+            return self.__query_list(query_str), None
+        key = ('(' if boolean else '"', query_str)
+        parsed = self.query_cache.get(key)
+        if parsed != None and _current_trace() is not None:
+            _current_trace().count('query_cache_hits')
+        if parsed == None:
+            query_list = []
+            if boolean:
+                tokens = deque(QUERY_TOKEN_PATTERN.finditer(query_str))
+                node = self.__parse_or(tokens, query_list, False)
+                while tokens:
+                    tokens.popleft()
+                    node = self.__combine('or', [node, self.__parse_or(tokens, query_list, False)])
+            else:
+                node = self.__parse_phrases(query_str, query_list)
+            parsed = (tuple(query_list), node)
+            self.query_cache.put(key, parsed)
+        return list(parsed[0]), parsed[1]
+
+    def __parse_phrases(self, query_str, query_list):
+        '''
+        boolean为False时：双引号括起的短语都必须满足，短语之间的文字作为普通查询词
+        '''
+        phrases = []
+        begin = 0
+        for match in PHRASE_PATTERN.finditer(query_str):
+            query_list += self.__query_list(query_str[begin:match.start()])
+            node = self.__phrase(match)
+            if node is not None:
+                query_list += node[1]
+                phrases.append(node)
+            begin = match.end()
+        query_list += self.__query_list(query_str[begin:])
+        return self.__combine('and', phrases)
+
+    def __phrase(self, match):
+        '''
+        :param match: re.Match 双引号括起的短语，group(1)为短语，group(2)为邻近查询的n
+        :return: tuple ('phrase', 词, slop, 词的位置)，短语中没有词时为None
+        '''
+        tokenizer = self.tokenizer
+        words, offsets = tokenizer.positioned(tokenizer.segment(match.group(1)))
+        if not words:
+            return None
+        return ('phrase', tuple(words), int(match.group(2) or 0), tuple(offsets))
+
+    def __combine(self, op, children):
+        children = tuple(child for child in children if child is not None)
+        if len(children) <= 1:
+            return children[0] if children else None
+        return (op, children)
+
+    def __parse_or(self, tokens, query_list, negated):
+        children = [self.__parse_and(tokens, query_list, negated)]
+        while tokens and tokens[0].group(4) == 'OR':
+            tokens.popleft()
+            children.append(self.__parse_and(tokens, query_list, negated))
+        return self.__combine('or', children)
+
+    def __parse_and(self, tokens, query_list, negated):
+        children = [self.__parse_group(tokens, query_list, negated)]
+        while tokens and tokens[0].group(4) == 'AND':
+            tokens.popleft()
+            children.append(self.__parse_group(tokens, query_list, negated))
+        return self.__combine('and', children)
+
+    def __parse_group(self, tokens, query_list, negated):
+        '''
+        相邻的若干项：短语都必须满足，NOT的项都不能出现，没有短语时其余各项出现任意一个即可
+        '''
+        required, optional, excluded = [], [], []
+        while tokens and tokens[0].group(3) != ')' and tokens[0].group(4) not in ('AND', 'OR'):
+            kind, node = self.__parse_item(tokens, query_list, negated)
+            if node is not None:
+                {'required': required, 'optional': optional, 'not': excluded}[kind].append(node)
+        children = [node for node in (required if required else [self.__combine('or', optional)]) if node is not None]
+        if not excluded:
+            return self.__combine('and', children)
+        return ('and', tuple(children + [('not', node) for node in excluded]))
+
+    def __parse_item(self, tokens, query_list, negated, single=False):
+        token = tokens.popleft()
+        if token.group(4) == 'NOT':
+            if not tokens:
+                return 'not', None
+            kind, node = self.__parse_item(tokens, query_list, not negated, True)
+            return 'optional' if kind == 'not' else 'not', node
+        if token.group(3) == '(':
+            node = self.__parse_or(tokens, query_list, negated)
+            if tokens and tokens[0].group(3) == ')':
+                tokens.popleft()
+            return 'optional', node
+        if token.group(3) == ')':
+            return 'optional', None
+        if token.group(4) is None:
+            node = self.__phrase(token)
+            if not negated and node is not None:
+                query_list += node[1]
+            return 'required', node
+        text = [token.group(4)]
+        while not single and tokens and tokens[0].group(4) not in (None, 'AND', 'OR', 'NOT'):
+            text.append(tokens.popleft().group(4))
+        words = tuple(self.__query_list(' '.join(text)))
+        words = tuple(word for word in words if word)
+        if not negated:
+            query_list += words
+        return 'optional', ('terms', words) if words else None
+
+    def CutQuery(self, query_str):
+        '''
+        :return: list[str] 查询字符串切词、去停用词后的查询词，同Query()
+        '''
+        return self.__query_list(query_str)
+
+    def ParseQuery(self, query_str, boolean=False):
+        '''
+        :param boolean: bool 同Query()
+        :return: (list[str], tuple) 打分用的查询词和查询树（普通查询为None），同Query()，可直接传给QueryTokens()
+        '''
+        return self.__parse_query(query_str, boolean)
+
+    def QueryTokens(self, query_list, top_k=None, query_tree=None):
+        '''
+        用已经切好的查询词在self.Train()或use_model()的模型中打分，不读取文档，ShardedSearch分片查询时使用
+        :param query_tree: tuple 布尔、短语查询的查询树，见ParseQuery()，只返回满足的文档
+        :return: (np.ndarray, np.ndarray) 按得分从大到小排序的(文档序号, 得分)
+        '''
+        return self.__ranked(list(query_list), top_k, query_tree)
+
+    def ShowResults(self, documents, scores, query_list=None, content=True, snippet=None):
+        '''
+        把QueryTokens()的结果整理成Query()的返回格式，只为documents读取内容
+        '''
+        return self.__show(np.asarray(documents, dtype=np.int64), np.asarray(scores, dtype=np.float64),
+                           query_list, content, snippet)
+
+    def CacheInfo(self, corpus_name=None):
+        '''
+        查询缓存的命中情况
+        :param corpus_name: str 同Query()
+        :return: dict{'query': (hits, misses, size), 'result': (hits, misses, size)}，
+            'query'为查询字符串->查询词的缓存，'result'为查询词->排序结果的缓存
+        '''
+        if self.corpus_name == corpus_name:
+            corpus_name = None
+        if corpus_name != None or not self.segments:
+            if corpus_name == None:
+                corpus_name = self.GetDefaultCorpusName()
+            if corpus_name:
+                return model_cache.get(corpus_name, self.seg).CacheInfo()
+        return {'query': self.query_cache.info(), 'result': self.result_cache.info()}
+
+    @staticmethod
+    def _init_query_worker(seg, tokenizer):
+        '''
+        Train()/QueryBatch()切词进程的初始化函数，每个进程只加载一次分词器和用户词典
+        '''
+        global _query_worker
+        _query_worker = MySearch(seg)
+        _query_worker.tokenizer = tokenizer
+        tokenizer.load()
+
+    @staticmethod
+    def _query_worker_cut(query_strs):
+        return [_query_worker.__parse_query(query_str)[0] for query_str in query_strs]
+
+    @staticmethod
+    def _corpus_worker_segment(texts):
+        return [_query_worker.tokenizer.segment(text) for text in texts]
+
+    def __cut_parallel(self, worker_cut, items, workers, chunksize):
+        '''
+        把items按chunksize分块，交给workers个进程切词，结果按原顺序拼接
+        '''
+        chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+        with ProcessPoolExecutor(workers, initializer=MySearch._init_query_worker,
+                                 initargs=(self.seg, self.tokenizer)) as executor:
+            res = []
+            for part in executor.map(worker_cut, chunks):
+                res += part
+        return res
+
+    def __cut_queries(self, queries, workers=None, chunksize=256):
+        if not workers or workers <= 1 or len(queries) <= chunksize:
+            return [self.__parse_query(query_str)[0] for query_str in queries]
+        return self.__cut_parallel(MySearch._query_worker_cut, queries, workers, chunksize)
+
+    def QueryBatch(self, queries, corpus_name=None, top_k=10, workers=None, batch_size=1024):
+        '''
+        批量查询，适合离线任务一次查询大量字符串：先切词，所有查询组成一个稀疏查询矩阵（查询-词-次数），
+        与各个段的权重矩阵（self.scorer计算）一次相乘得到全部得分，再分别选出每个查询的top_k个结果。不读取文档内容。
+        不支持布尔和短语查询，只用其中的查询词（不包括NOT的词）打分。
+        :param queries: list[str,str,...,str] 查询字符串
+        :param corpus_name: str 同Query()
+        :param top_k: int 每个查询返回得分最高的top_k个结果，为None时返回全部结果
+        :param workers: int 切词使用的进程数，缺省时在当前进程切词
+        :param batch_size: int 每次相乘的查询数，限制得分矩阵占用的内存
+        :return: list[(np.ndarray, np.ndarray),...] 与queries一一对应，每个元素为(文档序号, 得分)，按得分从大到小排序
+        '''
+        queries = list(queries)
+        if self.corpus_name == corpus_name:
+            corpus_name = None
+        if not self.segments or corpus_name != None:
+            if corpus_name == None:
+                corpus_name = self.GetDefaultCorpusName()
+                if not corpus_name:
+                    raise ValueError('no default corpus found, use AdjustDefaultCorpus() first.')
+            newSerch = model_cache.get(corpus_name, self.seg, self.scorer if self.__scorer_given else None)
+            return newSerch.QueryBatch(queries, top_k=top_k, workers=workers, batch_size=batch_size)
+        query_lists = self.__cut_queries(queries, workers)
+        res = []
+        tf_t = []
+        for segment in self.segments:
+            counts = segment.counts
+            tf_t.append(csc_matrix((self.scorer.tf_weights(self, segment, counts.indices, counts.data), counts.indices,
+                                    counts.indptr), shape=counts.shape).T.tocsr())
+        idf = self.scorer.idf(self)
+        for begin in range(0, len(query_lists), batch_size):
+            rows, columns = [], []
+            for row, query_list in enumerate(query_lists[begin:begin + batch_size]):
+                for word in query_list:
+                    index = self.word_dict.get(word)
+                    if index != None:
+                        rows.append(row)
+                        columns.append(index)
+            n_queries = min(batch_size, len(query_lists) - begin)
+            query_matrix = csc_matrix((np.ones(len(rows)), (rows, columns)),
+                                      shape=(n_queries, len(self.word_dict)))
+            idf_matrix = query_matrix.dot(diags(idf)).tocsc() if idf is not None else query_matrix
+            blocks = []
+            for segment, matrix in zip(self.segments, tf_t):
+                block = (query_matrix if segment.weights else idf_matrix)[:, segment.term_ids]
+                blocks.append(block.dot(matrix).dot(diags(self.scorer.scale(self, segment))))
+            scores = hstack(blocks, format='csr')
+            scores.eliminate_zeros()
+            scores.sort_indices()
+            for row in range(n_queries):
+                documents = scores.indices[scores.indptr[row]:scores.indptr[row + 1]]
+                data = scores.data[scores.indptr[row]:scores.indptr[row + 1]]
+                res.append(self.__top_k(documents, data, top_k))
+        return res
+
+
+class LRUCache(object):
+    '''
+    按条目数淘汰的LRU缓存，MySearch用于缓存查询字符串的切词结果和查询的排序结果
+
+    :param maxsize: int 最多保存的条目数，为0时不缓存
+    '''
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value == None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
 
-    def SaveModel(self, corpus_name=None, filename=None, select=None):
+    def put(self, key, value):
+        with self.lock:
+            if self.maxsize <= 0:
+                return None
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def info(self):
+        return (self.hits, self.misses, len(self.items))
+
+
+class ModelCache(object):
+    '''
+    进程内共享的模型缓存，Query()查询保存好的语料库时使用，避免每次查询都重新use_model()。
+    以(语料库路径, seg, 打分函数)为键保存已加载模型的MySearch对象，按内存预算max_bytes做LRU淘汰；
+    '_model'或'_corpus'的mtime变化时重新加载，SaveModel()/AddCorpus()/DelDocument()/RemoveCorpus()后自动失效。
+    加载模型时不持有全局锁，只持有该键的锁：同一个语料库只加载一次，其他语料库的查询不必等待。
+
+    :param max_bytes: int 缓存模型占用内存的预算（字节），超出时淘汰最久未使用的模型，至少保留一个
+    '''
+    def __init__(self, max_bytes=2 ** 30):
+        self.max_bytes = max_bytes
+        self.models = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        self.loading = {}
+
+    def __key(self, corpus_name):
+        if corpus_name[-7:] == '_corpus':
+            corpus_name = corpus_name[:-7]
+        return os.path.abspath(corpus_name)
+
+    def __signature(self, path):
+        try:
+            model_stat = os.stat(path + '_model')
+            corpus_stat = os.stat(path + '_corpus')
+        except OSError:
+            return None
+        return (model_stat.st_ino, model_stat.st_mtime_ns, corpus_stat.st_ino, corpus_stat.st_mtime_ns)
+
+    def __model_bytes(self, search):
+        nbytes = 0
+        for segment in search.segments:
+            nbytes += segment.nbytes + segment.deleted.nbytes + len(segment) * 16
+        if type(search.word_dict) == TermDict:
+            return nbytes + search.word_dict.nbytes
+        return nbytes + sys.getsizeof(search.word_dict) + 80 * len(search.word_dict)
+
+    def get(self, corpus_name, seg=None, scorer=None):
         '''
-        self.Train()之后才能self.SaveModel(),否则将出错
-        :param corpus_name:str 保存成名为corpus_name的语料库，缺省时将根据时间生成一个语料库名称
-        :param filename: list[str,str,...,str] 用于给语料文档document命名，缺省时使用原名称，没有原名称时用index
-        :return:成功将返回True，失败会报错
+        :param corpus_name: str 语料库名称
+        :param seg: str 查询时使用的分词方式，同MySearch(seg)
+        :param scorer: 打分函数，同MySearch(scorer)，缺省时使用模型保存时的打分函数
+        :return: 已加载该语料库模型的MySearch对象，不要修改其模型
         '''
-        if self.tfidf == None:
-            ValueError("SaveModel() must be used after Train()")
-        path = self.__creat_corpus(corpus_name, filename, select)
-        sparse_matrix_2_save = []
-        sparse_matrix_2_save.append((list(self.tfidf.data), list(self.tfidf.indices), list(self.tfidf.indptr)))
-        sparse_matrix_2_save.append(self.tfidf.shape)
-        sparse_matrix_2_save.append(self.word_dict)
-        try:
-            f = open(path + '_model', 'w', encoding='utf-8')
-            f.write(str(sparse_matrix_2_save))
-            return True
-        except:
-            self.__del_corpus(path)
-            raise ValueError('save errors!')
+        path = self.__key(corpus_name)
+        key = (path, seg, None if scorer is None else Scorer.create(scorer))
+        search = self.__lookup(key, path)
+        if search is not None:
+            return search
+        with self.lock:
+            load_lock = self.loading.setdefault(key, threading.Lock())
+        with load_lock:
+            try:
+                # 等待期间可能已由另一个线程加载好
+                search = self.__lookup(key, path)
+                if search is not None:
+                    return search
+                signature = self.__signature(path)
+                search = MySearch(seg, scorer=key[2])
+                search.use_model(corpus_name if corpus_name[-7:] != '_corpus' else corpus_name[:-7])
+                nbytes = self.__model_bytes(search)
+                with self.lock:
+                    self.misses += 1
+                    if key in self.models:
+                        self.__pop(key)
+                    self.models[key] = (search, signature, nbytes)
+                    self.nbytes += nbytes
+                    while self.nbytes > self.max_bytes and len(self.models) > 1:
+                        self.__pop(next(iter(self.models)))
+                return search
+            finally:
+                with self.lock:
+                    if self.loading.get(key) is load_lock:
+                        del self.loading[key]
 
-    def AddCorpus(self, corpus_name, corpus_name2=None, filename=None):
+    def __lookup(self, key, path):
         '''
-        向corpus_name指定的语料库中添加语料文档，语料文档来自corpus_name2指定的语料库，当corpus_name2为None时，
-        默认为self.Train()生成的检索模型和其语料库。filename参数可用于给新添加的文档命名，格式错误时视为没有该参数,
-        默认为保存原名称或者按其在原语料库中的Index序号命名。另，名称与新语料库中的名称相同时，将增加‘-副本’后缀
-        :param corpus_name1: name of Corpus1    str
-        :param corpus_name2: name of Corpus2    str
-        :param filename: filename of Corpus2's file     list [str,str...]
-        :return: 成功返回True，失败将报错
+        :return: 缓存中未过期的模型，没有时返回None
         '''
-        exist_list = self.__is_corpus_exit(corpus_name)
-        if not exist_list[0]:
-            raise ValueError('no corpus found, %s' % (corpus_name + '_corpus'))
-        if not exist_list[1]:
-            raise ValueError('no model found, %s' % (corpus_name + '_model'))
-        corpus_name = exist_list[0]
-        if corpus_name2:
-            exist_list = self.__is_corpus_exit(corpus_name2)
-            if not exist_list[0]:
-                raise ValueError('no corpus found, %s' % (corpus_name2 + '_corpus'))
-            if not exist_list[1]:
-                raise ValueError('no model found, %s' % (corpus_name2 + '_model'))
-            temp_name = exist_list[0]
-        else:
-            TempSearch = copy.deepcopy(self)
-            temp_name = str(time.time()) + '_corpus'
-            TempSearch.SaveModel(temp_name, filename)
-        try:
-            files = os.listdir(temp_name)
-            files2 = os.listdir(corpus_name)
-            if filename:
-                for i in filename:
-                    if type(i) != str:
-                        ValueError('Element of filename should be str!')
-            if filename and len(filename) != len(files):
-                print('No filename or filename is not complete')
-                filename = files
-            for i in range(len(files)):
-                while filename[i] in files2:
-                    filename[i] = filename[i].split('.')[0] + '-副本.' + filename[i].split('.')[1] if '.' in filename[i] else filename[i] + '-副本'
-                os.rename(temp_name + '/' + files[i], corpus_name + '/' + filename[i])
-            self.__del_corpus(temp_name)
-            NewSearch = MySearch(self.seg)
-            NewSearch.Train(corpus_name)
-            NewSearch.SaveModel(select='Y')
-        except:
-            ValueError("AddCorpus() error!")
-        else:
-            print('Added!')
-            return True
+        with self.lock:
+            cached = self.models.get(key)
+            if cached and cached[1] == self.__signature(path):
+                self.models.move_to_end(key)
+                self.hits += 1
+                if _current_trace() is not None:
+                    _current_trace().count('model_cache_hits')
+                return cached[0]
+        return None
 
-    def GetDefaultCorpusName(self):
+    def __pop(self, key):
+        self.nbytes -= self.models.pop(key)[2]
+
+    def invalidate(self, corpus_name=None):
         '''
-        :return: str
-                当前默认的搜索库名称，如果失败将返回False
+        使缓存失效
+        :param corpus_name: str 语料库名称，缺省时清空整个缓存
         '''
-        try:
-            f = open('venv/default_corpus', 'r', encoding='utf-8')
-            default_corpus = f.read()
-            f.close()
-        except:
-            print('Get default_corpus error! '
-                             'Make sure venv/default_corpus exist')
-            return False
-        return default_corpus
+        with self.lock:
+            if corpus_name == None:
+                self.models.clear()
+                self.nbytes = 0
+                return None
+            path = self.__key(corpus_name)
+            for key in [key for key in self.models if key[0] == path]:
+                self.__pop(key)
 
-    def AdjustDefaultCorpus(self, default_corpus=None):
+
+model_cache = ModelCache()
+
+
+class Shard(object):
+    '''
+    分片的接口，ShardedSearch通过它分发查询。LocalShard为本机保存好的语料库，
+    远程分片实现同样的两个方法即可（例如通过HTTP调用另一台机器上的LocalShard）。
+    '''
+    def search(self, query_list, top_k=None, query_tree=None):
         '''
-        调整默认搜索库，参数为新库名称,缺省时使用当前class的corpus_name。
-        有默认搜索库时，将调整为新搜索库，没有默认搜索库时将设置。
-        :param default_corpus: str,
-                    name of the new default corpus
-        :return: 成功返回True，失败返回False
+        :param query_list: list[str] 已经切好的查询词
+        :param query_tree: tuple 布尔、短语查询的查询树，见MySearch.ParseQuery()，普通查询时不传
+        :return: (np.ndarray, np.ndarray) 分片内按得分从大到小排序的(文档序号, 得分)
         '''
-        if default_corpus == None and self.corpus_name:
-            default_corpus = self.corpus_name
-        elif default_corpus == None:
-            ValueError("Missing name of default corpus!")
-        exist_list = self.__is_corpus_exit(default_corpus)
-        if not exist_list[0]:
-            print('Adjust default corpus failed!'
-                             'Make sure "%s_corpus" exist.\n'
-                  'Maybe you can use "SaveModel()" first.' % default_corpus)
-            return False
-        elif not exist_list[1]:
-            print('Adjust default corpus failed!'
-                             'Make sure "%s_model" exist.\n'
-                  'Maybe you can use "SaveModel()" first.' % default_corpus)
-            return False
+        raise NotImplementedError
+
+    def fetch(self, documents, scores, query_list=None, content=True, snippet=None):
+        '''
+        :return: list[dict] 同MySearch.Query()的返回格式
+        '''
+        raise NotImplementedError
+
+
+class LocalShard(Shard):
+    '''
+    本机保存好的一个分片，模型通过model_cache加载
+
+    :param corpus_name: str 分片的语料库名称
+    :param seg: str 同MySearch(seg)
+    '''
+    def __init__(self, corpus_name, seg=None):
+        self.corpus_name = corpus_name
+        self.seg = seg
+
+    def search(self, query_list, top_k=None, query_tree=None):
+        return model_cache.get(self.corpus_name, self.seg).QueryTokens(query_list, top_k, query_tree)
+
+    def fetch(self, documents, scores, query_list=None, content=True, snippet=None):
+        return model_cache.get(self.corpus_name, self.seg).ShowResults(documents, scores, query_list, content, snippet)
+
+
+class ShardedSearch(object):
+    '''
+    查询SaveModel(shards=N)保存的分片语料库：查询只切词一次，并行分发到各个分片，每个分片返回前offset+top_k个结果，
+    合并后取全局的前top_k个，只为这一页读取文档。各分片的idf和norms按整个语料库计算，得分与不分片时相同。
+
+    :param corpus_name: str SaveModel(shards=N)时的语料库名称（读取<corpus_name>_shards.json），
+        或者list[Shard,Shard,...] 自行组织的分片（例如远程分片）
+    :param seg: str 同MySearch(seg)
+    :param workers: int 并行查询的线程数，缺省时为分片数
+    '''
+    def __init__(self, corpus_name, seg=None, workers=None):
+        if type(corpus_name) == str:
+            if corpus_name[-7:] == '_corpus':
+                corpus_name = corpus_name[:-7]
+            with open(corpus_name + '_shards.json', 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('format') != SHARDS_FORMAT:
+                raise ValueError('unsupported shards format, %s' % (corpus_name + '_shards.json'))
+            self.shards = [LocalShard(name, seg) for name in manifest['shards']]
         else:
-            f = open('venv/default_corpus', 'w', encoding='utf-8')
-            f.write(default_corpus)
-            f.close()
-            return True
+            self.shards = list(corpus_name)
+        if not self.shards:
+            raise ValueError('no shard found')
+        self.searcher = MySearch(seg)
+        self.executor = ThreadPoolExecutor(workers or len(self.shards))
 
-    def __is_corpus_exit(self, corpus_name=None):
-        if corpus_name == None:
-            corpus_name = self.GetDefaultCorpusName()
-        corpus_path = corpus_name + '_corpus'
-        model_path = corpus_name + '_model'
-        fs = os.listdir('.')
-        exist_list = [corpus_path in fs, model_path in fs]
-        if exist_list[0]:
-            exist_list[0] = corpus_path
-        if exist_list[1]:
-            exist_list[1] = model_path
-        return exist_list
+    def Query(self, query_str, top_k=10, offset=0, content=True, snippet=None, boolean=False):
+        '''
+        :param boolean: bool 同MySearch.Query()
+        :return: list[dict,dict,...,dict] 同MySearch.Query()，每个dict多一个'shard'，为文档所在分片的序号，
+            'index'为文档在该分片中的序号
+        '''
+        if not query_str:
+            print('Query nothing.')
+            return []
+        query_list, query_tree = self.searcher.ParseQuery(query_str, boolean)
+        limit = None if top_k == None else offset + top_k
+        if query_tree is not None:
+            parts = list(self.executor.map(lambda shard: shard.search(query_list, limit, query_tree), self.shards))
+        else:
+            parts = list(self.executor.map(lambda shard: shard.search(query_list, limit), self.shards))
+        shard_ids = np.concatenate([np.full(len(part[0]), i, dtype=np.int64) for i, part in enumerate(parts)])
+        documents = np.concatenate([np.asarray(part[0], dtype=np.int64) for part in parts])
+        scores = np.concatenate([np.asarray(part[1], dtype=np.float64) for part in parts])
+        order = np.lexsort((documents, shard_ids, -scores))
+        order = order[offset:] if limit == None else order[offset:limit]
+        if not len(order):
+            print('Sorry,the words you queried are not in the corpus')
+            return []
+        res = [None] * len(order)
+        for i, shard in enumerate(self.shards):
+            positions = np.flatnonzero(shard_ids[order] == i)
+            if not len(positions):
+                continue
+            selected = order[positions]
+            for position, document in zip(positions.tolist(),
+                                          shard.fetch(documents[selected], scores[selected], query_list, content,
+                                                      snippet)):
+                document['shard'] = i
+                res[position] = document
+        return res
 
-    def __generate_csc_matrix(self, model_path):
-        f = open(model_path, 'r', encoding='utf-8')
-        sparse_matrix_saved = eval(f.read())
-        self.tfidf = csc_matrix(sparse_matrix_saved[0], sparse_matrix_saved[1])
-        self.word_dict = sparse_matrix_saved[2]
+    def close(self):
+        self.executor.shutdown()
 
-    def use_model(self, corpus_name=None):
-        if corpus_name == None:
-            corpus_name = self.GetDefaultCorpusName()
-        exist_list = self.__is_corpus_exit(corpus_name)
-        if not exist_list[0]:
-            raise ValueError('no corpus found, %s' % (corpus_name + '_corpus'))
-        if not exist_list[1]:
-            raise ValueError('no model found, %s' % (corpus_name + '_model'))
-        self.corpus_name = exist_list[0]
-        files = os.listdir(self.corpus_name)
-        self.__generate_csc_matrix(exist_list[1])
-        if self.tfidf.shape[1] != len(files) or self.tfidf.shape[1] != len(self.word_dict) or self.tfidf.shape[1] == 0:
-            ValueError("Error! Corpus was destroyed!\n"
-                       "Suggest you .Train() the corpus.")
 
-    def __del_corpus(self, corpus_name=None):
+class QueryPool(object):
+    '''
+    多进程查询：先在本进程加载保存好的语料库（各个段的数组以np.memmap打开），再fork出workers个查询进程，
+    子进程直接使用继承来的模型（词表等python对象写时复制，数组共享同一份页缓存），不再各自加载一份；
+    fork前调用gc.freeze()，避免垃圾回收改写这些对象所在的内存页。不支持fork的平台上每个进程各自加载一次。
+    query()分给任意一个空闲进程，query_many()把一批查询分块分给全部进程。
+
+    :param corpus_names: list[str,str,...,str] 保存好的语料库名称，第一个为默认语料库
+    :param seg: str 同MySearch(seg)
+    :param workers: int 查询进程数，缺省时为CPU核数
+    '''
+    def __init__(self, corpus_names, seg=None, workers=None):
+        if type(corpus_names) == str:
+            corpus_names = [corpus_names]
+        self.corpus_names = [name[:-7] if name[-7:] == '_corpus' else name for name in corpus_names]
+        if not self.corpus_names:
+            raise ValueError('QueryPool needs at least one saved corpus')
+        self.seg = seg
+        self.workers = workers or os.cpu_count() or 1
+        for corpus_name in self.corpus_names:
+            model_cache.get(corpus_name, seg)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            gc.collect()
+            gc.freeze()
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=QueryPool._init_worker,
+                                                initargs=(self.corpus_names, seg))
+        for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    @staticmethod
+    def _init_worker(corpus_names, seg):
+        '''
+        不能fork时工作进程的初始化函数，每个进程只加载一次语料库
+        '''
+        for corpus_name in corpus_names:
+            model_cache.get(corpus_name, seg)
+
+    @staticmethod
+    def _worker_query(corpus_name, seg, query_str, top_k, offset, content, snippet, boolean=False):
+        return model_cache.get(corpus_name, seg).Query(query_str, top_k=top_k, offset=offset, content=content,
+                                                       snippet=snippet, boolean=boolean)
+
+    @staticmethod
+    def _worker_query_many(corpus_name, seg, query_strs, top_k, content, snippet, boolean=False):
+        search = model_cache.get(corpus_name, seg)
+        return [search.Query(query_str, top_k=top_k, content=content, snippet=snippet, boolean=boolean)
+                for query_str in query_strs]
+
+    def corpus(self, corpus_name=None):
         if corpus_name == None:
-            corpus_name = self.corpus_name
+            return self.corpus_names[0]
         if corpus_name[-7:] == '_corpus':
             corpus_name = corpus_name[:-7]
-        if corpus_name[-6:] == '_model':
-            corpus_name = corpus_name[:-6]
-        if corpus_name[-10:] == '_model':
-            corpus_name = corpus_name[:-10]
-        files = os.listdir('.')
-        try:
-            if corpus_name + '_corpus' in files:
-                shutil.rmtree(corpus_name + '_corpus')
-            if corpus_name + '_model' in files:
-                os.unlink(corpus_name + '_model')
-        except:
-            pass
-        else:
-            return corpus_name + '_corpus and ' + corpus_name + '_model'
+        if corpus_name not in self.corpus_names:
+            raise ValueError('corpus not served, %s' % corpus_name)
+        return corpus_name
 
-    def RemoveCorpus(self, corpus_name=None):
+    def submit(self, query_str, corpus_name=None, top_k=10, offset=0, content=True, snippet=None, boolean=False):
         '''
-        删除保存好的语料库，参数为None时删除self.corpus_name指定的语料库，语料库不存在将报错
-        :param corpus_name:想要删除的语料库名称
-        :return:成功返回True,失败将报错
+        :return: concurrent.futures.Future 结果同MySearch.Query()
         '''
-        res = self.__del_corpus(corpus_name)
-        if res:
-            print("%s have Removed!" % res)
-            return True
-        else:
-            ValueError('Remove Error!')
+        return self.executor.submit(QueryPool._worker_query, self.corpus(corpus_name), self.seg, query_str, top_k,
+                                    offset, content, snippet, boolean)
 
-    def DelDocument(self, documents, corpus_name=None):
+    def query(self, query_str, corpus_name=None, top_k=10, offset=0, content=True, snippet=None, boolean=False):
+        return self.submit(query_str, corpus_name, top_k, offset, content, snippet, boolean).result()
+
+    def query_many(self, queries, corpus_name=None, top_k=10, content=True, snippet=None, chunksize=64,
+                   boolean=False):
         '''
-        删除保存好的语料库的部分语料文档document，未保存（SaveModel()）不能删除
-        :param documents: list[str,str,...,str] 待删除的语料文档document的文件名
-        :param corpus_name: str  语料库名
-        :return: 成功将返回True,失败会报错
+        :return: list 与queries一一对应，每个元素同MySearch.Query()的结果
         '''
-        if not corpus_name:
-            corpus_name = self.corpus_name
-        exist_list = self.__is_corpus_exit(corpus_name)
-        if not exist_list[0]:
-            raise ValueError('no corpus found, %s' % (corpus_name + '_corpus'))
-        if not exist_list[1]:
-            raise ValueError('no model found, %s' % (corpus_name + '_model'))
-        corpus_name = exist_list[0]
-        files = os.listdir('.')
-        if corpus_name in files:
-            files2 = os.listdir(corpus_name)
-            try:
-                for file in documents:
-                    if type(file) != str:
-                        ValueError("The element of parameter 1 must be 'str' type,representing the name of the file to be deleted.")
-                    if file in files2:
-                        os.unlink(corpus_name + '/' + file)
-                    else:
-                        print(file + 'not in ' + (corpus_name + '/'))
-            except:
-                ValueError('unlink error.')
-            else:
-                NewSearch = MySearch(self.seg)
-                NewSearch.Train(corpus_name)
-                NewSearch.SaveModel(select='Y')
-                print('Deleted!')
-                return True
-        else:
-            ValueError('DelDocument() error, for wrong corpus_name.\n'
-                  'Please indicate the correct corpus_name.')
-
-    def Train(self, argc, e=None):
-        if type(argc) == str:
-            self.corpus_name = argc
-            self.__Path2Corpus()
-        elif isinstance(argc, Iterable):
-            self.corpus = argc
-        if e == 'e':
-            corpus_cut = self.__cut_for_e()
-        else:
-            corpus_cut = self.__cut_corpus()
-
-        vectorizer = CountVectorizer()
-        words = vectorizer.fit_transform(corpus_cut)
-        self.word_dict = vectorizer.vocabulary_
-        self.tfidf = TfidfTransformer(self.norm, self.use_idf, self.smooth_idf,
-                 self.sublinear_tf).fit_transform(words)
-        self.tfidf = self.tfidf.tocsc()
-        
-        return words
+        corpus_name = self.corpus(corpus_name)
+        queries = list(queries)
+        futures = [self.executor.submit(QueryPool._worker_query_many, corpus_name, self.seg,
+                                        queries[i:i + chunksize], top_k, content, snippet, boolean)
+                   for i in range(0, len(queries), chunksize)]
+        res = []
+        for future in futures:
+            res += future.result()
+        return res
 
-    def __get_scores(self, query_list):
-        document_scores = {}
-        for word in query_list:
-            index = self.word_dict.get(word)
-            if index == None:
-                continue
-            documents = self.tfidf.indices[self.tfidf.indptr[index]:self.tfidf.indptr[index + 1]]
-            data = self.tfidf.data[self.tfidf.indptr[index]:self.tfidf.indptr[index + 1]]
-            for i in range(len(documents)):
-                document_scores[documents[i]] = document_scores.get(documents[i], 0) + data[i]
-        return document_scores
+    def close(self):
+        self.executor.shutdown()
+        gc.unfreeze()
+
+
+class QueryError(ValueError):
+    '''
+    QueryServer中由请求引起的错误（例如语料库不存在、排队已满），status为返回的HTTP状态码；
+    查询中其他的异常视为服务端错误，返回500
+
+    :param message: str 错误信息
+    :param status: int HTTP状态码，缺省为400
+    '''
+    def __init__(self, message, status=400):
+        super(QueryError, self).__init__(message)
+        self.status = status
+
+
+class QueryServer(object):
+    '''
+    基于asyncio的HTTP/JSON查询服务：启动时加载一个或多个保存好的语料库，并发处理查询，
+    切词、打分和读取文档交给工作池完成，事件循环只负责收发请求。
+    GET /query?q=查询字符串&corpus=语料库名&top_k=10&offset=0&content=1&snippet=50&boolean=0
+        返回 {"results": [...]}，results同MySearch.Query()，corpus缺省时为corpus_names[0]，boolean=1时解析布尔查询
+    POST /query 参数同上，以JSON放在请求体中
+    GET /stats 返回已处理、超时、拒绝的请求数和当前排队数
+
+    :param corpus_names: list[str,str,...,str] 保存好的语料库名称
+    :param seg: str 同MySearch(seg)
+    :param workers: int 工作进程数，由QueryPool在加载语料库后fork出来，共享同一份模型；缺省时使用本进程的线程池
+    :param timeout: float 每个查询的超时时间（秒），超时返回504
+    :param max_pending: int 同时处理和排队的查询数上限，超过时直接返回503，避免请求无限堆积
+    :param max_body: int 请求体的最大字节数，超过时返回413并断开连接，不读入内存
+    '''
+    def __init__(self, corpus_names, seg=None, host='127.0.0.1', port=8000, workers=None, timeout=5.0,
+                 max_pending=256, max_body=2 ** 20):
+        if type(corpus_names) == str:
+            corpus_names = [corpus_names]
+        self.corpus_names = [name[:-7] if name[-7:] == '_corpus' else name for name in corpus_names]
+        if not self.corpus_names:
+            raise ValueError('QueryServer needs at least one saved corpus')
+        self.seg = seg
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self.pending = 0
+        self.served = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.executor = None
+        self.pool = None
+        self.server = None
 
-    def Query(self, query_str, corpus_name=None):
+    def start(self):
         '''
-        查询函数
-        :param query_str: str query_str为查询字符串
-        :param corpus_name: str corpus_name为查询语料库名称，corpus_name为None时优先查询self.Train(),
-        其次查询默认语料库，若corpus_name不为空，则查询corpus_name指向的语料库，若没有该语料库将出错。
-        :return: list[dict,dict,...,dict]
-            其中dict{'index', 'score', 'content'} or dict{'index', 'score', 'filename', 'content'}
-        注：以'_corpus'结尾的文件夹将被作为保存好的语料库，文件夹名即为语料库名，查询保存好的
-    语料库时，corpus_name结尾可以带'_corpus'也可以不带。另，'_model'结尾的文件被作为保存好的模型。
+        加载语料库并创建工作池，serve()会自动调用
         '''
-        if not query_str:
-            print('Query nothing.')
-            return []
-        if self.corpus_name == corpus_name:
-            corpus_name = None
-        if self.tfidf != None and corpus_name == None:
-            temp = self.__cut_str(query_str).split(' ')
-            query_list = [x.lower() for x in temp if x not in self.stopwords]
-            document_scores = self.__get_scores(query_list)
-            res = self.__show(document_scores)
+        if self.executor:
+            return None
+        for corpus_name in self.corpus_names:
+            model_cache.get(corpus_name, self.seg)
+        if self.workers and self.workers > 0:
+            self.pool = QueryPool(self.corpus_names, self.seg, self.workers)
+            self.executor = self.pool.executor
         else:
-            newSerch = MySearch(self.seg)
-            newSerch.use_model(corpus_name)
-            res = newSerch.Query(query_str)
+            self.executor = ThreadPoolExecutor()
+
+    async def serve(self):
+        self.start()
+        self.server = await asyncio.start_server(self.__handle, self.host, self.port)
+        print('Serving %s on http://%s:%d' % (', '.join(self.corpus_names), self.host, self.port))
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.close()
+
+    def run(self):
+        '''
+        阻塞运行服务，Ctrl+C退出
+        '''
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+        elif self.executor:
+            self.executor.shutdown(wait=False)
+        self.executor = None
+
+    async def query(self, query_str, corpus_name=None, top_k=10, offset=0, content=True, snippet=None, boolean=False):
+        '''
+        在工作池中执行一次查询，超时抛出asyncio.TimeoutError，语料库不存在或排队数超过max_pending时抛出QueryError。
+        超时的查询在工作池中仍会执行完，执行完（或排队中被取消）时才让出排队数，避免超时的查询堆积在工作池中
+        '''
+        if corpus_name == None:
+            corpus_name = self.corpus_names[0]
+        if corpus_name[-7:] == '_corpus':
+            corpus_name = corpus_name[:-7]
+        if corpus_name not in self.corpus_names:
+            raise QueryError('corpus not served, %s' % corpus_name)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise QueryError('too many pending queries', 503)
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(QueryPool._worker_query, corpus_name, self.seg, query_str, top_k, offset,
+                                      content, snippet, boolean)
+        self.pending += 1
+        future.add_done_callback(lambda _: self.__release(loop))
+        try:
+            res = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        self.served += 1
         return res
+
+    def __release(self, loop):
+        '''
+        工作池中的查询完成时调用（在工作池的线程中），回到事件循环中让出排队数
+        '''
+        def release():
+            self.pending -= 1
+        try:
+            loop.call_soon_threadsafe(release)
+        except RuntimeError:
+            # 事件循环已关闭
+            self.pending -= 1
+
+    def stats(self):
+        return {'served': self.served, 'timeouts': self.timeouts, 'rejected': self.rejected,
+                'pending': self.pending, 'corpus': self.corpus_names}
+
+    async def __handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self.__respond(writer, 400, {'error': 'bad request'}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.__respond(writer, 400, {'error': 'bad content-length'}, False)
+                    break
+                if length > self.max_body:
+                    await self.__respond(writer, 413, {'error': 'request body too large'}, False)
+                    break
+                body = b''
+                if length > 0:
+                    try:
+                        body = await reader.readexactly(length)
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        break
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    status, res = await self.__dispatch(method, target, body)
+                except Exception as e:
+                    # 异常的内容只记录在服务端，不返回给客户端
+                    print('QueryServer internal error, %s: %s' % (type(e).__name__, e))
+                    status, res = 500, {'error': 'internal error'}
+                await self.__respond(writer, status, res, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def __dispatch(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == '/stats':
+            return 200, self.stats()
+        if url.path != '/query':
+            return 404, {'error': 'not found'}
+        params = dict((name, values[-1]) for name, values in parse_qs(url.query).items())
+        if method == 'POST':
+            try:
+                data = json.loads(body.decode('utf-8') or '{}')
+            except ValueError:
+                return 400, {'error': 'bad json'}
+            if type(data) != dict:
+                return 400, {'error': 'json body must be an object'}
+            params.update(data)
+        elif method != 'GET':
+            return 405, {'error': 'method not allowed'}
+        query_str = params.get('q')
+        if type(query_str) != str or not query_str:
+            return 400, {'error': "parameter 'q' must be a non-empty string"}
+        if params.get('corpus') is not None and type(params['corpus']) != str:
+            return 400, {'error': "parameter 'corpus' must be a string"}
+        try:
+            top_k = int(params['top_k']) if params.get('top_k') not in (None, '') else 10
+            offset = int(params.get('offset') or 0)
+            snippet = int(params['snippet']) if params.get('snippet') else None
+        except (TypeError, ValueError):
+            return 400, {'error': 'top_k, offset and snippet must be int'}
+        if top_k < 0 or offset < 0 or (snippet is not None and snippet < 0):
+            return 400, {'error': 'top_k, offset and snippet must not be negative'}
+        content = str(params.get('content', '1')).lower() not in ('0', 'false', 'no')
+        boolean = str(params.get('boolean', '0')).lower() not in ('0', 'false', 'no', '')
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, {'error': 'too many pending queries'}
+        try:
+            res = await self.query(query_str, params.get('corpus'), top_k, offset, content, snippet, boolean)
+        except asyncio.TimeoutError:
+            return 504, {'error': 'query timeout'}
+        except QueryError as e:
+            return e.status, {'error': str(e)}
+        return 200, {'results': res}
+
+    async def __respond(self, writer, status, res, keep_alive):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                   413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+        body = json.dumps(res, ensure_ascii=False).encode('utf-8')
+        head = ('HTTP/1.1 %d %s\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: %d\r\n'
+                'Connection: %s\r\n\r\n' % (status, reasons.get(status, ''), len(body),
+                                            'keep-alive' if keep_alive else 'close'))
+        writer.write(head.encode('latin-1') + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
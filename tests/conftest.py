@@ -0,0 +1,85 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+sys.path.insert(0, ROOT)
+
+import MySearch
+
+# fixtures/v0_corpus、v0_model为最初的MySearch.py（文本模型）用MySearch('e').Train(CORPUS, 'e')、SaveModel('v0')保存的
+CORPUS = ['the quick brown fox jumps over the lazy dog',
+          'a quick brown dog outpaces a quick fox',
+          'search engines rank documents by relevance',
+          'the lazy cat sleeps all day long',
+          'brown bread and brown sugar',
+          'happy new year to everyone',
+          'engines of search and engines of change',
+          'dogs and foxes are not the same animal']
+QUERIES = ['quick fox', 'brown', 'search engines', 'lazy dog cat', 'happy year', 'brown brown bread']
+
+
+def random_corpus(documents=700, words=400, seed=0):
+    '''
+    词频近似Zipf分布的随机语料
+    '''
+    rng = np.random.RandomState(seed)
+    probability = 1.0 / np.arange(1, words + 1)
+    probability /= probability.sum()
+    return [' '.join('w%d' % word for word in rng.choice(words, rng.randint(5, 60), p=probability))
+            for _ in range(documents)]
+
+
+def random_queries(n=40, words=400, seed=1):
+    rng = np.random.RandomState(seed)
+    return [['w%d' % word for word in rng.choice(words // 4, rng.randint(1, 5), replace=False)] for _ in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    '''
+    每个测试在单独的临时文件夹中运行：MySearch()从当前文件夹读取stop_words.txt、userdict.txt，语料库和模型也保存在当前文件夹
+    '''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'stop_words.txt').write_text('')
+    (tmp_path / 'userdict.txt').write_text('')
+    MySearch.model_cache.invalidate()
+    yield tmp_path
+    MySearch.model_cache.invalidate()
+
+
+def copy_fixture(name):
+    for suffix in ('_corpus', '_model'):
+        path = os.path.join(FIXTURES, name + suffix)
+        # v0的模型是单个文本文件
+        (shutil.copytree if os.path.isdir(path) else shutil.copy)(path, name + suffix)
+
+
+def new_search(*args, **kw):
+    search = MySearch.MySearch('e', *args, **kw)
+    search.background_merge = False
+    return search
+
+
+def trained(corpus=CORPUS, **kw):
+    search = new_search(**kw)
+    search.Train(list(corpus), 'e')
+    return search
+
+
+def saved(name, corpus=CORPUS, **kw):
+    search = trained(corpus, **kw)
+    search.SaveModel(name, select='Y')
+    return search
+
+
+def ranked(results):
+    return [(document['index'], round(document['score'], 9)) for document in results]
+
+
+def scores_by_content(results):
+    return {document['content']: round(document['score'], 9) for document in results}
@@ -0,0 +1,74 @@
+import os
+import threading
+
+import MySearch
+from conftest import CORPUS, new_search, saved, scores_by_content, trained
+
+
+def test_model_cache_reuses_loaded_model():
+    saved('c')
+    cache = MySearch.ModelCache()
+    search = cache.get('c', 'e')
+    assert cache.get('c_corpus', 'e') is search
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.get('c') is not search
+
+
+def test_query_uses_model_cache():
+    expected = saved('c').Query('quick fox')
+    searcher = new_search()
+    assert scores_by_content(searcher.Query('quick fox', 'c')) == scores_by_content(expected)
+    hits = MySearch.model_cache.hits
+    assert scores_by_content(searcher.Query('quick fox', 'c')) == scores_by_content(expected)
+    assert MySearch.model_cache.hits == hits + 1
+
+
+def test_model_cache_invalidated_by_save():
+    saved('c', CORPUS[:4])
+    first = MySearch.model_cache.get('c', 'e')
+    saved('c')
+    search = MySearch.model_cache.get('c', 'e')
+    assert search is not first
+    assert scores_by_content(search.Query('brown')) == scores_by_content(trained().Query('brown'))
+
+
+def test_model_cache_evicts_least_recently_used():
+    saved('a')
+    saved('b')
+    cache = MySearch.ModelCache(max_bytes=1)
+    a = cache.get('a', 'e')
+    cache.get('b', 'e')
+    # 超出预算时至少保留一个模型
+    assert [key[0] for key in cache.models] == [os.path.abspath('b')]
+    assert cache.get('a', 'e') is not a
+    cache.invalidate('a')
+    assert not cache.models and cache.nbytes == 0
+
+
+def test_model_cache_loads_without_blocking_other_corpora(monkeypatch):
+    saved('slow')
+    saved('fast')
+    started, release = threading.Event(), threading.Event()
+    use_model = MySearch.MySearch.use_model
+
+    def slow_use_model(self, corpus_name):
+        if corpus_name == 'slow':
+            started.set()
+            release.wait(5)
+        return use_model(self, corpus_name)
+
+    monkeypatch.setattr(MySearch.MySearch, 'use_model', slow_use_model)
+    cache = MySearch.ModelCache()
+    loaded = []
+    threads = [threading.Thread(target=lambda: loaded.append(cache.get('slow', 'e'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    # 'slow'加载期间，其他语料库的查询不等待
+    cache.get('fast', 'e')
+    assert not release.is_set() and loaded == []
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(loaded) == 4 and all(search is loaded[0] for search in loaded)
+    assert cache.misses == 2
@@ -0,0 +1,159 @@
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+
+import MySearch
+from conftest import CORPUS, QUERIES, new_search, saved, scores_by_content, trained
+
+
+def random_counts(shape=(500, 60), density=0.3, seed=0):
+    rng = np.random.RandomState(seed)
+    counts = sparse_random(shape[0], shape[1], density, format='csc', random_state=rng,
+                           data_rvs=lambda n: rng.randint(1, 300, n))
+    return counts.astype(np.int64)
+
+
+def test_term_dict(tmp_path):
+    terms = ['机器', 'search', '机器学习', 'engine', 'se', '学习', 'seat']
+    MySearch.TermDict.from_terms(terms).save(str(tmp_path))
+    for term_dict in (MySearch.TermDict.from_terms(terms), MySearch.TermDict.load(str(tmp_path))):
+        assert len(term_dict) == len(terms)
+        assert dict(term_dict.items()) == {term: index for index, term in enumerate(terms)}
+        assert term_dict['机器学习'] == 2 and term_dict.get('missing') is None and 'seat' in term_dict
+        with pytest.raises(KeyError):
+            term_dict['sea']
+        assert term_dict.prefix('se') == [('se', 4), ('search', 1), ('seat', 6)]
+        assert term_dict.prefix('机器', limit=1) == [('机器', 0)]
+        assert term_dict.prefix('x') == []
+
+
+def test_saved_vocabulary_is_a_term_dict():
+    search = saved('vocab')
+    loaded = new_search()
+    loaded.use_model('vocab')
+    assert isinstance(loaded.word_dict, MySearch.TermDict)
+    for query in QUERIES:
+        assert scores_by_content(loaded.Query(query)) == scores_by_content(search.Query(query))
+
+
+def test_varint_round_trip():
+    values = np.array([0, 1, 127, 128, 255, 300, 16383, 16384, 2 ** 31, 2 ** 40 + 5], dtype=np.int64)
+    data, sizes = MySearch._varint_encode(values)
+    assert sizes.tolist() == [1, 1, 1, 2, 2, 2, 2, 3, 5, 6]
+    assert len(data) == sizes.sum()
+    assert MySearch._varint_decode(data).tolist() == values.tolist()
+
+
+@pytest.mark.parametrize('weights', [False, True])
+def test_postings_round_trip(tmp_path, weights):
+    # 第5个词没有posting
+    counts = random_counts().multiply(np.arange(60) != 5).tocsc().astype(np.int64)
+    if weights:
+        counts = (counts / 7).astype(np.float32)
+    postings = MySearch.Postings.encode(counts, weights)
+    postings.save(str(tmp_path))
+    for postings in (postings, MySearch.Postings.load(str(tmp_path), counts.shape[0])):
+        assert abs(postings.decode_all() - counts).max() == 0
+        columns = [3, 5, 0, 7]
+        rows, values, lengths = postings.decode(columns)
+        assert lengths.tolist() == [counts[:, column].nnz for column in columns]
+        assert rows.tolist() == np.concatenate([counts[:, column].indices for column in columns]).tolist()
+        np.testing.assert_array_equal(values, np.concatenate([counts[:, column].data for column in columns]))
+
+
+@pytest.mark.parametrize('weights', [False, True])
+def test_postings_blocks(weights):
+    counts = random_counts()
+    if weights:
+        counts = (counts / 7).astype(np.float32)
+    postings = MySearch.Postings.encode(counts, weights)
+    size = postings.block_size
+    block_last = postings.blocks[0]
+    block_ptr, starts = postings.block_starts()
+    documents = np.arange(0, counts.shape[0], 3)
+    for column in range(counts.shape[1]):
+        indices = counts[:, column].indices
+        first, last = block_ptr[column], block_ptr[column + 1]
+        # 每块最后一个文档序号
+        assert block_last[first:last].tolist() == indices[size - 1::size].tolist() + \
+               ([indices[-1]] if len(indices) % size else [])
+        assert (postings.find_blocks(column, indices) - first).tolist() == (np.arange(len(indices)) // size).tolist()
+        dense = counts[:, column].toarray().ravel()
+        rows, values = postings.lookup(column, documents)
+        assert rows.tolist() == [document for document in documents.tolist() if dense[document]]
+        np.testing.assert_array_equal(values, dense[rows])
+
+
+def test_positions_round_trip(tmp_path):
+    counts = random_counts(density=0.1).tocsc()
+    counts.sort_indices()
+    rng = np.random.RandomState(1)
+    positions = np.concatenate([np.sort(rng.choice(1000, tf, replace=False)) for tf in counts.data.tolist()])
+    encoded = MySearch.Positions.encode(counts, positions)
+    encoded.save(str(tmp_path))
+    for encoded in (encoded, MySearch.Positions.load(str(tmp_path))):
+        assert encoded.decode_all(counts.data).tolist() == positions.tolist()
+    assert MySearch.Positions.load(str(tmp_path / 'missing')) is None
+    with pytest.raises(ValueError):
+        MySearch.Positions.encode(counts, positions[:-1])
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_doc_store(tmp_path, compress):
+    path = str(tmp_path / 'docs')
+    texts = ['document %d ' % index * index + '文档' for index in range(50)]
+    store = MySearch.DocStore.create(path, ['%d.txt' % index for index in range(50)], texts, compress, block_bytes=256)
+    assert store.append(['new.txt'], ['新的文档']) == [50]
+    assert store.delete(['3.txt', 'missing.txt']) == ['missing.txt']
+    for store in (store, MySearch.DocStore(path)):
+        assert len(store) == 51 and store.get(3) is None and store.get_by_name('3.txt') is None
+        assert store.get_by_name('new.txt') == '新的文档'
+        assert [store.get(doc_id) for doc_id in range(51) if doc_id != 3] == texts[:3] + texts[4:] + ['新的文档']
+    store.compact()
+    store = MySearch.DocStore(path)
+    assert store.meta['generation'] == 1
+    assert store.live_names() == ['%d.txt' % index for index in range(50) if index != 3] + ['new.txt']
+    assert store.get(49) == texts[49] and store.get(3) is None
+    store.rename(['doc%d' % doc_id for doc_id in store.live()])
+    assert MySearch.DocStore(path).get_by_name('doc49') == texts[49]
+    with pytest.raises(ValueError):
+        store.append(['bad\nname'], ['text'])
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_saved_corpus_is_a_doc_store(compress):
+    search = trained()
+    search.compress_documents = compress
+    search.SaveModel('packed', select='Y')
+    assert MySearch.DocStore.exists('packed_corpus')
+    assert MySearch.DocStore('packed_corpus').meta['compress'] == ('zlib' if compress else None)
+    new_search().DelDocument(['1.txt'], 'packed')
+    new_search().CompactCorpus('packed')
+    store = MySearch.DocStore('packed_corpus')
+    assert store.live_names() == ['%d.txt' % index for index in range(8) if index != 1]
+    loaded = new_search()
+    loaded.use_model('packed')
+    for query in QUERIES:
+        results = loaded.Query(query)
+        assert all(CORPUS.index(document['content']) == int(document['filename'][:-4]) for document in results)
+
+
+def test_simhash():
+    rng = np.random.RandomState(0)
+    signatures = rng.randint(0, 2 ** 63, 200, dtype=np.int64).astype(np.uint64)
+    index = MySearch.SimHashIndex(3, signatures)
+    near = int(signatures[10]) ^ (1 << 5) ^ (1 << 40)
+    far = int(signatures[10]) ^ sum(1 << bit for bit in range(0, 64, 6))
+    assert index.find(near) == 10 and index.find(far) is None
+    assert index.find_initial([near, far, int(signatures[7])]) == [10, None, 7]
+    index.add('added', far)
+    assert index.find(far ^ 1) == 'added'
+    duplicates = np.concatenate([signatures[:5], [signatures[2] ^ np.uint64(3)]])
+    assert MySearch.SimHashIndex(3).find_duplicates(duplicates) == [(5, 2)]
+    assert MySearch._popcount(np.array([0, 1, 2 ** 64 - 1], dtype=np.uint64)).tolist() == [0, 1, 64]
+
+    search = new_search()
+    search.Train(CORPUS + [CORPUS[0]], 'e')
+    counts = search.segments[0].counts
+    simhash = MySearch._simhash(counts, search.segments[0].get_terms())
+    assert simhash[0] == simhash[len(CORPUS)] and simhash[0] != simhash[1]
@@ -0,0 +1,290 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import MySearch
+from conftest import CORPUS, QUERIES, copy_fixture, new_search, ranked, saved, scores_by_content, trained
+
+
+def test_save_and_use_model():
+    search = saved('rt')
+    with open('rt_model/meta.json') as f:
+        assert json.load(f)['version'] == MySearch.MODEL_VERSION
+    loaded = new_search()
+    loaded.use_model('rt')
+    for query in QUERIES:
+        expected = search.Query(query)
+        assert ranked(loaded.Query(query)) == ranked(expected)
+        assert scores_by_content(new_search().Query(query, 'rt')) == scores_by_content(expected)
+
+
+def test_load_text_model():
+    copy_fixture('v0')
+    search = new_search()
+    search.use_model('v0')
+    expected = trained()
+    # v0的模型不记录文件名，文档按os.listdir()的顺序对应（Windows上按文件名排序），只比较序号和得分
+    for query in QUERIES:
+        assert ranked(search.Query(query)) == ranked(expected.Query(query))
+
+
+def test_text_model_is_migrated():
+    copy_fixture('v0')
+    search = new_search()
+    search.use_model('v0')
+    search.SaveModel(select='Y')
+    with open('v0_model/meta.json') as f:
+        assert json.load(f)['version'] == MySearch.MODEL_VERSION
+    loaded = new_search()
+    loaded.use_model('v0')
+    for query in QUERIES:
+        results, expected = loaded.Query(query), search.Query(query)
+        assert [document['index'] for document in results] == [document['index'] for document in expected]
+        # 文本模型的tf-idf权重保存为float32
+        np.testing.assert_allclose([document['score'] for document in results],
+                                   [document['score'] for document in expected], rtol=1e-6)
+
+
+def test_add_corpus_to_text_model():
+    copy_fixture('v0')
+    added = ['quick brown rabbits', 'search the brown engines']
+    assert trained(added).AddCorpus('v0')
+    with open('v0_model/meta.json') as f:
+        assert json.load(f)['version'] == MySearch.MODEL_VERSION
+    loaded = new_search()
+    loaded.use_model('v0')
+    expected = trained(CORPUS + added)
+    for query in QUERIES:
+        assert scores_by_content(loaded.Query(query)) == scores_by_content(expected.Query(query))
+
+
+@pytest.mark.parametrize('change', [{'version': MySearch.MODEL_VERSION + 1}, {'version': None}, {'format': 'other'}])
+def test_unsupported_model_format(change):
+    saved('future')
+    with open('future_model/meta.json') as f:
+        meta = json.load(f)
+    meta.update(change)
+    with open('future_model/meta.json', 'w') as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError, match='unsupported model format'):
+        new_search().use_model('future')
+
+
+def test_add_corpus_matches_full_training():
+    saved('inc', CORPUS[:5])
+    assert trained(CORPUS[5:]).AddCorpus('inc')
+    loaded = new_search()
+    loaded.use_model('inc')
+    assert len(loaded.segments) == 2
+    full = trained()
+    for query in QUERIES:
+        assert scores_by_content(loaded.Query(query)) == scores_by_content(full.Query(query))
+
+
+def test_del_document_and_compact():
+    saved('del')
+    search = new_search()
+    assert search.DelDocument(['1.txt', '3.txt'], 'del')
+    expected = trained([text for index, text in enumerate(CORPUS) if index not in (1, 3)])
+    loaded = new_search()
+    loaded.use_model('del')
+    for query in QUERIES:
+        assert scores_by_content(loaded.Query(query)) == scores_by_content(expected.Query(query))
+
+    assert search.CompactCorpus('del')
+    loaded = new_search()
+    loaded.use_model('del')
+    assert len(loaded.segments) == 1 and not loaded.segments[0].deleted.any()
+    assert sorted(loaded.files) == ['0.txt', '2.txt', '4.txt', '5.txt', '6.txt', '7.txt']
+    for query in QUERIES:
+        assert scores_by_content(loaded.Query(query)) == scores_by_content(expected.Query(query))
+
+
+def test_compact_text_model_needs_training():
+    copy_fixture('v0')
+    with pytest.raises(ValueError):
+        new_search().CompactCorpus('v0')
+
+
+def test_merge_segments_keeps_scores():
+    saved('merge', CORPUS[:3])
+    for begin, end in ((3, 5), (5, 8)):
+        trained(CORPUS[begin:end]).AddCorpus('merge')
+    search = new_search()
+    search.merge_factor = 2
+    assert search.MergeSegments('merge')
+    search.use_model('merge')
+    assert len(search.segments) == 1
+    full = trained()
+    for query in QUERIES:
+        assert scores_by_content(search.Query(query)) == scores_by_content(full.Query(query))
+
+
+def test_background_merge():
+    saved('bg', CORPUS[:2])
+    for begin in range(2, 8, 2):
+        trained(CORPUS[begin:begin + 2]).AddCorpus('bg')
+    search = new_search()
+    search.merge_factor = 2
+    search.MergeSegments('bg', background=True).join()
+    search.use_model('bg')
+    assert len(search.segments) == 1
+    full = trained()
+    for query in QUERIES:
+        assert scores_by_content(search.Query(query)) == scores_by_content(full.Query(query))
+
+
+def test_train_with_workers():
+    # 切词的文档数超过chunksize时才用进程池
+    search = new_search()
+    search.Train(list(CORPUS) * 20, workers=2)
+    expected = new_search()
+    expected.Train(list(CORPUS) * 20)
+    for query in QUERIES:
+        assert ranked(search.Query(query)) == ranked(expected.Query(query))
+
+
+def test_stream_train():
+    os.mkdir('docs')
+    for index, text in enumerate(CORPUS):
+        with open('docs/%d.txt' % index, 'w', encoding='utf-8') as f:
+            f.write(text)
+    expected = new_search()
+    expected.Train('docs', 'e')
+    search = new_search()
+    search.Train('docs', 'e', stream=True)
+    assert not search.corpus
+    texts = new_search()
+    texts.Train((text for text in CORPUS), 'e', stream=True)
+    for query in QUERIES:
+        assert search.Query(query) == expected.Query(query)
+        assert ranked(texts.Query(query)) == ranked(trained().Query(query))
+    search.SaveModel('stream', select='Y')
+    assert scores_by_content(new_search().Query('brown', 'stream')) == scores_by_content(expected.Query('brown'))
+
+
+def test_query_process_imports_no_segmenter():
+    saved('lazy')
+    script = ("import sys, MySearch\n"
+              "search = MySearch.MySearch('e')\n"
+              "search.use_model('lazy')\n"
+              "search.Query('quick fox')\n"
+              "print(sorted(name for name in ('jieba', 'pkuseg', 'sklearn') if name in sys.modules))\n")
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+                                        + [path for path in [env.get('PYTHONPATH')] if path])
+    output = subprocess.run([sys.executable, '-c', script], env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    assert output.strip().splitlines()[-1] == '[]'
+
+
+def test_dedup():
+    search = new_search()
+    search.dedup = True
+    search.Train(CORPUS + [CORPUS[0]], 'e')
+    assert search.duplicates == [(8, 0)]
+    assert [document['index'] for document in search.Query('quick brown')] == [1, 4, 0]
+    search.SaveModel('dedup', select='Y')
+
+    added = new_search()
+    added.dedup = True
+    added.Train([CORPUS[1], 'brand new words here', 'brand new words here'], 'e')
+    assert added.duplicates == [(2, 1)]
+    assert added.AddCorpus('dedup')
+    assert added.duplicates == [('0.txt', '1.txt')]
+    loaded = new_search()
+    loaded.use_model('dedup')
+    assert [document['content'] for document in loaded.Query('brand')] == ['brand new words here']
+    assert len(loaded.Query('outpaces')) == 1
+
+
+def test_interrupted_save_keeps_old_model():
+    saved('crash')
+    # 模拟__write_model()在替换模型文件夹的中途退出：旧模型已改名为.old，新模型还没有改名
+    os.rename('crash_model', 'crash_model.old')
+    search = new_search()
+    search.use_model('crash')
+    assert not os.path.exists('crash_model.old')
+    assert scores_by_content(search.Query('quick fox')) == scores_by_content(trained().Query('quick fox'))
+
+
+def test_recovery_waits_for_the_writer():
+    saved('crash')
+    os.rename('crash_model', 'crash_model.old')
+    held, release = threading.Event(), threading.Event()
+
+    def writer():
+        with MySearch._model_lock('crash_model'):
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    assert held.wait(5)
+    loader = threading.Thread(target=lambda: new_search().use_model('crash'))
+    loader.start()
+    time.sleep(0.2)
+    # 写模型的一方持有锁时不恢复.old，以免和正在换入的新模型冲突
+    assert os.path.exists('crash_model.old') and not os.path.exists('crash_model')
+    release.set()
+    thread.join()
+    loader.join()
+    assert os.path.exists('crash_model') and not os.path.exists('crash_model.old')
+
+
+def test_save_over_a_saved_model_keeps_it_in_place(monkeypatch):
+    saved('swap')
+    save = MySearch.IndexSegment.save
+    seen = []
+
+    def checking_save(segment, path):
+        seen.append(os.path.isfile('swap_model/meta.json') and not os.path.exists('swap_model.old'))
+        return save(segment, path)
+
+    monkeypatch.setattr(MySearch.IndexSegment, 'save', checking_save)
+    search = saved('swap', CORPUS[:4])
+    assert seen and all(seen)
+    assert not [name for name in os.listdir('.') if name.startswith('swap_model.')]
+    loaded = new_search()
+    loaded.use_model('swap')
+    for query in QUERIES:
+        assert scores_by_content(loaded.Query(query)) == scores_by_content(search.Query(query))
+
+
+def test_failed_save_keeps_the_saved_model(monkeypatch):
+    saved('fail')
+    with open('fail_model/meta.json') as f:
+        meta = f.read()
+
+    def broken_save(segment, path):
+        raise OSError('disk full')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(MySearch.IndexSegment, 'save', broken_save)
+        with pytest.raises(OSError, match='disk full'):
+            trained(CORPUS[:4]).SaveModel('fail', select='Y')
+    assert os.path.isdir('fail_corpus')
+    with open('fail_model/meta.json') as f:
+        assert f.read() == meta
+    search = saved('fail', CORPUS[:4])
+    loaded = new_search()
+    loaded.use_model('fail')
+    assert scores_by_content(loaded.Query('quick fox')) == scores_by_content(search.Query('quick fox'))
+
+
+@pytest.mark.parametrize('scorer', ['bm25', 'bm25+'])
+def test_explicit_scorer_on_saved_corpus(scorer):
+    saved('scorer')
+    expected = trained(scorer=scorer)
+    loaded = new_search(scorer=scorer)
+    loaded.use_model('scorer')
+    assert loaded.scorer == MySearch.Scorer.create(scorer)
+    for query in QUERIES:
+        assert scores_by_content(loaded.Query(query)) == scores_by_content(expected.Query(query))
+        assert scores_by_content(new_search(scorer=scorer).Query(query, 'scorer', top_k=3)) == \
+               scores_by_content(expected.Query(query, top_k=3))
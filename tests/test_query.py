@@ -0,0 +1,178 @@
+import pytest
+
+import MySearch
+from conftest import CORPUS, new_search, random_corpus, ranked, saved, trained
+
+
+def test_paging_and_lazy_content():
+    search = saved('page')
+    full = search.Query('quick brown lazy dog')
+    assert len(full) > 3
+    for offset in range(len(full)):
+        page = search.Query('quick brown lazy dog', 'page', top_k=2, offset=offset, content=False)
+        assert ranked(page) == ranked(full[offset:offset + 2])
+        assert all('content' not in document for document in page)
+        for document in page:
+            assert search.GetDocument(document['index'], 'page') == CORPUS[document['index']]
+            assert document['filename'] == '%d.txt' % document['index']
+
+
+def test_snippet():
+    search = trained([CORPUS[2] + ' ' + 'padding ' * 20 + 'Quick words'] + CORPUS[3:5])
+    search.highlight = ('[', ']')
+    document = search.Query('quick', snippet=20, content=False)[0]
+    assert 'content' not in document
+    assert document['snippet'].startswith('...') and '[Quick]' in document['snippet']
+    assert len(document['snippet']) <= 20 + len('...[]')
+    assert trained().Query('brown', snippet=200)[0]['snippet'] == CORPUS[4].replace('brown', '<em>brown</em>')
+
+
+def test_lru_cache():
+    cache = MySearch.LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('c') == 3
+    assert cache.info() == (2, 1, 2)
+    MySearch.LRUCache(0).put('a', 1)
+    assert not MySearch.LRUCache(0).items
+
+
+def test_result_cache():
+    search = trained()
+    first = search.Query('quick fox')
+    assert search.Query('quick fox') == first
+    assert search.CacheInfo()['result'][0] == 1
+    assert search.CacheInfo()['query'][0] == 1
+    # 重新训练后结果缓存失效
+    search.Train(CORPUS[:4], 'e')
+    assert ranked(search.Query('quick fox')) == ranked(trained(CORPUS[:4]).Query('quick fox'))
+    # 停用词变化后切词缓存失效
+    search.add_stopwords(['fox'])
+    assert ranked(search.Query('quick fox')) == ranked(search.Query('quick'))
+
+
+def test_saved_corpus_result_cache_after_add_corpus():
+    saved('cached', CORPUS[:4])
+    searcher = MySearch.MySearch('e')
+    searcher.Query('brown', 'cached')
+    trained(CORPUS[4:]).AddCorpus('cached')
+    assert ranked(searcher.Query('brown', 'cached')) == ranked(trained().Query('brown'))
+
+
+def matched(results):
+    return sorted(document['index'] for document in results)
+
+
+def test_phrase_queries():
+    search = MySearch.MySearch('e')
+    search.Train(list(CORPUS), 'e', positions=True)
+    search.SaveModel('phrase', select='Y')
+    loaded = MySearch.MySearch('e')
+    loaded.use_model('phrase')
+    for search in (search, loaded):
+        assert matched(search.Query('"quick brown"')) == [0, 1]
+        assert search.Query('"brown quick"') == []
+        assert matched(search.Query('"quick fox"')) == [1]
+        assert matched(search.Query('"quick fox"~1')) == [0, 1]
+        # 短语只过滤文档，得分同普通查询
+        plain = dict(ranked(search.Query('brown fox quick')))
+        assert ranked(search.Query('"brown fox" quick')) == [(0, plain[0])]
+
+
+def test_phrase_offsets_count_dropped_words():
+    search = new_search()
+    search.Train(list(CORPUS), 'e', positions=True)
+    # 'a'只有一个字符，不进入词表，但占位置：outpaces a quick
+    assert search.Query('"outpaces quick"') == []
+    assert matched(search.Query('"outpaces quick"~1')) == [1]
+
+
+def test_phrase_without_positions_matches_terms():
+    search = saved('plain')
+    loaded = new_search()
+    loaded.use_model('plain')
+    for search in (search, loaded):
+        assert ranked(search.Query('"quick fox"')) == ranked(search.Query('quick fox'))
+        # 短语不再是必须满足的条件，与其余的查询词一样只影响得分
+        assert ranked(search.Query('"quick fox" happy')) == ranked(search.Query('quick fox happy'))
+        assert ranked(search.Query('lazy "quick fox"~2 happy')) == ranked(search.Query('lazy quick fox happy'))
+        assert 5 in matched(search.Query('"quick fox" happy'))
+        # 布尔查询的条件不变，短语中的词出现任意一个即可
+        assert matched(search.Query('"quick fox" AND happy', boolean=True)) == []
+
+
+def test_boolean_queries():
+    search = trained()
+    # 缺省时NOT只是普通的查询词（文档7中有not）
+    assert matched(search.Query('brown NOT dog')) == [0, 1, 4, 7]
+    assert matched(search.Query('brown NOT dog', boolean=True)) == [4]
+    assert matched(search.Query('fox OR cat', boolean=True)) == [0, 1, 3]
+    assert matched(search.Query('(quick OR lazy) AND dog', boolean=True)) == [0, 1]
+    # 布尔查询只过滤文档，得分同普通查询
+    assert ranked(search.Query('brown AND bread', boolean=True)) == ranked(search.Query('brown bread'))[:1]
+
+
+@pytest.mark.parametrize('save', [False, True])
+def test_boolean_matches_sets(save):
+    corpus = random_corpus()
+    search = trained(corpus)
+    if save:
+        search.SaveModel('boolean', select='Y')
+        search = MySearch.MySearch('e')
+        search.use_model('boolean')
+    postings = {}
+    for index, text in enumerate(corpus):
+        for word in text.split():
+            postings.setdefault(word, set()).add(index)
+    for a, b in (('w0', 'w1'), ('w1', 'w7'), ('w3', 'w40'), ('w9', 'w120')):
+        assert matched(search.Query('%s AND %s' % (a, b), boolean=True)) == sorted(postings[a] & postings[b])
+        assert matched(search.Query('%s NOT %s' % (a, b), boolean=True)) == sorted(postings[a] - postings[b])
+        assert matched(search.Query('%s OR %s' % (a, b), boolean=True)) == sorted(postings[a] | postings[b])
+
+
+def test_query_stats():
+    saved('stats')
+    traces = []
+    search = MySearch.MySearch('e')
+    search.stats = MySearch.QueryStats(hook=traces.append)
+    for _ in range(2):
+        results = search.Query('quick fox', 'stats', top_k=2)
+    assert ranked(results) == ranked(trained().Query('quick fox', top_k=2))
+    assert len(traces) == 2 and search.stats.last is traces[-1]
+    first, second = traces
+    assert first.corpus_name == 'stats' and first.query == 'quick fox'
+    assert {'parse', 'load', 'score', 'sort', 'show'} <= set(first.times)
+    assert first.counters['postings'] == 4 and first.counters['files_read'] == 2
+    assert first.counters['result_cache_misses'] == 1 and second.counters['result_cache_hits'] == 1
+    assert second.counters['model_cache_hits'] == 1
+    assert first.total >= sum(first.times.values()) - 1e-6
+    summary = search.stats.summary()
+    assert summary['queries'] == 2 and summary['counters']['files_read'] == 4
+    assert summary['mean']['total'] == summary['total'] / 2
+    assert first.to_dict()['counters'] == first.counters
+    search.stats.clear()
+    assert search.stats.summary()['queries'] == 0
+
+
+def test_query_trace_stages():
+    trace = MySearch.QueryTrace('q')
+    t_begin = trace.stage('a', trace.stage('a', 0.0))
+    trace.count('n')
+    trace.count('n', 2)
+    assert t_begin > 0 and trace.times['a'] > 0 and trace.counters == {'n': 3}
+
+
+def test_collapse():
+    search = new_search()
+    search.Train(CORPUS + [CORPUS[0]], 'e')
+    assert [document['index'] for document in search.Query('quick brown')] == [1, 4, 0, 8]
+    results = search.Query('quick brown', collapse=True)
+    assert [(document['index'], document['duplicates']) for document in results] == [(1, []), (4, []), (0, [8])]
+    assert [document['index'] for document in search.Query('quick brown', collapse=True, top_k=1, offset=1)] == [4]
+    search.SaveModel('collapse', select='Y')
+    loaded = new_search()
+    loaded.use_model('collapse')
+    assert [(document['index'], document['duplicates']) for document in loaded.Query('quick brown', collapse=True)] == \
+           [(document['index'], document['duplicates']) for document in results]
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+import MySearch
+from conftest import (CORPUS, QUERIES, new_search, random_corpus, random_queries, ranked, saved, scores_by_content,
+                      trained)
+
+SCORERS = ['tfidf', 'bm25', 'bm25+']
+
+
+def test_tfidf_matches_sklearn():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer()
+    weights = vectorizer.fit_transform(CORPUS).toarray()
+    search = trained()
+    for query in QUERIES:
+        words = query.split()
+        expected = sum(weights[:, vectorizer.vocabulary_[word]] * words.count(word) for word in set(words))
+        scores = np.zeros(len(CORPUS))
+        for document in search.Query(query):
+            scores[document['index']] = document['score']
+        np.testing.assert_allclose(scores, expected, atol=1e-12)
+
+
+@pytest.mark.parametrize('scorer,delta', [('bm25', 0.0), ('bm25+', 1.0)])
+def test_bm25_matches_reference(scorer, delta):
+    from sklearn.feature_extraction.text import CountVectorizer
+    vectorizer = CountVectorizer()
+    tf = vectorizer.fit_transform(CORPUS).toarray().astype(np.float64)
+    k1, b = 1.2, 0.75
+    df = (tf > 0).sum(axis=0)
+    idf = np.log(1 + (len(CORPUS) - df + 0.5) / (df + 0.5))
+    lengths = tf.sum(axis=1, keepdims=True)
+    weights = np.where(tf > 0, tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths / lengths.mean())) + delta, 0) * idf
+    search = trained(scorer=scorer)
+    for query in QUERIES:
+        words = query.split()
+        expected = sum(weights[:, vectorizer.vocabulary_[word]] * words.count(word) for word in set(words))
+        scores = np.zeros(len(CORPUS))
+        for document in search.Query(query):
+            scores[document['index']] = document['score']
+        np.testing.assert_allclose(scores, expected, atol=1e-12)
+
+
+@pytest.mark.parametrize('scorer', SCORERS)
+def test_saved_model_keeps_scorer(scorer):
+    search = saved('scorer', scorer=scorer)
+    loaded = new_search()
+    loaded.use_model('scorer')
+    assert loaded.scorer == MySearch.Scorer.create(scorer)
+    for query in QUERIES:
+        assert scores_by_content(loaded.Query(query)) == scores_by_content(search.Query(query))
+        assert scores_by_content(new_search().Query(query, 'scorer')) == scores_by_content(search.Query(query))
+
+
+def test_top_k_is_a_prefix_of_the_full_ranking():
+    search = trained(random_corpus(200))
+    for query_list in random_queries(20):
+        query = ' '.join(query_list)
+        full = search.Query(query)
+        for top_k in (0, 1, 5, len(full) + 1):
+            results = search.Query(query, top_k=top_k)
+            assert [round(d['score'], 9) for d in results] == [round(d['score'], 9) for d in full[:top_k]]
+
+
+@pytest.mark.parametrize('scorer', SCORERS)
+def test_query_batch_matches_query(scorer):
+    search = trained(random_corpus(200), scorer=scorer)
+    queries = [' '.join(query_list) for query_list in random_queries(20)] + ['', 'missing words']
+    results = search.QueryBatch(queries, top_k=5, batch_size=7)
+    assert len(results) == len(queries)
+    for query, (documents, scores) in zip(queries, results):
+        expected = search.Query(query, top_k=5) if query else []
+        np.testing.assert_allclose(scores, [document['score'] for document in expected], rtol=1e-9)
+
+
+def test_query_batch_on_saved_corpus():
+    search = saved('batch')
+    queries = list(QUERIES)
+    for query, (documents, scores) in zip(queries, search.QueryBatch(queries, 'batch', top_k=None)):
+        assert ranked(search.Query(query)) == list(zip(documents.tolist(), np.round(scores, 9).tolist()))
+
+
+def test_sharded_scores_match_unsharded():
+    corpus = random_corpus(120)
+    search = trained(corpus)
+    search.SaveModel('sharded', select='Y', shards=3)
+    sharded = MySearch.ShardedSearch('sharded', seg='e')
+    assert len(sharded.shards) == 3
+    for query_list in random_queries(10):
+        query = ' '.join(query_list)
+        expected = search.Query(query, top_k=7)
+        results = sharded.Query(query, top_k=5, offset=2)
+        assert [round(d['score'], 9) for d in results] == [round(d['score'], 9) for d in expected[2:]]
+        full = scores_by_content(search.Query(query))
+        assert all(full[d['content']] == round(d['score'], 9) for d in results)
+
+
+@pytest.mark.parametrize('save', [False, True])
+@pytest.mark.parametrize('scorer', SCORERS)
+def test_pruning_matches_exhaustive(scorer, save):
+    search = trained(random_corpus(), scorer=scorer)
+    if save:
+        search.SaveModel('pruning', select='Y')
+        search = new_search(scorer=scorer)
+        search.use_model('pruning')
+    for query_list in random_queries():
+        search.pruning = False
+        exhaustive_docs, exhaustive = search.QueryTokens(query_list)
+        full = dict(zip(exhaustive_docs.tolist(), exhaustive.tolist()))
+        for top_k in (1, 10):
+            search.pruning = True
+            documents, scores = search.QueryTokens(query_list, top_k)
+            np.testing.assert_allclose(scores, exhaustive[:top_k], rtol=1e-9)
+            np.testing.assert_allclose(scores, [full[document] for document in documents.tolist()], rtol=1e-9)
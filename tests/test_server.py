@@ -0,0 +1,166 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import MySearch
+from conftest import QUERIES, saved
+
+
+async def request(port, method, target, body=None, headers=''):
+    payload = b'' if body is None else body if type(body) == bytes else json.dumps(body).encode('utf-8')
+    return await send(port, ('%s %s HTTP/1.1\r\nHost: test\r\nConnection: close\r\n%sContent-Length: %d\r\n\r\n'
+                             % (method, target, headers, len(payload))).encode('latin-1') + payload)
+
+
+async def send(port, data):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(data)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ')[1]), json.loads(body.decode('utf-8'))
+
+
+def serve(server, client):
+    '''
+    在事件循环中启动server（随机端口），运行client(port)后关闭
+    '''
+    async def main():
+        task = asyncio.ensure_future(server.serve())
+        while server.server is None or not server.server.sockets:
+            await asyncio.sleep(0.01)
+        try:
+            return await client(server.server.sockets[0].getsockname()[1])
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    return asyncio.run(main())
+
+
+def test_query_server():
+    search = saved('srv')
+    expected = search.Query('quick fox', top_k=2, content=False)
+
+    async def client(port):
+        assert await request(port, 'GET', '/query?q=quick+fox&top_k=2&content=0') == (200, {'results': expected})
+        assert await request(port, 'POST', '/query', {'q': 'quick fox', 'top_k': 2, 'content': False}) == \
+               (200, {'results': expected})
+        status, res = await request(port, 'GET', '/query?q=brown&snippet=10&corpus=srv_corpus')
+        assert status == 200 and all('snippet' in document for document in res['results'])
+        assert (await request(port, 'GET', '/query'))[0] == 400
+        assert (await request(port, 'GET', '/query?q=brown&top_k=x'))[0] == 400
+        assert (await request(port, 'GET', '/query?q=brown&corpus=other'))[0] == 400
+        assert (await request(port, 'POST', '/query', b'{bad'))[0] == 400
+        assert (await request(port, 'POST', '/query', ['brown']))[0] == 400
+        assert (await send(port, b'POST /query HTTP/1.1\r\nContent-Length: x\r\n\r\n'))[0] == 400
+        assert (await request(port, 'DELETE', '/query?q=brown'))[0] == 405
+        assert (await request(port, 'GET', '/missing'))[0] == 404
+        return await request(port, 'GET', '/stats')
+
+    status, stats = serve(MySearch.QueryServer('srv', seg='e', port=0), client)
+    assert status == 200 and stats['served'] == 3 and stats['pending'] == 0
+
+
+def test_query_server_rejects_bad_requests():
+    saved('srv')
+    server = MySearch.QueryServer('srv', seg='e', port=0, max_body=64)
+
+    async def client(port):
+        statuses = []
+        for body in ({'q': ['brown']}, {'q': 1}, {'q': {'a': 1}}, {'q': 'brown', 'corpus': ['srv']}):
+            statuses.append((await request(port, 'POST', '/query', body))[0])
+        for target in ('/query?q=brown&top_k=-1', '/query?q=brown&offset=-2', '/query?q=brown&snippet=-1'):
+            statuses.append((await request(port, 'GET', target))[0])
+        assert statuses == [400] * 7
+        assert (await request(port, 'POST', '/query', {'q': 'brown ' * 20}))[0] == 413
+        assert (await request(port, 'POST', '/query', {'q': 'brown'}))[0] == 200
+        return await request(port, 'GET', '/stats')
+
+    status, stats = serve(server, client)
+    assert stats['served'] == 1 and stats['pending'] == 0
+
+
+def test_query_server_boolean():
+    search = saved('srv')
+
+    async def client(port):
+        return [[document['index'] for document in (await request(port, 'GET', target))[1]['results']]
+                for target in ('/query?q=brown+NOT+dog&top_k=10', '/query?q=brown+NOT+dog&top_k=10&boolean=1')]
+
+    plain, boolean = serve(MySearch.QueryServer('srv', seg='e', port=0), client)
+    assert plain == [document['index'] for document in search.Query('brown NOT dog')]
+    assert boolean == [4]
+
+
+def test_query_server_timeout_and_backpressure(monkeypatch):
+    saved('srv')
+    monkeypatch.setattr(MySearch.QueryPool, '_worker_query', staticmethod(lambda *args: time.sleep(0.5) or []))
+    server = MySearch.QueryServer('srv', seg='e', port=0, timeout=0.2, max_pending=1)
+
+    async def client(port):
+        slow = asyncio.ensure_future(request(port, 'GET', '/query?q=brown'))
+        while not server.pending:
+            await asyncio.sleep(0.01)
+        assert (await request(port, 'GET', '/query?q=brown'))[0] == 503
+        assert (await slow)[0] == 504
+        # 超时的查询仍在工作池中执行，执行完之前一直占着排队数
+        assert server.pending == 1
+        assert (await request(port, 'GET', '/query?q=brown'))[0] == 503
+        for _ in range(100):
+            if not server.pending:
+                break
+            await asyncio.sleep(0.02)
+        assert server.pending == 0
+
+    serve(server, client)
+    assert server.timeouts == 1 and server.rejected == 2
+    with pytest.raises(ValueError):
+        asyncio.run(server.query('brown', 'other'))
+
+
+def test_query_server_internal_error(monkeypatch):
+    saved('srv')
+
+    def fail(*args):
+        raise ValueError('secret detail')
+
+    monkeypatch.setattr(MySearch.QueryPool, '_worker_query', staticmethod(fail))
+    server = MySearch.QueryServer('srv', seg='e', port=0)
+
+    async def client(port):
+        return await request(port, 'GET', '/query?q=brown')
+
+    status, res = serve(server, client)
+    assert status == 500 and res == {'error': 'internal error'}
+    assert server.pending == 0
+
+
+def worker_state(corpus_name):
+    return os.getpid(), MySearch.model_cache.misses, id(MySearch.model_cache.get(corpus_name, 'e'))
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_query_pool_shares_loaded_model():
+    search = saved('pool')
+    pool = MySearch.QueryPool('pool', seg='e', workers=2)
+    try:
+        misses = MySearch.model_cache.misses
+        parent = id(MySearch.model_cache.get('pool', 'e'))
+        for query in QUERIES:
+            assert pool.query(query, top_k=3) == search.Query(query, top_k=3)
+        assert pool.query_many(QUERIES, top_k=None, content=False, chunksize=2) == \
+               [search.Query(query, content=False) for query in QUERIES]
+        # fork出的进程直接使用本进程加载的模型，不再各自加载
+        for pid, worker_misses, model in [pool.executor.submit(worker_state, 'pool').result() for _ in range(4)]:
+            assert pid != os.getpid() and worker_misses == misses and model == parent
+        with pytest.raises(ValueError):
+            pool.submit('brown', 'other')
+    finally:
+        pool.close()
@@ -0,0 +1,77 @@
+import pytest
+
+import MySearch
+from conftest import CORPUS, QUERIES, new_search, ranked, trained
+
+
+class CountingTokenizer(MySearch.Tokenizer):
+    '''
+    按空格切分并记录segment()的调用次数，signature不为None，切词结果可以缓存
+    '''
+    name = 'counting'
+    calls = 0
+
+    def __init__(self, stopwords=(), version=1):
+        MySearch.Tokenizer.__init__(self, stopwords)
+        self.version = version
+
+    def signature(self):
+        return 'counting:%d' % self.version
+
+    def segment(self, text):
+        CountingTokenizer.calls += 1
+        return text.split(' ')
+
+    def filter(self, units):
+        return [word for word in units if word not in self.stopwords]
+
+
+def tokenized(tokenizer, cache=None):
+    search = new_search()
+    search.tokenizer = tokenizer
+    search.segment_cache = cache
+    search.Train(list(CORPUS))
+    return search
+
+
+def test_custom_tokenizer():
+    search = tokenized(CountingTokenizer())
+    expected = trained()
+    for query in QUERIES:
+        assert ranked(search.Query(query)) == ranked(expected.Query(query))
+    assert search.CutQuery('The Quick a fox') == ['the', 'quick', 'fox']
+
+
+def test_segment_cache(tmp_path):
+    path = str(tmp_path / 'segments')
+    CountingTokenizer.calls = 0
+    first = tokenized(CountingTokenizer(), path)
+    assert CountingTokenizer.calls == len(CORPUS)
+    assert first.segment_cache.info() == (0, len(CORPUS), len(CORPUS))
+
+    # 内容和分词器相同的文档不再切词，停用词在切词之后才去掉
+    CountingTokenizer.calls = 0
+    search = tokenized(CountingTokenizer(['fox']), path)
+    assert CountingTokenizer.calls == 0
+    assert search.segment_cache.info()[0] == len(CORPUS)
+    assert search.Query('fox') == []
+    uncached = tokenized(CountingTokenizer(['fox']))
+    for query in QUERIES:
+        assert ranked(search.Query(query)) == ranked(uncached.Query(query))
+
+    # 分词器的签名改变后缓存失效
+    CountingTokenizer.calls = 0
+    tokenized(CountingTokenizer(version=2), path)
+    assert CountingTokenizer.calls == len(CORPUS)
+    search.segment_cache.clear()
+    assert search.segment_cache.info()[2] == 0
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-8-sig', 'gbk'])
+def test_stop_words_encoding(encoding):
+    # 自带的stop_words.txt为gbk，读取时不依赖系统的默认编码
+    with open('stop_words.txt', 'w', encoding=encoding) as f:
+        f.write('的\r\nquick\r\n')
+    search = new_search()
+    assert '的' in search.stopwords and 'quick' in search.stopwords
+    assert search.CutQuery('the quick fox') == ['the', 'fox']